@@ -7,22 +7,20 @@ import datetime
 import json
 import logging
 import os
-import shutil
 import sys
 import time
 import traceback
 
 import ffmpeg
-import pypinyin
-from BilibiliDownloader.core import nfo_generator
 from bilibili_api import video, user, exceptions, ass
 from lxml import etree
 from mbot.openapi import mbot_api
 
 from . import process_pages_video
+from .core import nfo_generator, library_index, metadata_archive, legacy_error_video
 from .mr import mr_api
 # from .constant import SERVER_URL, ACCESS_KEY
-from .utils import global_value
+from .utils import global_value, sort_title, fs
 
 _LOGGER = logging.getLogger(__name__)
 # _LOGGER = loguru.logger
@@ -82,11 +80,14 @@ class BilibiliProcess:
             f"收到视频处理请求：bvid： {video_id}，媒体路径： {media_path}， 是否获取角色信息： {if_get_character}， emby人物路径： {emby_persons_path}"
         )
 
-    async def get_video_info(self):
-        """获取视频信息"""
+    async def get_video_info(self, video_info=None):
+        """获取视频信息
+
+        :param video_info: 已经获取过的视频信息，传入后不再重复请求
+        """
         v = video.Video(bvid=self.video_id, credential=self.credential)
         try:
-            self.video_info = await v.get_info()
+            self.video_info = video_info if video_info is not None else await v.get_info()
             self.video_info["title"] = self.video_info["title"].replace("/", " ")
             self.title = f"「{self.video_info['title']}」"
             raw_year = time.strftime("%Y", time.localtime(self.video_info["pubdate"]))
@@ -101,8 +102,7 @@ class BilibiliProcess:
         try:
             v = video.Video(bvid=self.video_id, credential=self.credential)
             raw_year = time.strftime("%Y", time.localtime(self.video_info["pubdate"]))
-            if not os.path.exists(f"{self.video_path}"):
-                os.makedirs(f"{self.video_path}", exist_ok=True)
+            await fs.makedirs(f"{self.video_path}")
             _LOGGER.info(f"开始下载 {self.title} 音视频到临时文件夹")
             path = f"{self.video_path}/video_temp.m4s"
             url = await v.get_download_url(0)
@@ -126,15 +126,20 @@ class BilibiliProcess:
                 return
             in_video = ffmpeg.input(f"{self.video_path}/video_temp.m4s")
             in_audio = ffmpeg.input(f"{self.video_path}/audio_temp.m4s")
-            ffmpeg.output(
-                in_video,
-                in_audio,
-                f'{self.video_path}/{self.video_info["title"]} ({raw_year}).mp4',
-                vcodec="copy",
-                acodec="copy",
-            ).run(overwrite_output=True)
-            os.remove(f"{self.video_path}/video_temp.m4s")
-            os.remove(f"{self.video_path}/audio_temp.m4s")
+            await asyncio.to_thread(
+                ffmpeg.output(
+                    in_video,
+                    in_audio,
+                    f'{self.video_path}/{self.video_info["title"]} ({raw_year}).mp4',
+                    vcodec="copy",
+                    acodec="copy",
+                ).run,
+                overwrite_output=True,
+            )
+            await fs.batch(
+                (os.remove, f"{self.video_path}/video_temp.m4s"),
+                (os.remove, f"{self.video_path}/audio_temp.m4s"),
+            )
             _LOGGER.info(
                 f"视频音频下载完成，已混流为mp4文件，文件名： 「{self.video_info['title']} ({raw_year}).mp4」"
             )
@@ -172,10 +177,9 @@ class BilibiliProcess:
                 return
             raw_year = time.strftime("%Y", time.localtime(self.video_info["pubdate"]))
             nfo = nfo_generator.NfoGenerator(self.video_info)
-            tree = nfo.gen_movie_nfo()
+            tree = await nfo.gen_movie_nfo()
             path = f"{self.video_path}/{self.video_info['title']} ({raw_year}).nfo"
-            nfo.save_nfo(tree, path)
-            tree.write(path, encoding="utf-8", pretty_print=True, xml_declaration=True)
+            await nfo.save_nfo(tree, path)
             _LOGGER.info(f"{self.title} 视频nfo文件生成完成")
         except Exception as e:
             _LOGGER.error(f"视频 {self.title} nfo文件生成失败，已记录视频id，稍后重试")
@@ -192,29 +196,23 @@ class BilibiliProcess:
             _LOGGER.info(f"开始生成 {self.title} 的up主nfo信息")
             video_info = self.video_info
             raw_year = time.strftime("%Y", time.localtime(video_info["pubdate"]))
-            os.makedirs(f"{self.video_path}/character", exist_ok=True)
+            await fs.makedirs(f"{self.video_path}/character")
             try:
                 for character in video_info["staff"]:
-                    os.makedirs(
-                        f"{self.video_path}/character/{character['name']}",
-                        exist_ok=True,
-                    )
+                    await fs.makedirs(f"{self.video_path}/character/{character['name']}")
                     root = etree.Element("person")
                     title = etree.SubElement(root, "title")
                     title.text = character["name"]
                     sorttitle = etree.SubElement(root, "sorttitle")
-                    sorttitle.text = "".join(
-                        pypinyin.lazy_pinyin(
-                            character["name"], style=pypinyin.Style.FIRST_LETTER
-                        )
-                    )
+                    sorttitle.text = await fs.run(sort_title.get_sort_title, character["name"])
                     mid = etree.SubElement(root, "bilibili_id")
                     mid.text = str(character["mid"])
                     type = etree.SubElement(root, "uniqueid", type="bilibili_id")
                     type.text = str(character["mid"])
                     tree = etree.ElementTree(root)
                     path = f"{self.video_path}/character/{character['name']}/person.nfo"
-                    tree.write(
+                    await fs.run(
+                        tree.write,
                         str(path),
                         encoding="utf-8",
                         pretty_print=True,
@@ -222,27 +220,20 @@ class BilibiliProcess:
                     )
                     _LOGGER.info(f"up主 「{character['name']}」 nfo信息生成完成")
             except KeyError:
-                os.makedirs(
-                    f"{self.video_path}/character/{video_info['owner']['name']}",
-                    exist_ok=True,
-                )
+                await fs.makedirs(f"{self.video_path}/character/{video_info['owner']['name']}")
                 root = etree.Element("person")
                 title = etree.SubElement(root, "title")
                 title.text = video_info["owner"]["name"]
                 sorttitle = etree.SubElement(root, "sorttitle")
-                sorttitle.text = "".join(
-                    pypinyin.lazy_pinyin(
-                        video_info["owner"]["name"], style=pypinyin.Style.FIRST_LETTER
-                    )
-                )
+                sorttitle.text = await fs.run(sort_title.get_sort_title, video_info["owner"]["name"])
                 mid = etree.SubElement(root, "bilibili_id")
                 mid.text = str(video_info["owner"]["mid"])
                 type = etree.SubElement(root, "uniqueid", type="bilibili_id")
                 type.text = str(video_info["owner"]["mid"])
                 tree = etree.ElementTree(root)
                 path = f"{self.video_path}/character/{video_info['owner']['name']}/person.nfo"
-                tree.write(
-                    str(path), encoding="utf-8", pretty_print=True, xml_declaration=True
+                await fs.run(
+                    tree.write, str(path), encoding="utf-8", pretty_print=True, xml_declaration=True
                 )
                 _LOGGER.info(f"up主 「{video_info['owner']['name']}」 nfo信息生成完成")
             _LOGGER.info(f"{self.title} 的up主nfo信息生成完成")
@@ -297,23 +288,21 @@ class BilibiliProcess:
             try:
                 for character in video_info["staff"]:
                     _LOGGER.info(f"开始移动up主{character['name']}")
-                    if not os.path.exists(
+                    if not await fs.exists(
                             f"{emby_persons_path}/{character['name'][0]}"
                     ):
-                        os.makedirs(
-                            f"{emby_persons_path}/{character['name'][0]}", exist_ok=True
-                        )
-                        shutil.move(
+                        await fs.makedirs(f"{emby_persons_path}/{character['name'][0]}")
+                        await fs.move(
                             f"{self.video_path}/character/{character['name']}",
                             f"{emby_persons_path}/{character['name'][0]}",
                         )
                         _LOGGER.info(
                             f"{self.video_path}/character/{character['name']} -> {emby_persons_path}/{character['name'][0]}"
                         )
-                    elif not os.path.exists(
+                    elif not await fs.exists(
                             f"{emby_persons_path}/{character['name'][0]}/{character['name']}"
                     ):
-                        shutil.move(
+                        await fs.move(
                             f"{self.video_path}/character/{character['name']}",
                             f"{emby_persons_path}/{character['name'][0]}",
                         )
@@ -324,24 +313,21 @@ class BilibiliProcess:
                         _LOGGER.info(f"up主 「{character['name']}」 数据已存在，跳过")
             except KeyError:
                 _LOGGER.info(f"开始移动up主 「{video_info['owner']['name']}」")
-                if not os.path.exists(
+                if not await fs.exists(
                         f"{emby_persons_path}/{video_info['owner']['name'][0]}"
                 ):
-                    os.makedirs(
-                        f"{emby_persons_path}/{video_info['owner']['name'][0]}",
-                        exist_ok=True,
-                    )
-                    shutil.move(
+                    await fs.makedirs(f"{emby_persons_path}/{video_info['owner']['name'][0]}")
+                    await fs.move(
                         f"{self.video_path}/character/{video_info['owner']['name']}",
                         f"{emby_persons_path}/{video_info['owner']['name'][0]}",
                     )
                     _LOGGER.info(
                         f"{self.video_path}/character/{video_info['owner']['name']} -> {emby_persons_path}/{video_info['owner']['name'][0]}"
                     )
-                elif not os.path.exists(
+                elif not await fs.exists(
                         f"{emby_persons_path}/{video_info['owner']['name'][0]}/{video_info['owner']['name']}"
                 ):
-                    shutil.move(
+                    await fs.move(
                         f"{self.video_path}/character/{video_info['owner']['name']}",
                         f"{emby_persons_path}/{video_info['owner']['name'][0]}",
                     )
@@ -351,7 +337,7 @@ class BilibiliProcess:
                 else:
                     _LOGGER.info(f"up主 「{video_info['owner']['name']}」 数据已存在，跳过")
             finally:
-                shutil.rmtree(f"{self.video_path}/character")
+                await fs.rmtree(f"{self.video_path}/character")
             _LOGGER.info("up主头像移动完成")
         except Exception as e:
             _LOGGER.error(f"{self.title} up主头像移动失败，已记录视频id，稍后重试")
@@ -369,25 +355,25 @@ class BilibiliProcess:
             video_info = self.video_info
             raw_year = time.strftime("%Y", time.localtime(video_info["pubdate"]))
             _LOGGER.info(f"开始移动视频文件夹到 「{emby_videos_path}」")
-            if not os.path.exists(
+            if not await fs.exists(
                     f"{emby_videos_path}/bilibili"
-            ) and not os.path.exists(
+            ) and not await fs.exists(
                 f"{emby_videos_path}/bilibili/{self.video_info['title']} ({raw_year})"
             ):
                 _LOGGER.info(f"{self.video_path} -> {emby_videos_path}/bilibili")
-                os.makedirs(f"{emby_videos_path}/bilibili", exist_ok=True)
-                shutil.move(f"{self.video_path}", f"{emby_videos_path}/bilibili")
-            elif os.path.exists(
+                await fs.makedirs(f"{emby_videos_path}/bilibili")
+                await fs.move(f"{self.video_path}", f"{emby_videos_path}/bilibili")
+            elif await fs.exists(
                     f"{emby_videos_path}/bilibili/{self.video_info['title']} ({raw_year})"
             ):
                 _LOGGER.warning(f"{self.video_path}已存在，覆盖掉")
-                shutil.rmtree(
+                await fs.rmtree(
                     f"{emby_videos_path}/bilibili/{self.video_info['title']} ({raw_year})"
                 )
-                shutil.move(f"{self.video_path}", f"{emby_videos_path}/bilibili")
+                await fs.move(f"{self.video_path}", f"{emby_videos_path}/bilibili")
             else:
                 _LOGGER.info(f"{self.video_path} -> {emby_videos_path}/bilibili")
-                shutil.move(f"{self.video_path}", f"{emby_videos_path}/bilibili")
+                await fs.move(f"{self.video_path}", f"{emby_videos_path}/bilibili")
             _LOGGER.info("视频文件夹移动完成")
         except Exception as e:
             _LOGGER.error(f"视频 {self.title} 文件夹移动失败，已记录视频id，稍后重试")
@@ -433,9 +419,6 @@ class BilibiliProcess:
 
     async def process(self):
         """运行入口函数"""
-        if not os.path.exists(f"{local_path}/error_video.txt"):
-            with open(f"{local_path}/error_video.txt", "w") as f:
-                pass
         if not global_value.get_value("cookie_is_valid"):
             _LOGGER.warning("还没登录bilibili账号，无法下载高分辨率视频，终止下载等待登录")
             return False
@@ -465,6 +448,11 @@ class BilibiliProcess:
         if await Utils.read_error_video(self.video_info):
             _LOGGER.info("该视频在失败重试列表，不再下载，等待自动重试")
             return True
+        index = library_index.get_library_index()
+        await fs.run(index.ensure_built, self.media_path)
+        if await fs.run(index.has, self.video_id):
+            _LOGGER.info(f"视频 {self.title} 已在媒体库中，跳过下载")
+            return True
         await self.download_video()
         await self.download_video_cover()
         await self.gen_video_nfo()
@@ -476,6 +464,15 @@ class BilibiliProcess:
         await self.move_video_folder()
         if await Utils.read_error_video(self.video_info):
             return True
+        raw_year = time.strftime("%Y", time.localtime(self.video_info["pubdate"]))
+        name = f"{self.video_info['title']} ({raw_year})"
+        path = f"{self.media_path}/bilibili/{name}"
+        await fs.run(
+            index.record,
+            self.video_id, 0, path, media=f"{path}/{name}.mp4", nfo=f"{path}/{name}.nfo", kind="movie",
+            artifacts=await fs.listdir(path) if await fs.exists(path) else [],
+        )
+        await fs.run(metadata_archive.save_video_info, self.video_id, self.video_info)
         _LOGGER.info(f"视频 {self.title} 下载刮削完成，请刷新emby媒体库")
         Notify(self.video_info).send_all_way()
         return True
@@ -497,45 +494,33 @@ class Utils:
         sys.stdout.write(r)
         sys.stdout.flush()
 
+    @staticmethod
+    async def _error_videos():
+        """进程内共用的失败视频记录，第一次使用时在文件线程池里读取error_video.txt"""
+        error_videos = legacy_error_video.get_legacy_error_videos(f"{local_path}/error_video.txt")
+        if not error_videos.loaded:
+            await fs.run(error_videos.load)
+        return error_videos
+
     @staticmethod
     async def write_error_video(video_info, page=0):
         """记录下载失败的视频"""
-        with open(f"{local_path}/error_video.txt", "a") as f:
-            f.write(f"{video_info['bvid']} P{str(page)}\n")
+        await fs.run((await Utils._error_videos()).add, video_info["bvid"], page)
 
     @staticmethod
     async def read_error_video(video_info, page=0):
-        """读取下载失败的视频"""
-        with open(f"{local_path}/error_video.txt", "r") as f:
-            error_video = f.readlines()
-            if error_video:
-                for i in error_video:
-                    if f"{video_info['bvid']} P{str(page)}\n" in i:
-                        return True
-                    else:
-                        return False
-            else:
-                return False
+        """查询视频是否有失败记录，在内存中查询，不读取文件"""
+        return (await Utils._error_videos()).contains(video_info["bvid"], page)
 
     @staticmethod
-    async def remove_error_video(video_info):
-        """删除下载失败的视频记录"""
-        with open(f"{local_path}/error_video.txt", "r") as f:
-            lines = f.readlines()
-        with open(f"{local_path}/error_video.txt", "w") as f_w:
-            for line in lines:
-                if video_info["bvid"] not in line:
-                    f_w.write(line)
+    async def remove_error_video(video_info, page=None):
+        """删除下载失败的视频记录，不指定分P时删除该视频的所有记录"""
+        await fs.run((await Utils._error_videos()).remove, video_info["bvid"], page)
 
     @staticmethod
     async def get_error_video_list():
-        """获取下载失败的视频列表"""
-        with open(f"{local_path}/error_video.txt", "r") as f:
-            lines = f.readlines()
-        error_video_list = []
-        for line in lines:
-            error_video_list.append(line.replace("\n", ""))
-        return error_video_list
+        """获取下载失败的视频列表，每项为 (bvid, 分P)"""
+        return (await Utils._error_videos()).entries()
 
     @staticmethod
     def if_get_character():
@@ -600,17 +585,21 @@ class Utils:
 
     @staticmethod
     async def delete_video_folder(video_info, target_str=None):
-        """删除视频目录 逻辑：如果提供target_str，删除包含target_str关键字的文件，如果没有提供target_str，则删除视频目录下的所有文件"""
+        """删除视频目录 逻辑：如果提供target_str，只删除包含target_str关键字的文件（分P并行处理时不影响其他分P），如果没有提供target_str，则删除视频目录下的所有文件"""
         try:
             raw_year = time.strftime("%Y", time.localtime(video_info["pubdate"]))
             path = f"{local_path}/{video_info['title']} ({raw_year})"
             if target_str:
-                filename_list = os.listdir(path)
-                for filename in filename_list:
-                    if target_str in filename:
-                        os.remove(f"{path}/{filename}")
+                for folder in (path, f"{path}/Season 1"):
+                    if not await fs.exists(folder):
+                        continue
+                    for filename in await fs.listdir(folder):
+                        # 后面跟.或-，避免S01E10误删S01E100
+                        if f"{target_str}." in filename or f"{target_str}-" in filename:
+                            await fs.remove(f"{folder}/{filename}")
+                return
             raw_year = time.strftime("%Y", time.localtime(video_info["pubdate"]))
-            shutil.rmtree(f"{local_path}/{video_info['title']} ({raw_year})")
+            await fs.rmtree(f"{local_path}/{video_info['title']} ({raw_year})")
         except Exception as e:
             _LOGGER.error(f"删除视频目录失败")
             tracebacklog = traceback.format_exc()
@@ -618,14 +607,8 @@ class Utils:
 
     @staticmethod
     async def find_and_remove(filename, target_str):
-        with open(filename, "r") as f:
-            lines = f.readlines()
-
-        with open(filename, "w") as f:
-            for line in lines:
-                if line.strip() != target_str:
-                    f.write(line)
-
+        lines = (await fs.read_text(filename)).splitlines(keepends=True)
+        await fs.write_text(filename, "".join(line for line in lines if line.strip() != target_str))
         return
 
     @staticmethod
@@ -637,9 +620,8 @@ class Utils:
         """
         try:
             # 先备份弹幕文件
-            shutil.copy(path, f"{path}.bak")
-            with open(path, "r", encoding="utf-8") as f:
-                lines = f.readlines()
+            await fs.copy(path, f"{path}.bak")
+            lines = (await fs.read_text(path)).splitlines(keepends=True)
             danmaku_lines = lines[17:]
             header_lines = lines[:17]
             # _LOGGER.info(f"弹幕条数：{len(danmaku_lines)}，保留弹幕条数：{number}，删除间隔：{remove_interval}")
@@ -647,14 +629,12 @@ class Utils:
             kept_lines = [
                 line for i, line in enumerate(lines) if i % lines_to_skip == 0
             ]
-            with open(path, "w") as f:
-                for line in header_lines + kept_lines:
-                    f.write(line)
+            await fs.write_text(path, "".join(header_lines + kept_lines))
         except Exception:
             _LOGGER.error(f"更改弹幕条数失败，开始恢复原弹幕文件")
             tracebacklog = traceback.format_exc()
             _LOGGER.error(f"报错原因：{tracebacklog}")
-            shutil.copy(f"{path}.bak", path)
+            await fs.copy(f"{path}.bak", path)
 
 
 async def retry_video():
@@ -662,17 +642,12 @@ async def retry_video():
     重试下载之前失败的视频 被定时任务调用 每次最多重试1个 防止被封ip
     保佑用户不会被封ip，shark个陈睿来祭天吧
     """
-    if not os.path.exists(f"{local_path}/error_video.txt"):
-        with open(f"{local_path}/error_video.txt", "w") as f:
-            pass
     error_video_list = await Utils.get_error_video_list()
-    error_video = error_video_list[0] if error_video_list else None
-    bv = error_video.split(" ")[0] if error_video else None
-    page = error_video.split(" ")[1][1:] if error_video else None
-    if error_video is None:
+    if not error_video_list:
         return
-    elif len(bv) != 12 and bv[:2] != "BV":
-        await Utils.find_and_remove(f"{local_path}/error_video.txt", error_video)
+    bv, page = error_video_list[0]
+    if len(bv) != 12 and bv[:2] != "BV":
+        await Utils.remove_error_video({"bvid": bv}, page)
         return
     _LOGGER.info(f"开始重试下载失败的视频 {bv}")
     if_people_path, people_path = Utils.if_get_character()
@@ -699,8 +674,8 @@ async def retry_video():
     media_path = Utils.get_media_path(False)
     if media_path is False:
         return
-    await Utils.remove_error_video({"bvid": error_video})
-    _LOGGER.info(f"重试下载失败的视频 {error_video} 任务已提交")
+    await Utils.remove_error_video({"bvid": bv}, page)
+    _LOGGER.info(f"重试下载失败的视频 {bv} P{page} 任务已提交")
     await BilibiliProcess(
         bv,
         emby_persons_path=people_path,
@@ -726,7 +701,7 @@ class ListenUploadVideo:
         so bilibili fuck you!
         """
         # _LOGGER.info(f"开始查询用户 {self.uid} 是否上传新视频")
-        if not os.path.exists(f"{local_path}/listen_up.json"):
+        if not await fs.exists(f"{local_path}/listen_up.json"):
             await self.save_data(f"{local_path}/listen_up.json")
         elif not await self.verify_json(f"{local_path}/listen_up.json"):
             await self.save_data(f"{local_path}/listen_up.json")
@@ -796,23 +771,18 @@ class ListenUploadVideo:
             return None
 
     async def save_data(self, file_name):
-        with open(file_name, "w") as f:
-            content = json.dumps(up_data)
-            f.write(content)
+        await fs.write_text(file_name, json.dumps(up_data))
 
     async def load_data(self, file_name):
-        with open(file_name, "r") as f:
-            content = f.read()
-            up_data.update(json.loads(content))
+        up_data.update(json.loads(await fs.read_text(file_name)))
 
     async def verify_json(self, file_name):
-        with open(file_name, "r") as f:
-            content = f.read()
-            try:
-                json.loads(content)
-                return True
-            except json.decoder.JSONDecodeError:
-                return False
+        content = await fs.read_text(file_name)
+        try:
+            json.loads(content)
+            return True
+        except json.decoder.JSONDecodeError:
+            return False
 
 
 if __name__ == "__main__":
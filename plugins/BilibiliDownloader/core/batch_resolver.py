@@ -0,0 +1,106 @@
+"""批量解析提交的BV号，在限流下并发获取视频信息，并分为普通视频和分P视频"""
+import asyncio
+import re
+
+from bilibili_api import video
+
+from plugins.BilibiliDownloader.core import public_function
+from plugins.BilibiliDownloader.utils import LOGGER
+from plugins.BilibiliDownloader.utils.rate_limiter import API_LIMITER
+
+_LOGGER = LOGGER
+BV_PATTERN = re.compile(r"BV[0-9A-Za-z]{10}")
+MAX_CONCURRENCY = 8  # 同时进行中的请求数，真正的请求频率由API_LIMITER控制
+
+
+def find_bv(text: str) -> str | None:
+    """从BV号或网址中提取BV号
+
+    :param text: BV号或网址
+    :return: BV号，没找到返回None
+    """
+    bv = BV_PATTERN.search(text)
+    return bv.group(0) if bv else None
+
+
+def parse_video_ids(raw: str) -> tuple[list[str], list[str]]:
+    """解析用户提交的内容，多个用半角逗号隔开
+
+    :param raw: 用户提交的内容
+    :return: 去重后的BV号列表，无法识别的内容列表
+    """
+    bvids, invalid = [], []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        bvid = find_bv(item)
+        if bvid is None:
+            invalid.append(item)
+        elif bvid not in bvids:
+            bvids.append(bvid)
+    return bvids, invalid
+
+
+class ResolvedVideo:
+    def __init__(self, bvid: str, video_info: dict, video_object: video.Video):
+        """解析完成的视频，直接交给下载任务使用，不用再次请求
+
+        :param bvid: 视频bvid
+        :param video_info: get_info返回的视频信息（包含分P列表pages）
+        :param video_object: 视频对象
+        """
+        self.bvid = bvid
+        self.video_info = video_info
+        self.video_object = video_object
+
+    @property
+    def is_multi_page(self) -> bool:
+        return len(self.video_info.get("pages", [])) > 1
+
+
+class BatchResolveResult:
+    def __init__(self):
+        """批量解析结果"""
+        self.normal: list[ResolvedVideo] = []  # 普通视频
+        self.pages: list[ResolvedVideo] = []  # 分P视频
+        self.invalid: list[str] = []  # 无法识别为BV号的内容
+        self.failed: list[str] = []  # 获取信息失败的BV号
+
+
+async def _resolve_one(bvid: str, semaphore: asyncio.Semaphore) -> ResolvedVideo | None:
+    async with semaphore:
+        await API_LIMITER.acquire()
+        res = await public_function.get_video_info(bvid)
+    if res is False:
+        return None
+    video_info, video_object = res
+    return ResolvedVideo(bvid, video_info, video_object)
+
+
+async def resolve_videos(raw: str) -> BatchResolveResult:
+    """批量解析用户提交的BV号或网址
+
+    提交内容中有无法识别的BV号时直接返回，不发出任何请求
+
+    :param raw: 用户提交的内容，多个用半角逗号隔开
+    :return: 解析结果
+    """
+    result = BatchResolveResult()
+    bvids, result.invalid = parse_video_ids(raw)
+    if result.invalid:
+        _LOGGER.warning(f"提交内容中有无法识别的BV号：{result.invalid}")
+        return result
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    resolved = await asyncio.gather(*[_resolve_one(bvid, semaphore) for bvid in bvids])
+    for bvid, item in zip(bvids, resolved):
+        if item is None:
+            result.failed.append(bvid)
+        elif item.is_multi_page:
+            result.pages.append(item)
+        else:
+            result.normal.append(item)
+    _LOGGER.info(
+        f"批量解析完成，普通视频{len(result.normal)}个，分P视频{len(result.pages)}个，失败{len(result.failed)}个"
+    )
+    return result
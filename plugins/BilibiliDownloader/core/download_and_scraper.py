@@ -1,8 +1,4 @@
 """核心部分，控制视频下载刮削流程"""
-import shutil
-
-from aiofiles import os
-
 from plugins.BilibiliDownloader.core.public_function import (
     get_video_info,
     download_video,
@@ -11,7 +7,7 @@ from plugins.BilibiliDownloader.core.public_function import (
     downlod_ass_danmakus,
     download_people_image,
 )
-from plugins.BilibiliDownloader.utils import global_value, LOGGER, exception
+from plugins.BilibiliDownloader.utils import global_value, LOGGER, exception, fs
 from plugins.BilibiliDownloader.core import nfo_generator
 
 local_path = global_value.get_value("local_path")
@@ -45,8 +41,9 @@ class ProcessNormalVideo:
         """
         self.pretty_title = None
         self.title = None
-        self.video_object = None
-        self.video_info = None
+        self.stream_info = {}  # 下载时选中的流信息（清晰度、大小、cid、音视频流）
+        self.video_object = video_object
+        self.video_info = video_info
         self.bvid = bvid
         self.video_path = video_path
         self.scraper_people = scraper_people
@@ -56,14 +53,14 @@ class ProcessNormalVideo:
 
     async def check_args(self):
         """检查参数是否合法"""
-        if await os.path.exists(self.video_path):
+        if await fs.exists(self.video_path):
             _LOGGER.info(f"下载目录已存在，删掉！")
-            shutil.rmtree(self.video_path)
-        await os.makedirs(self.video_path, exist_ok=True)
+            await fs.rmtree(self.video_path)
+        await fs.makedirs(self.video_path, exist_ok=True)
         if self.scraper_people and self.emby_people_path is None:
             _LOGGER.error("开启了人物刮削，但未指定emby人物文件夹路径")
             return False
-        elif await os.path.exists(self.emby_people_path) is False:
+        elif await fs.exists(self.emby_people_path) is False:
             _LOGGER.error("emby人物文件夹不存在，请检查是否将emby人物文件夹挂载到了mr容器中，并检查是否输入错误")
             return False
 
@@ -103,11 +100,11 @@ class ProcessNormalVideo:
             video_object=self.video_object,
             dst=self.video_path,
             filename=_title,
+            video_info=self.video_info,
         )
         if res is False:
             return False
-        elif res is False:
-            return False
+        self.stream_info = res
         _LOGGER.info(f"视频下载完成：{self.pretty_title}")
         return True
 
@@ -119,7 +116,7 @@ class ProcessNormalVideo:
         """
         _LOGGER.info(f"开始刮削视频：{self.pretty_title}")
         _LOGGER.info("开始生成nfo文件")
-        scraper = nfo_generator.NfoGenerator(self.video_info)
+        scraper = nfo_generator.NfoGenerator(self.video_info, streams=self.stream_info.get("streams"))
         path = f"{self.video_path}/{self.title}.nfo"
         if len(self.title) > 250:
             _title = self.title[:220]
@@ -149,12 +146,12 @@ class ProcessNormalVideo:
         for key in tree:
             parent_people_folder = f"{self.emby_people_path}/{key[0]}"
             people_folder = f"{parent_people_folder}/{key}"
-            if await os.path.exists(parent_people_folder) is False:
+            if await fs.exists(parent_people_folder) is False:
                 _LOGGER.info(f"创建人物文件夹：{people_folder}")
-                await os.makedirs(people_folder)
-            elif await os.path.exists(people_folder) is False:
+                await fs.makedirs(people_folder)
+            elif await fs.exists(people_folder) is False:
                 _LOGGER.info(f"创建人物文件夹：{people_folder}")
-                await os.makedirs(people_folder)
+                await fs.makedirs(people_folder)
             else:
                 _LOGGER.info(f"人物文件夹已存在：{people_folder} 跳过处理")
                 continue
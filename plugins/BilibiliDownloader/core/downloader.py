@@ -2,9 +2,10 @@ import traceback
 
 import httpx
 import tenacity
-from aiofiles import os, open
+from aiofiles import open
 
-from plugins.BilibiliDownloader.utils import LOGGER
+from plugins.BilibiliDownloader.core import playurl_cache, failure_taxonomy
+from plugins.BilibiliDownloader.utils import LOGGER, fs
 
 _LOGGER = LOGGER
 
@@ -12,13 +13,15 @@ _LOGGER = LOGGER
 class DownloadFunc:
     """下载类 用于下载视频和封面"""
 
-    def __init__(self, url, path):
+    def __init__(self, url, path, resign=None):
         """
         :param url: 需要下载的url
         :param path: 保存的位置
+        :param resign: 可选，取流地址过期时调用的异步函数，返回重新签名后的url
         """
         self.url = url
         self.path = path
+        self.resign = resign
         self.HEADERS = {
             "User-Agent": "Mozilla/5.0",
             "Referer": "https://www.bilibili.com",
@@ -55,6 +58,27 @@ class DownloadFunc:
         else:
             return True
 
+    async def _resign_if_expired(self, status_code: int) -> bool:
+        """取流地址过期（403/404）时重新签名
+
+        :param status_code: 本次请求的状态码
+        :return: 是否换了新地址
+        """
+        if status_code not in (403, 404) or self.resign is None:
+            return False
+        if not playurl_cache.is_url_expired(self.url):
+            return False
+        _LOGGER.warning(f"取流地址已过期（状态码：{status_code}），重新签名后从断点继续下载")
+        self.url = await self.resign()
+        return True
+
+    async def _get_downloaded_size(self) -> int:
+        """获取本地已下载的大小"""
+        try:
+            return await fs.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
     @tenacity.retry(
         stop=tenacity.stop_after_attempt(6),
         wait=tenacity.wait_fixed(50),
@@ -62,40 +86,54 @@ class DownloadFunc:
         reraise=True,
     )
     async def download_with_resume(self):
-        """这个是我瞎写的包含断点续传功能的下载方法"""
+        """这个是我瞎写的包含断点续传功能的下载方法
+
+        每次重试都从本地已下载的位置继续，取流地址过期时会重新签名并续传同一段字节
+        """
         try:
             async with httpx.AsyncClient() as client:
                 _LOGGER.info(f"开始使用断点续传下载url：{self.url}，保存路径：{self.path}")
                 response = await client.head(self.url, headers=self.HEADERS)
+                if await self._resign_if_expired(response.status_code):
+                    response = await client.head(self.url, headers=self.HEADERS)
                 file_size = int(response.headers["content-length"])
-                try:
-                    async with open(self.path, "rb") as file:
-                        downloaded_size = len(await file.read())
-                except FileNotFoundError:
+                downloaded_size = await self._get_downloaded_size()
+                if downloaded_size > file_size:
+                    # 换了清晰度或者流之后，本地的半截文件比新的流还大，不能续传，从头下载
+                    _LOGGER.warning(f"本地文件（{downloaded_size}）比远端文件（{file_size}）大，删除后重新下载")
+                    await fs.remove(self.path)
                     downloaded_size = 0
                 if downloaded_size < file_size:
-                    self.HEADERS["range"] = f"bytes={file_size - downloaded_size}"
-                    response = await client.get(self.url, headers=self.HEADERS)
-                    _LOGGER.info(
-                        f"本次请求请求头：{response.request.headers}，状态码：{response.status_code}"
-                    )
-                    if response.status_code == 416:
-                        _LOGGER.info("不允许使用Range请求头或者Range请求头范围错误，回退到普通下载")
-                        res, size = await self.normal_download()
-                        if res is False:
-                            return False, size
-                        else:
-                            return True, size
-                    async with open(self.path, "ab") as file:
-                        await file.write(response.content)
-                    async with open(self.path, "rb") as file:
-                        downloaded_size = len(await file.read())
+                    headers = dict(self.HEADERS, range=f"bytes={downloaded_size}-")
+                    request = client.build_request("GET", self.url, headers=headers)
+                    response = await client.send(request, stream=True)
+                    if await self._resign_if_expired(response.status_code):
+                        await response.aclose()
+                        request = client.build_request("GET", self.url, headers=headers)
+                        response = await client.send(request, stream=True)
+                    try:
+                        _LOGGER.info(
+                            f"本次请求请求头：{response.request.headers}，状态码：{response.status_code}"
+                        )
+                        if response.status_code == 416:
+                            _LOGGER.info("不允许使用Range请求头或者Range请求头范围错误，回退到普通下载")
+                            return await self.normal_download()
+                        response.raise_for_status()
+                        # 服务器忽略了Range请求头时会返回完整文件，此时从头写入
+                        mode = "ab" if response.status_code == 206 else "wb"
+                        async with open(self.path, mode) as file:
+                            async for data in response.aiter_bytes():
+                                await file.write(data)
+                    finally:
+                        await response.aclose()
+                    downloaded_size = await self._get_downloaded_size()
                 _LOGGER.info(f"下载完成，文件大小：{downloaded_size}")
                 if downloaded_size == 0:
                     _LOGGER.error(f"下载的文件大小为0，50秒后重试")
                     return False
             return True, downloaded_size
-        except:
+        except Exception as e:
+            failure_taxonomy.remember(e)
             _LOGGER.error(f"下载失败 休息50秒后从失败处重试")
             tracebacklog = traceback.format_exc()
             _LOGGER.error("报错原因：\n" + tracebacklog)
@@ -115,15 +153,18 @@ class DownloadFunc:
                 if "range" in sess.headers:
                     del sess.headers["range"]
                 resp = await sess.get(self.url)
+                if await self._resign_if_expired(resp.status_code):
+                    resp = await sess.get(self.url)
                 _LOGGER.info(f"本次请求请求头：{resp.request.headers}，状态码：{resp.status_code}")
                 async with open(self.path, "wb") as f:
                     await f.write(resp.content)
                     size = len(resp.content)
                 _LOGGER.info(f"下载完成，文件大小：{size}")
-        except:
+        except Exception as e:
+            failure_taxonomy.remember(e)
             _LOGGER.error(f"下载失败 休息50秒后从失败处重试")
-            if await os.path.exists(self.path):
-                await os.remove(self.path)
+            if await fs.exists(self.path):
+                await fs.remove(self.path)
             tracebacklog = traceback.format_exc()
             _LOGGER.error("报错原因：\n" + tracebacklog)
             return False
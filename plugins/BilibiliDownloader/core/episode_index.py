@@ -0,0 +1,172 @@
+"""UP主文件夹模式下的集数索引，每个UP主一个json文件，记录 bvid -> 集数
+
+集数一经分配就不再变化，新视频按发布时间顺序依次追加，不需要每次都去数Season文件夹。
+"""
+import json
+import os
+import threading
+import time
+
+from lxml import etree
+
+from plugins.BilibiliDownloader.utils import LOGGER, files
+
+_LOGGER = LOGGER
+INDEX_DIR = f"{files.local_path}/episode_index"
+
+
+class EpisodeIndex:
+    def __init__(self, mid: int, index_dir: str = INDEX_DIR):
+        """单个UP主的集数索引
+
+        索引结构：{"episodes": {bvid: {"episode": 集数, "pubdate": 发布时间戳}}, "last": 已分配的最大集数,
+                  "series_hash": 上次生成tvshow.nfo和封面时的UP主信息哈希}
+
+        :param mid: UP主uid
+        :param index_dir: 索引文件所在目录
+        """
+        self.mid = mid
+        self.index_path = f"{index_dir}/{mid}.json"
+        self._data = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # 同一个UP主的多个视频同时完成时只扫描一次
+
+    def _ensure_loaded(self) -> dict:
+        if self._data is None:
+            self._data = {"episodes": {}, "last": 0}
+            if os.path.exists(self.index_path):
+                try:
+                    with open(self.index_path, "r", encoding="utf-8") as f:
+                        self._data = json.load(f)
+                except (ValueError, OSError):
+                    _LOGGER.exception(f"UP主 {self.mid} 的集数索引文件损坏，将从Season文件夹重新建立")
+                    # 损坏的文件改名保留，索引文件不存在时ensure_built才会重新扫描，不能从第1集重新分配
+                    os.replace(self.index_path, f"{self.index_path}.corrupt")
+        return self._data
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        files.write_json_atomic(self.index_path, self._data)
+
+    def is_built(self) -> bool:
+        """索引文件是否已经建立过，文件损坏的按没有建立处理"""
+        with self._lock:
+            self._ensure_loaded()
+        return os.path.exists(self.index_path)
+
+    def get(self, bvid: str) -> int | None:
+        """查询视频的集数
+
+        :param bvid: 视频bvid
+        :return: 集数，从1开始，没有分配过返回None
+        """
+        with self._lock:
+            episode = self._ensure_loaded()["episodes"].get(bvid)
+        return episode["episode"] if episode else None
+
+    def get_pubdate(self, bvid: str) -> int | None:
+        """查询分配集数时记录的视频发布时间戳，没有分配过返回None"""
+        with self._lock:
+            episode = self._ensure_loaded()["episodes"].get(bvid)
+        return episode["pubdate"] if episode else None
+
+    def allocate(self, bvid: str, pubdate: int) -> int:
+        """给视频分配集数，已经分配过的直接返回原来的集数
+
+        :param bvid: 视频bvid
+        :param pubdate: 视频发布时间戳
+        :return: 集数，从1开始
+        """
+        return self.allocate_many([(bvid, pubdate)])[bvid]
+
+    def allocate_many(self, videos: list[tuple[str, int]]) -> dict[str, int]:
+        """一次给多个视频分配集数，未分配的视频按发布时间先后依次追加到末尾
+
+        比已有视频发布得更早的视频（比如补下载的旧视频）也追加到末尾，已分配的集数始终保持不变
+
+        :param videos: (bvid, 发布时间戳) 列表
+        :return: {bvid: 集数}
+        """
+        result = {}
+        with self._lock:
+            data = self._ensure_loaded()
+            episodes = data["episodes"]
+            changed = False
+            for bvid, pubdate in sorted(videos, key=lambda item: item[1]):
+                if bvid not in episodes:
+                    data["last"] += 1
+                    episodes[bvid] = {"episode": data["last"], "pubdate": pubdate}
+                    changed = True
+                result[bvid] = episodes[bvid]["episode"]
+            if changed:
+                self._save()
+        return result
+
+    def get_series_hash(self) -> str | None:
+        """上次生成tvshow.nfo和封面时的UP主信息哈希"""
+        with self._lock:
+            return self._ensure_loaded().get("series_hash")
+
+    def set_series_hash(self, value: str) -> None:
+        """记录本次生成tvshow.nfo和封面时的UP主信息哈希"""
+        with self._lock:
+            self._ensure_loaded()["series_hash"] = value
+            self._save()
+
+    def build(self, show_path: str) -> int:
+        """从UP主文件夹各个Season中已有的episodedetails nfo建立索引，只在索引文件不存在时执行一次
+
+        :param show_path: UP主文件夹
+        :return: 索引到的视频数量
+        """
+        episodes = {}
+        if os.path.exists(show_path):
+            for dirpath, _, filenames in os.walk(show_path):
+                for filename in filenames:
+                    if filename.endswith(".nfo"):
+                        episode = _read_episode(os.path.join(dirpath, filename))
+                        if episode is not None:
+                            episodes[episode[0]] = {"episode": episode[1], "pubdate": episode[2]}
+        with self._lock:
+            self._data = {
+                "episodes": episodes,
+                "last": max((item["episode"] for item in episodes.values()), default=0),
+            }
+            self._save()
+        _LOGGER.info(f"UP主 {self.mid} 的集数索引建立完成，共 {len(episodes)} 集")
+        return len(episodes)
+
+    def ensure_built(self, show_path: str) -> None:
+        """索引还没建立时扫描一次UP主文件夹"""
+        with self._build_lock:
+            if not self.is_built():
+                self.build(show_path)
+
+
+def _read_episode(nfo_path: str) -> tuple[str, int, int] | None:
+    """从episodedetails nfo读取 (bvid, 集数, 发布时间戳)，读不到返回None"""
+    try:
+        root = etree.parse(nfo_path).getroot()
+    except (etree.XMLSyntaxError, OSError):
+        return None
+    bvid = (root.findtext("id") or "").strip()
+    episode = (root.findtext("episode") or "").strip()
+    if root.tag != "episodedetails" or not bvid or not episode.isdigit():
+        return None
+    try:
+        pubdate = int(time.mktime(time.strptime((root.findtext("premiered") or "").strip(), "%Y-%m-%d")))
+    except ValueError:
+        pubdate = 0
+    return bvid, int(episode), pubdate
+
+
+_indexes: dict[int, EpisodeIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_episode_index(mid: int) -> EpisodeIndex:
+    """获取UP主的集数索引，同一个UP主在插件内共用一个实例，保证集数分配是原子的"""
+    with _indexes_lock:
+        if mid not in _indexes:
+            _indexes[mid] = EpisodeIndex(mid)
+        return _indexes[mid]
@@ -0,0 +1,153 @@
+"""下载失败原因分类，以及每类失败的重试策略
+
+稿件被删除、没有权限这类永久性的失败重试多少次都不会成功，每次重试还要白白下载一遍，
+这类失败直接隔离（不再重试）并通知一次；网络波动、风控则按各自的退避时间重试。
+"""
+import asyncio
+import contextvars
+import enum
+import errno
+
+import ffmpeg
+import httpx
+from bilibili_api import exceptions
+
+from plugins.BilibiliDownloader.utils import LOGGER, files, fs
+
+_LOGGER = LOGGER
+
+
+class FailureKind(enum.Enum):
+    TRANSIENT = "transient"  # 网络波动、接口临时错误
+    RISK_CONTROL = "risk_control"  # 被b站风控
+    REMOVED = "removed"  # 稿件已删除、不可见
+    PERMISSION = "permission"  # 需要登录、大会员、充电或地区限制
+    DISK = "disk"  # 磁盘满、没有写入权限
+    MUX = "mux"  # ffmpeg混流失败
+    UNKNOWN = "unknown"
+
+
+class RetryPolicy:
+    def __init__(self, max_retry: int, base_delay: float = 5 * 60, max_delay: float = 12 * 3600, reason: str = ""):
+        """某一类失败的重试策略
+
+        :param max_retry: 最多重试次数，为0时第一次失败就隔离
+        :param base_delay: 第一次失败后等待的秒数，之后每失败一次翻倍
+        :param max_delay: 最长等待秒数
+        :param reason: 隔离时通知里的原因
+        """
+        self.max_retry = max_retry
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.reason = reason
+
+
+RETRY_POLICIES = {
+    FailureKind.TRANSIENT: RetryPolicy(10, 5 * 60, 6 * 3600, "多次网络错误"),
+    FailureKind.RISK_CONTROL: RetryPolicy(10, 30 * 60, 12 * 3600, "多次被b站风控"),
+    FailureKind.REMOVED: RetryPolicy(0, reason="稿件已删除或不可见"),
+    FailureKind.PERMISSION: RetryPolicy(0, reason="没有观看权限（需要登录、大会员、充电或地区限制）"),
+    FailureKind.DISK: RetryPolicy(3, 30 * 60, 12 * 3600, "磁盘空间不足或没有写入权限"),
+    FailureKind.MUX: RetryPolicy(3, 5 * 60, 3600, "多次混流失败"),
+    FailureKind.UNKNOWN: RetryPolicy(10, reason="多次下载失败"),
+}
+
+REMOVED_CODES = {-404, 62002, 62004, 62012}
+PERMISSION_CODES = {-101, -403, -10403, 87007, 87008, 6002003}
+RISK_CONTROL_CODES = {-351, -352, -412, -509, -799}
+TRANSIENT_CODES = {-500, -503, -504}
+DISK_ERRNOS = {getattr(errno, name) for name in ("ENOSPC", "EDQUOT", "EROFS", "EACCES", "EPERM") if hasattr(errno, name)}
+TRANSIENT_ERRORS = (exceptions.NetworkException, httpx.TransportError, asyncio.TimeoutError, TimeoutError,
+                    ConnectionError)
+PERMISSION_ERRORS = (exceptions.LoginError, exceptions.CredentialNoSessdataException,
+                     exceptions.CredentialNoBiliJctException, exceptions.CredentialNoDedeUserIDException)
+RISK_CONTROL_ERRORS = (exceptions.GeetestException, exceptions.WbiRetryTimesExceedException)
+
+# 下载流程里很多函数捕获异常后只返回False，在这里记下原始异常，外层失败时用它分类
+_last_cause = contextvars.ContextVar("bilibili_failure_cause", default=None)
+
+
+def remember(exc: BaseException) -> None:
+    """记下当前任务里被吞掉的异常"""
+    _last_cause.set(exc)
+
+
+def forget() -> None:
+    """开始新的下载任务前清空记下的异常"""
+    _last_cause.set(None)
+
+
+def _classify_one(exc: BaseException) -> FailureKind:
+    if isinstance(exc, exceptions.ResponseCodeException):
+        if exc.code in REMOVED_CODES:
+            return FailureKind.REMOVED
+        if exc.code in PERMISSION_CODES:
+            return FailureKind.PERMISSION
+        if exc.code in RISK_CONTROL_CODES:
+            return FailureKind.RISK_CONTROL
+        if exc.code in TRANSIENT_CODES:
+            return FailureKind.TRANSIENT
+        return FailureKind.UNKNOWN
+    if isinstance(exc, RISK_CONTROL_ERRORS):
+        return FailureKind.RISK_CONTROL
+    if isinstance(exc, PERMISSION_ERRORS):
+        return FailureKind.PERMISSION
+    if isinstance(exc, ffmpeg.Error):
+        return FailureKind.MUX
+    if isinstance(exc, TRANSIENT_ERRORS):
+        return FailureKind.TRANSIENT
+    if isinstance(exc, OSError) and exc.errno in DISK_ERRNOS:
+        return FailureKind.DISK
+    return FailureKind.UNKNOWN
+
+
+def classify(exc: BaseException) -> FailureKind:
+    """沿着异常链（raise from / 处理异常时又抛出的异常）找到第一个能识别的原因，
+    都识别不了时再看下载流程里记下的被吞掉的异常
+
+    :param exc: 下载任务抛出的异常
+    :return: 失败分类
+    """
+    seen = set()
+    candidates = []
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        candidates.append(exc)
+        exc = exc.__cause__ or exc.__context__
+    if _last_cause.get() is not None:
+        candidates.append(_last_cause.get())
+    for candidate in candidates:
+        kind = _classify_one(candidate)
+        if kind is not FailureKind.UNKNOWN:
+            return kind
+    return FailureKind.UNKNOWN
+
+
+def policy_for(kind: FailureKind | str | None) -> RetryPolicy:
+    """失败分类对应的重试策略，旧记录没有分类时按未知处理"""
+    try:
+        return RETRY_POLICIES[FailureKind(kind)]
+    except ValueError:
+        return RETRY_POLICIES[FailureKind.UNKNOWN]
+
+
+async def record_failure(bvid: str, page: int, kind: FailureKind) -> bool:
+    """按失败分类记录一次失败，永久性失败或重试次数用完时隔离
+
+    :param bvid: 视频bvid
+    :param page: 分P序号，从0开始
+    :param kind: 失败分类
+    :return: 是否是这一次刚被隔离的（需要发送通知）
+    """
+    policy = RETRY_POLICIES[kind]
+    store = files.get_error_video_store()
+    if policy.max_retry > 0:
+        retry = await fs.run(
+            store.record_failure, bvid, page, kind=kind.value, base_delay=policy.base_delay, max_delay=policy.max_delay
+        )
+        _LOGGER.info(f"视频{bvid} P{page + 1} 失败原因：{kind.value}，已重试{retry}次，稍后按退避时间重试")
+        if retry < policy.max_retry:
+            return False
+    newly = await fs.run(store.quarantine, bvid, page, kind.value)
+    _LOGGER.warning(f"视频{bvid} P{page + 1} 不再重试，原因：{policy.reason}")
+    return newly
@@ -1,4 +1,291 @@
-"""查询追更up主更新情况"""
+"""查询追更up主更新情况
+
+默认读取登录账号的视频动态，一两次请求就能找到所有已关注up主的新投稿，
+用记录下的动态id作为游标，只处理比上次看到的更新的动态。
+配置里追更但账号没有关注的up主、或者动态接口请求失败时，才逐个请求up主的投稿列表。
+请求次数由poll_scheduler按接口预算分配，每个请求（包括翻页和获取新视频信息）都计入预算，
+逐个查询的间隔由upload_cadence根据每个up主的投稿历史决定。
+"""
+import time
+
+from bilibili_api import dynamic, user
+
+from plugins.BilibiliDownloader.core import main_video_process, public_function, poll_scheduler, failure_taxonomy, \
+    upload_cadence
+from plugins.BilibiliDownloader.mr import mr_notify
+from plugins.BilibiliDownloader.utils import LOGGER, global_value, files, fs
+from plugins.BilibiliDownloader.utils.follow_state_store import FollowStateStore
+
+_LOGGER = LOGGER
+FEED_MAX_PAGES = 3  # 每次最多翻几页动态，正常情况下第一页就能碰到上次的游标
+UPLOADER_VIDEOS_PAGE_SIZE = 50
+UPLOADER_MAX_PAGES = 10  # 逐个查询时最多往前翻几页投稿
+
+
+def parse_feed_videos(feed: dict) -> list[dict]:
+    """从动态列表中取出视频投稿
+
+    :param feed: get_dynamic_page_info的返回值
+    :return: [{"dynamic_id", "uid", "aid", "bvid", "title", "created"}]，与动态列表同样按时间从新到旧
+    """
+    videos = []
+    for item in feed.get("items") or []:
+        modules = item.get("modules") or {}
+        archive = ((modules.get("module_dynamic") or {}).get("major") or {}).get("archive")
+        author = modules.get("module_author") or {}
+        if not archive or not archive.get("bvid"):
+            continue
+        videos.append({
+            "dynamic_id": int(item["id_str"]),
+            "uid": int(author.get("mid", 0)),
+            "aid": int(archive.get("aid") or 0) or None,
+            "bvid": archive["bvid"],
+            "title": archive.get("title", ""),
+            "created": int(author.get("pub_ts") or 0),
+        })
+    return videos
+
+
+async def poll_dynamic_feed(credential, state: FollowStateStore = None, max_pages: int = FEED_MAX_PAGES,
+                            scheduler: poll_scheduler.PollScheduler = None) -> tuple[list[dict], bool]:
+    """读取登录账号的视频动态，返回比游标更新的视频，碰到游标时把游标推进到最新的动态
+
+    第一次运行时只记录游标，不下载之前的视频。
+    翻完max_pages页或者动态列表到底了还没碰到游标时，游标和新视频之间可能还有没读到的视频，
+    这时不推进游标，由调用方逐个查询up主补上
+
+    :param credential: 登录凭据
+    :param state: 追更进度
+    :param max_pages: 最多翻几页
+    :param scheduler: 追更查询调度器，第一页由调用方取令牌，之后每翻一页取一个，令牌不够时不再翻页
+    :return: (新视频列表（从旧到新），是否碰到了游标)，请求失败时抛出异常
+    """
+    state = state or files.get_follow_state_store()
+    scheduler = scheduler or poll_scheduler.get_poll_scheduler()
+    cursor = await fs.run(state.get_dynamic_offset)
+    new_videos = []
+    newest_id = cursor
+    offset = None
+    reached_cursor = cursor is None
+    for page in range(1, max_pages + 1):
+        feed = await dynamic.get_dynamic_page_info(
+            credential=credential, _type=dynamic.DynamicType.VIDEO, pn=page, offset=offset
+        )
+        videos = parse_feed_videos(feed)
+        if videos:
+            newest_id = max(newest_id or 0, videos[0]["dynamic_id"])
+        if cursor is not None:
+            reached_cursor = any(v["dynamic_id"] <= cursor for v in videos)
+            new_videos.extend(v for v in videos if v["dynamic_id"] > cursor)
+        if reached_cursor or not feed.get("has_more") or not feed.get("offset"):
+            break
+        offset = feed["offset"]
+        if page < max_pages and not scheduler.acquire():
+            _LOGGER.info("追更查询的预算用完，不再往后翻动态")
+            break
+    if not reached_cursor:
+        _LOGGER.warning(f"读取了{page}页动态还没碰到上次的游标，游标保持不变，更早的新视频交给逐个up主查询")
+    elif newest_id is not None and newest_id != cursor:
+        await fs.run(state.set_dynamic_offset, newest_id)
+    if cursor is None:
+        _LOGGER.info("第一次读取动态列表，只记录游标，之后发布的视频才会下载")
+    return list(reversed(new_videos)), reached_cursor
+
+
+def is_newer(video: dict, watermark: tuple[int, int | None]) -> bool:
+    """视频是否比记录的最新投稿更新，旧记录没有aid时只比较投稿时间"""
+    last_created, last_aid = watermark
+    if last_aid is None:
+        return video["created"] > last_created
+    return (video["created"], video.get("aid") or 0) > (last_created, last_aid)
+
+
+async def poll_uploader(uid: int, credential, state: FollowStateStore = None, max_pages: int = UPLOADER_MAX_PAGES,
+                        scheduler: poll_scheduler.PollScheduler = None) -> list[dict]:
+    """逐个查询up主的投稿列表（动态读取不到时的兜底方式）
+
+    从最新的一页往前翻，直到碰到记录的最新投稿，一次发布很多视频时也不会漏掉。
+    第一次查询某个up主时只记录最新投稿，不下载之前的视频。
+    第一页的令牌在调度器选中这个up主时已经取过，之后每翻一页记一个，翻到一半停下会漏视频，令牌不够时先欠着
+
+    :return: 新视频列表（从旧到新）
+    """
+    state = state or files.get_follow_state_store()
+    scheduler = scheduler or poll_scheduler.get_poll_scheduler()
+    up = user.User(credential=credential, uid=uid)
+    watermark = await fs.run(state.get_watermark, uid)
+    new_videos = []
+    for page in range(1, max_pages + 1):
+        if page > 1:
+            scheduler.charge()
+        res = await up.get_videos(pn=page, ps=UPLOADER_VIDEOS_PAGE_SIZE)
+        vlist = res["list"]["vlist"]
+        if page == 1:
+            await fs.run(state.record_uploads, uid, [v["created"] for v in vlist], upload_cadence.HISTORY_SIZE)
+        if watermark is None:
+            if vlist:
+                await fs.run(state.update_last_created, uid, vlist[0]["created"], vlist[0]["aid"])
+            return []
+        newer = [v for v in vlist if is_newer(v, watermark)]
+        new_videos += newer
+        if len(newer) < len(vlist) or len(vlist) < UPLOADER_VIDEOS_PAGE_SIZE:
+            break
+    else:
+        _LOGGER.warning(f"用户 {uid} 翻了{max_pages}页投稿还没碰到上次看到的视频，只处理最新的{len(new_videos)}个")
+    return [
+        {"uid": uid, "aid": v["aid"], "bvid": v["bvid"], "title": v["title"], "created": v["created"]}
+        for v in reversed(new_videos)
+    ]
+
+
+async def save_new_video(new_video: dict, state: FollowStateStore = None,
+                         scheduler: poll_scheduler.PollScheduler = None) -> bool:
+    """下载一个新视频，分P视频只通知不下载。失败的视频记录到错误视频中，之后自动重试
+
+    :param new_video: poll_dynamic_feed或poll_uploader返回的视频
+    :param scheduler: 追更查询调度器，获取视频信息的请求计入预算
+    :return: 是否下载成功
+    """
+    state = state or files.get_follow_state_store()
+    scheduler = scheduler or poll_scheduler.get_poll_scheduler()
+    config = global_value.get_value("config")
+    failure_taxonomy.forget()
+    scheduler.charge()
+    res = await public_function.get_video_info(new_video["bvid"])
+    if not res:
+        # 游标推进后不会再从列表里看到这个视频，先记到错误视频里交给重试任务
+        kind = failure_taxonomy.classify(None)
+        if await failure_taxonomy.record_failure(new_video["bvid"], 0, kind):
+            await mr_notify.Notify(None).send_quarantine_notify(new_video["bvid"], failure_taxonomy.policy_for(kind).reason)
+    await fs.run(state.update_last_created, new_video["uid"], new_video["created"], new_video.get("aid"))
+    if not res:
+        return False
+    # 列表里没有分P数，用这一次获取的视频信息判断，并直接交给下载任务，不再重复请求
+    video_info, video_object = res
+    if video_info.get("videos", len(video_info.get("pages", []))) > 1:
+        _LOGGER.info(f"用户{new_video['uid']}发布了分p视频，忽略：{video_info['title']}")
+        mr_notify.Notify(video_info).send_pages_video_notify()
+        return True
+    _LOGGER.info(f"用户 {new_video['uid']} 发布了新视频：{video_info['title']}  开始下载")
+    return await main_video_process.SaveOneVideo(
+        mode=config.get("video_save_mode"),
+        bvid=new_video["bvid"],
+        media_path=config.get("media_path"),
+        scraper_people=bool(config.get("person_dir")),
+        emby_people_path=config.get("person_dir"),
+        video_info=video_info,
+        video_object=video_object,
+        season_layout_mode=config.get("season_layout"),
+        season_chunk_size=config.get("season_chunk_size"),
+    ).run()
+
+
+async def check_follow_updates(follow_uids: list[int], feed_uids: set[int],
+                               scheduler: poll_scheduler.PollScheduler = None) -> int:
+    """查询追更up主的新视频并下载，请求次数由调度器按接口预算分配
+
+    :param follow_uids: 所有追更的up主
+    :param feed_uids: 账号已关注、可以从动态中读到的up主
+    :param scheduler: 追更查询调度器
+    :return: 发现的新视频数量
+    """
+    scheduler = scheduler or poll_scheduler.get_poll_scheduler()
+    state = files.get_follow_state_store()
+    credential = global_value.get_value("credential")
+    follow = [int(uid) for uid in follow_uids]
+    feed = {uid for uid in follow if uid in feed_uids}
+    new_videos = []
+    feed_videos = []
+    feed_polled = False
+    feed_reached = False
+    feed_behind = []  # 没碰到游标时读到的所有新视频，用来判断之后能不能推进游标
+    if feed and scheduler.acquire():
+        try:
+            all_feed_videos, feed_reached = await poll_dynamic_feed(credential, scheduler=scheduler)
+            if not feed_reached:
+                feed_behind = all_feed_videos
+            feed_videos = [v for v in all_feed_videos if v["uid"] in feed]
+            watermarks = {uid: await fs.run(state.get_watermark, uid) for uid in {v["uid"] for v in feed_videos}}
+            for uid in watermarks:
+                await fs.run(
+                    state.record_uploads, uid, [v["created"] for v in feed_videos if v["uid"] == uid],
+                    upload_cadence.HISTORY_SIZE
+                )
+            # 游标没推进时下次还会读到同样的视频，已经处理过的按up主的最新投稿过滤掉
+            feed_videos = [v for v in feed_videos if watermarks[v["uid"]] is None or is_newer(v, watermarks[v["uid"]])]
+            if feed_reached:
+                scheduler.mark_checked(feed)
+            scheduler.report_success()
+            feed_polled = True
+        except Exception as e:
+            _LOGGER.exception("读取动态列表失败，本次改为逐个查询up主投稿")
+            if failure_taxonomy.classify(e) is failure_taxonomy.FailureKind.RISK_CONTROL:
+                scheduler.report_risk_control()
+    # 动态没碰到游标时中间可能漏了视频，动态里的up主也要逐个查询
+    candidates = [uid for uid in follow if not (feed_reached and uid in feed)]
+    now = time.time()
+    histories = await fs.run(state.get_upload_histories, candidates)
+    intervals = {uid: upload_cadence.poll_interval(histories.get(uid, []), now) for uid in candidates}
+    polled = []
+    scanned = set()
+    for uid in scheduler.select(candidates, now, intervals):
+        polled.append(uid)
+        try:
+            new_videos += await poll_uploader(uid, credential, scheduler=scheduler)
+            scheduler.report_success()
+            # 查询失败的up主不算查过，下一轮优先重试，也不能据此推进动态游标
+            scheduler.mark_checked([uid])
+            scanned.add(uid)
+        except Exception as e:
+            _LOGGER.exception(f"查询用户 {uid} 的投稿失败")
+            if failure_taxonomy.classify(e) is failure_taxonomy.FailureKind.RISK_CONTROL:
+                scheduler.report_risk_control()
+                break
+    if feed_reached:
+        new_videos = feed_videos + new_videos
+    else:
+        # 动态没碰到游标时，保存视频会把up主的最新投稿推进到缺口之后，之后逐个查询就找不到缺口里的视频了。
+        # 只处理这一轮已经逐个查询过的up主，其他up主的视频留到他们被查询的那一轮（游标没推进，下次还会读到）
+        deferred = {v["uid"] for v in feed_videos if v["uid"] not in scanned}
+        if deferred:
+            _LOGGER.info(f"动态没碰到游标，{len(deferred)}个up主的新视频等逐个查询后再处理")
+        new_videos = [v for v in feed_videos if v["uid"] in scanned] + new_videos
+    if feed_behind:
+        await _advance_cursor_if_covered(scheduler, state, feed, feed_behind)
+    seen = set()
+    for new_video in new_videos:
+        if new_video["bvid"] in seen:
+            continue
+        seen.add(new_video["bvid"])
+        await save_new_video(new_video, scheduler=scheduler)
+    _log_staleness(scheduler, follow)
+    _LOGGER.info(f"追更检查完成：读取动态{'1次' if feed_polled else '0次'}，逐个查询{len(polled)}个up主，发现{len(seen)}个新视频")
+    return len(seen)
+
+
+async def _advance_cursor_if_covered(scheduler: poll_scheduler.PollScheduler, state: FollowStateStore,
+                                     feed: set[int], feed_videos: list[dict]) -> None:
+    """动态没碰到游标时，漏掉的视频都发布在这次读到的最早的视频之前。
+    动态里的up主在那之后都逐个查询过时，漏掉的视频已经补上，游标可以推进到最新的动态
+    """
+    behind_since = min(v["created"] for v in feed_videos)
+    now = time.time()
+    if all(age is not None and now - age >= behind_since for age in scheduler.staleness(list(feed), now).values()):
+        await fs.run(state.set_dynamic_offset, max(v["dynamic_id"] for v in feed_videos))
+        _LOGGER.info("动态里的up主都已经逐个查询过，推进动态游标")
+
+
+def _log_staleness(scheduler: poll_scheduler.PollScheduler, uids: list[int]) -> None:
+    staleness = scheduler.staleness(uids)
+    never = [uid for uid, age in staleness.items() if age is None]
+    checked = {uid: age for uid, age in staleness.items() if age is not None}
+    if checked:
+        stalest = max(checked, key=checked.get)
+        _LOGGER.info(f"追更查询进度：最久未查询的是 {stalest}（{checked[stalest] / 60:.0f}分钟前），还有{len(never)}个up主从未查询")
+    paused = scheduler.paused_for()
+    if paused:
+        _LOGGER.info(f"风控暂停中，{paused / 60:.0f}分钟后恢复查询")
+
 
 class ListenUploadVideo:
     """查询用户是否发新视频，配合定时任务使用"""
@@ -13,51 +300,9 @@ class ListenUploadVideo:
 
     async def listen_no_pages_video_new(self):
         """
+        逐个查询单个up主的投稿，只在动态读取不到时使用
         官方没有给查看分p上传时间的接口，遇到分p视频直接ignore，并通知用户自行下载
-        so bilibili fuck you!
         """
-        # _LOGGER.info(f"开始查询用户 {self.uid} 是否上传新视频")
-        if not os.path.exists(f"{local_path}/listen_up.json"):
-            await self.save_data(f"{local_path}/listen_up.json")
-        elif not await self.verify_json(f"{local_path}/listen_up.json"):
-            await self.save_data(f"{local_path}/listen_up.json")
-        await self.load_data(f"{local_path}/listen_up.json")
-        if not await self.query_data(uid=self.uid):
-            await self.modify_data(
-                uid=self.uid, time=int(datetime.datetime.now().timestamp()), mode="add"
-            )
-        all_video = await user.User(credential=credential, uid=self.uid).get_videos(
-            ps=50
-        )
-        video_list = all_video["list"]["vlist"]
-        for v in reversed(video_list):
-            if await self.query_data(self.uid) is not None and self.compare_time(
-                    v["created"], await self.query_data(self.uid)
-            ):
-                t = await self.query_data(self.uid)
-                video_info = await video.Video(bvid=v["bvid"]).get_info()
-                if len(await video.Video(bvid=v["bvid"]).get_pages()) > 1:
-                    _LOGGER.info(f"用户{self.uid}发布了分p视频，忽略")
-                    await self.modify_data(self.uid, v["created"], "update")
-                    Notify(video_info).send_pages_video_notify()
-                    await self.save_data(f"{local_path}/listen_up.json")
-                    continue
-                else:
-                    _LOGGER.info(f"用户 {self.uid} 发布了新视频：{video_info['title']}  开始下载")
-                    res = await BilibiliProcess(
-                        v["bvid"],
-                        if_get_character=self.if_get_character,
-                        media_path=self.media_path,
-                        emby_persons_path=self.emby_persons_path,
-                    ).process()
-                    if res:
-                        await self.modify_data(self.uid, v["created"], "update")
-                        await self.save_data(f"{local_path}/listen_up.json")
-                    continue
-            elif await self.query_data(self.uid) is None:
-                await self.modify_data(self.uid, v["created"], "add")
-                await self.save_data(f"{local_path}/listen_up.json")
-                continue
-            elif not self.compare_time(v["created"], await self.query_data(self.uid)):
-                await self.save_data(f"{local_path}/listen_up.json")
-                continue
\ No newline at end of file
+        credential = global_value.get_value("credential")
+        for new_video in await poll_uploader(int(self.uid), credential):
+            await save_new_video(new_video)
@@ -0,0 +1,130 @@
+"""登录账号的关注列表缓存
+
+关注列表保存在followings.json中，有效期内直接使用缓存。过期后先只请求第一页：
+关注列表按关注时间从新到旧排列，第一页和总数都没变时说明关注列表没变，不再请求后面的页；
+有变化时并发请求所有页，并返回新增和取消关注的up主。
+"""
+import asyncio
+import math
+import os
+import json
+import threading
+import time
+
+from bilibili_api import user
+
+from plugins.BilibiliDownloader.core import poll_scheduler, failure_taxonomy
+from plugins.BilibiliDownloader.utils import LOGGER, files, fs
+from plugins.BilibiliDownloader.utils.rate_limiter import API_LIMITER
+
+_LOGGER = LOGGER
+FOLLOWINGS_PATH = f"{files.local_path}/followings.json"
+FOLLOWINGS_TTL = 6 * 3600  # 缓存有效期
+PAGE_SIZE = 50  # b站每页最多返回50个
+FETCH_CONCURRENCY = 4  # 同时请求的页数，真正的请求频率由API_LIMITER控制
+
+
+class FollowingCache:
+    def __init__(self, path: str = FOLLOWINGS_PATH, ttl: float = FOLLOWINGS_TTL):
+        """
+        :param path: 缓存文件路径
+        :param ttl: 缓存有效期（秒）
+        """
+        self.path = path
+        self.ttl = ttl
+        self._data = None  # {"uid": 账号uid, "fetched_at": 获取时间, "total": 关注总数, "followings": [uid]}
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self) -> dict:
+        if self._data is None:
+            data = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except (ValueError, OSError):
+                    _LOGGER.warning(f"关注列表缓存无法解析，重新获取：{self.path}")
+            self._data = data
+        return self._data
+
+    def cached(self, account_uid: int) -> list[int] | None:
+        """缓存的关注列表（不管是否过期），没有这个账号的缓存时为None"""
+        with self._lock:
+            data = self._ensure_loaded()
+            return list(data["followings"]) if data.get("uid") == int(account_uid) else None
+
+    def _is_fresh(self, account_uid: int, now: float) -> bool:
+        with self._lock:
+            data = self._ensure_loaded()
+            return data.get("uid") == int(account_uid) and now - data.get("fetched_at", 0) < self.ttl
+
+    def _save(self, account_uid: int, followings: list[int], total: int, now: float) -> None:
+        with self._lock:
+            self._data = {"uid": int(account_uid), "fetched_at": now, "total": total, "followings": followings}
+            files.write_json_atomic(self.path, self._data)
+
+    async def get(self, credential, now: float = None, force: bool = False) -> tuple[list[int], set[int], set[int]]:
+        """获取关注列表
+
+        :param credential: 登录凭据
+        :param now: 当前时间戳
+        :param force: 忽略有效期，重新检查
+        :return: (关注列表, 新增的up主, 取消关注的up主)，请求失败时返回缓存，新增和取消为空
+        """
+        now = time.time() if now is None else now
+        account_uid = int(credential.dedeuserid)
+        cached = await fs.run(self.cached, account_uid)
+        if not force and cached is not None and await fs.run(self._is_fresh, account_uid, now):
+            return cached, set(), set()
+        scheduler = poll_scheduler.get_poll_scheduler()
+        if cached is not None and scheduler.paused_for(now) > 0:
+            return cached, set(), set()
+        try:
+            followings, total = await self._fetch(credential, account_uid, cached)
+        except Exception as e:
+            _LOGGER.exception("获取关注列表失败，使用缓存的关注列表")
+            if failure_taxonomy.classify(e) is failure_taxonomy.FailureKind.RISK_CONTROL:
+                scheduler.report_risk_control()
+            return cached or [], set(), set()
+        await fs.run(self._save, account_uid, followings, total, now)
+        added = set(followings) - set(cached or [])
+        removed = set(cached or []) - set(followings)
+        if added or removed:
+            _LOGGER.info(f"关注列表有变化，新增：{sorted(added)}，取消关注：{sorted(removed)}")
+        return followings, added, removed
+
+    async def _fetch(self, credential, account_uid: int, cached: list[int] | None) -> tuple[list[int], int]:
+        # API_LIMITER只限制瞬时频率，每个请求还要计入追更查询的预算
+        scheduler = poll_scheduler.get_poll_scheduler()
+        up = user.User(credential=credential, uid=account_uid)
+        scheduler.charge()
+        await API_LIMITER.acquire()
+        first = await up.get_followings(pn=1, ps=PAGE_SIZE)
+        total = first.get("total", 0)
+        first_page = [int(i["mid"]) for i in first.get("list") or []]
+        with self._lock:
+            cached_total = self._ensure_loaded().get("total")
+        if cached is not None and total == cached_total and cached[:len(first_page)] == first_page:
+            _LOGGER.info("关注列表第一页和总数都没有变化，沿用缓存")
+            return cached, total
+        sem = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+        async def fetch_page(pn: int) -> list[int]:
+            async with sem:
+                scheduler.charge()
+                await API_LIMITER.acquire()
+                res = await up.get_followings(pn=pn, ps=PAGE_SIZE)
+            return [int(i["mid"]) for i in res.get("list") or []]
+
+        pages = await asyncio.gather(*(fetch_page(pn) for pn in range(2, math.ceil(total / PAGE_SIZE) + 1)))
+        followings = list(dict.fromkeys(first_page + [uid for page in pages for uid in page]))
+        _LOGGER.info(f"获取到关注列表，共{len(followings)}个up主")
+        return followings, total
+
+
+_following_cache = FollowingCache()
+
+
+def get_following_cache() -> FollowingCache:
+    """插件全局共用的关注列表缓存"""
+    return _following_cache
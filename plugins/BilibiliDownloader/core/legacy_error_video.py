@@ -0,0 +1,104 @@
+"""旧版下载流程（bilibili_main、process_pages_video）使用的失败视频记录
+
+记录仍然保存在error_video.txt中（每行 "BV号 P分P"），但只在第一次使用时读取一次，
+之后的查询都在内存里的集合中完成，新增记录追加写入文件，删除记录时原子地重写文件。
+"""
+import os
+import re
+import threading
+
+from plugins.BilibiliDownloader.utils import LOGGER, fs
+
+_LOGGER = LOGGER
+LINE_PATTERN = re.compile(r"^(\S+) P(\d+)$")
+
+
+class LegacyErrorVideoSet:
+    def __init__(self, path: str):
+        """
+        :param path: error_video.txt路径
+        """
+        self.path = path
+        self._entries = None  # (bvid, 分P) -> None，按写入顺序保存
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._entries is not None
+
+    def load(self) -> None:
+        """读取error_video.txt，只在第一次调用时读取"""
+        with self._lock:
+            self._ensure_loaded()
+
+    def _ensure_loaded(self) -> dict:
+        if self._entries is None:
+            entries = {}
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        match = LINE_PATTERN.match(line.strip())
+                        if match is None:
+                            if line.strip():
+                                _LOGGER.warning(f"error_video.txt中有无法识别的记录，已忽略：{line.strip()}")
+                            continue
+                        entries[(match.group(1), int(match.group(2)))] = None
+            self._entries = entries
+        return self._entries
+
+    def _rewrite(self) -> None:
+        content = "".join(f"{bvid} P{page}\n" for bvid, page in self._entries)
+        fs.write_bytes_atomic(self.path, content.encode("utf-8"))
+
+    def contains(self, bvid: str, page: int = 0) -> bool:
+        """是否有这个视频（分P）的失败记录"""
+        with self._lock:
+            return (bvid, int(page)) in self._ensure_loaded()
+
+    def add(self, bvid: str, page: int = 0) -> bool:
+        """记录一次失败，已经记录过的不再重复写入
+
+        :return: 是否是新记录
+        """
+        key = (bvid, int(page))
+        with self._lock:
+            entries = self._ensure_loaded()
+            if key in entries:
+                return False
+            entries[key] = None
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(f"{bvid} P{key[1]}\n")
+            return True
+
+    def remove(self, bvid: str, page: int = None) -> int:
+        """删除失败记录
+
+        :param bvid: 视频bvid
+        :param page: 分P，为空时删除该视频的所有记录
+        :return: 删除的记录数
+        """
+        with self._lock:
+            entries = self._ensure_loaded()
+            keys = [key for key in entries if key[0] == bvid and (page is None or key[1] == int(page))]
+            for key in keys:
+                del entries[key]
+            if keys:
+                self._rewrite()
+            return len(keys)
+
+    def entries(self) -> list[tuple[str, int]]:
+        """按写入顺序列出所有记录"""
+        with self._lock:
+            return list(self._ensure_loaded())
+
+
+_legacy_error_videos = {}
+_legacy_error_videos_lock = threading.Lock()
+
+
+def get_legacy_error_videos(path: str) -> LegacyErrorVideoSet:
+    """进程内共用的失败视频记录，同一个文件只加载一次"""
+    with _legacy_error_videos_lock:
+        if path not in _legacy_error_videos:
+            _legacy_error_videos[path] = LegacyErrorVideoSet(path)
+        return _legacy_error_videos[path]
@@ -0,0 +1,344 @@
+"""媒体库索引，记录已经下载到媒体库里的视频，保存在SQLite中
+
+第一次使用时扫描媒体库里nfo的<id>标签建立索引，之后每次发布视频时只写入（或删除）这一条记录，媒体库再大也不用重写整个索引。
+下载任务开始前查一次索引就能知道该跳过还是升级画质，不用再重新下载一遍。
+旧版本的library_index.json会在第一次打开时导入，导入后改名为library_index.json.migrated。
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from lxml import etree
+
+from plugins.BilibiliDownloader.utils import LOGGER, files
+
+_LOGGER = LOGGER
+INDEX_PATH = f"{files.local_path}/library_index.db"
+LEGACY_INDEX_PATH = f"{files.local_path}/library_index.json"
+SCHEMA_VERSION = 1
+BV_PATTERN = re.compile(r"^BV[0-9A-Za-z]{10}$")
+NFO_KIND = {"video": "movie", "movie": "movie", "episodedetails": "episode"}  # nfo根节点 -> 媒体类型
+SKIP_DIRS = {"tmp", "character"}  # 插件自己的临时目录，不属于媒体库
+_ITER_CHUNK = 500  # 遍历记录时每次查询的条数
+
+
+class LibraryIndex:
+    def __init__(self, index_path: str = INDEX_PATH, legacy_json_path: str = None):
+        """媒体库索引
+
+        每个视频的每一P一行，记录包含媒体库路径、清晰度、大小、附属文件等
+
+        :param index_path: 数据库文件路径
+        :param legacy_json_path: 旧版本的library_index.json路径，存在时导入
+        """
+        self.index_path = index_path
+        self.legacy_json_path = legacy_json_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """第一次使用时打开数据库，建表并导入旧索引"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            conn = sqlite3.connect(self.index_path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._migrate(conn)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn: sqlite3.Connection):
+        """写事务，出错时回滚"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            with self._transaction(conn):
+                conn.execute("CREATE TABLE IF NOT EXISTS index_meta (key TEXT PRIMARY KEY, value INTEGER) WITHOUT ROWID")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS record (bvid TEXT NOT NULL, page INTEGER NOT NULL, "
+                    "path TEXT, data TEXT NOT NULL, PRIMARY KEY (bvid, page)) WITHOUT ROWID"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS record_path ON record (path)")
+                imported = self._import_legacy_json(conn)
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            if imported:
+                # 提交成功后才改名，导入失败时下次启动还能重新导入
+                os.replace(self.legacy_json_path, f"{self.legacy_json_path}.migrated")
+
+    def _import_legacy_json(self, conn: sqlite3.Connection) -> bool:
+        """导入旧版本的library_index.json，格式为 {bvid: {分P序号(str): 记录}}"""
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return False
+        try:
+            with open(self.legacy_json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (ValueError, OSError):
+            # 旧索引损坏时不导入，之后重新扫描媒体库建立索引
+            _LOGGER.exception(f"旧的媒体库索引无法解析，跳过导入：{self.legacy_json_path}")
+            return False
+        rows = [(bvid, int(page), record) for bvid, pages in data.items() for page, record in pages.items()]
+        self._insert(conn, rows)
+        self._mark_built(conn)
+        _LOGGER.info(f"已从library_index.json导入 {len(rows)} 条媒体库索引记录")
+        return True
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, rows: list[tuple[str, int, dict]]) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO record (bvid, page, path, data) VALUES (?, ?, ?, ?)",
+            [(bvid, page, record.get("path"), json.dumps(record, ensure_ascii=False)) for bvid, page, record in rows],
+        )
+
+    @staticmethod
+    def _mark_built(conn: sqlite3.Connection) -> None:
+        conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES ('built', ?)", (int(time.time()),))
+
+    def is_built(self) -> bool:
+        """索引是否已经建立过，已经写入过记录的也算"""
+        with self._lock:
+            return self._connect().execute(
+                "SELECT EXISTS (SELECT 1 FROM index_meta WHERE key = 'built') OR EXISTS (SELECT 1 FROM record)"
+            ).fetchone()[0] == 1
+
+    def get(self, bvid: str, page: int = 0) -> dict | None:
+        """查询某个视频（分P）在媒体库中的记录
+
+        :param bvid: 视频bvid
+        :param page: 分P序号，从0开始
+        :return: 记录，不存在返回None
+        """
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT data FROM record WHERE bvid = ? AND page = ?", (bvid, int(page))
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def has(self, bvid: str, page: int = 0) -> bool:
+        """视频是否已在媒体库中，记录存在但视频文件被用户删了的也算不在
+
+        :param bvid: 视频bvid
+        :param page: 分P序号，从0开始
+        """
+        record = self.get(bvid, page)
+        if record is None:
+            return False
+        if record.get("media") and not os.path.exists(record["media"]):
+            _LOGGER.info(f"{bvid} P{page + 1} 在索引中但媒体文件已不存在，移除索引记录")
+            self.remove(bvid, page)
+            return False
+        return True
+
+    def needs_download(self, bvid: str, page: int = 0, best_quality: int = None) -> bool:
+        """判断是否需要下载：不在媒体库中，或者媒体库中的清晰度低于当前能下载到的最高清晰度
+
+        :param bvid: 视频bvid
+        :param page: 分P序号，从0开始
+        :param best_quality: 当前账号能下载到的最高清晰度代码，为空时只判断是否存在
+        """
+        if not self.has(bvid, page):
+            return True
+        quality = self.get(bvid, page).get("quality")
+        if best_quality is None or quality is None:
+            return False
+        if quality < best_quality:
+            _LOGGER.info(f"{bvid} P{page + 1} 媒体库中清晰度为 {quality}，可升级到 {best_quality}")
+            return True
+        return False
+
+    def record(
+            self,
+            bvid: str,
+            page: int,
+            path: str,
+            media: str = None,
+            nfo: str = None,
+            kind: str = "movie",
+            quality: int = None,
+            size: int = None,
+            cid: int = None,
+            artifacts: list[str] = None,
+            **extra,
+    ) -> None:
+        """发布到媒体库后写入记录
+
+        :param bvid: 视频bvid
+        :param page: 分P序号，从0开始
+        :param path: 媒体库中的目录
+        :param media: 视频文件路径
+        :param nfo: nfo文件路径
+        :param kind: movie或episode
+        :param quality: 清晰度代码
+        :param size: 视频大小
+        :param cid: 分P的cid
+        :param artifacts: 同一个视频的所有文件名（nfo、封面、弹幕、字幕等）
+        :param extra: 其他需要一起记录的信息
+        """
+        if size is None and media and os.path.exists(media):
+            size = os.path.getsize(media)
+        record = {
+            "path": path,
+            "media": media,
+            "nfo": nfo,
+            "kind": kind,
+            "quality": quality,
+            "size": size,
+            "cid": cid,
+            "artifacts": artifacts or [],
+            "updated": int(time.time()),
+        }
+        record.update(extra)
+        with self._lock:
+            conn = self._connect()
+            with self._transaction(conn):
+                self._insert(conn, [(bvid, int(page), record)])
+
+    def remove(self, bvid: str, page: int = 0) -> None:
+        """删除记录"""
+        with self._lock:
+            conn = self._connect()
+            with self._transaction(conn):
+                conn.execute("DELETE FROM record WHERE bvid = ? AND page = ?", (bvid, int(page)))
+
+    def relocate(self, old_path: str, new_path: str) -> int:
+        """目录在媒体库中被移动后，更新所有位于该目录下的记录
+
+        :param old_path: 原目录
+        :param new_path: 新目录
+        :return: 更新的记录数量
+        """
+        with self._lock:
+            conn = self._connect()
+            with self._transaction(conn):
+                rows = []
+                for bvid, page, data in conn.execute(
+                        "SELECT bvid, page, data FROM record WHERE path = ?", (old_path,)
+                ).fetchall():
+                    record = json.loads(data)
+                    for key in ("path", "media", "nfo"):
+                        if record.get(key):
+                            record[key] = new_path + record[key][len(old_path):]
+                    rows.append((bvid, page, record))
+                self._insert(conn, rows)
+        return len(rows)
+
+    def iter_records(self):
+        """逐条遍历所有记录，返回 (bvid, 分P序号, 记录)，每次只查询一批，遍历期间不长时间占用锁"""
+        last = ("", -1)
+        while True:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT bvid, page, data FROM record WHERE (bvid, page) > (?, ?) ORDER BY bvid, page LIMIT ?",
+                    (*last, _ITER_CHUNK),
+                ).fetchall()
+            for bvid, page, data in rows:
+                yield bvid, page, json.loads(data)
+            if len(rows) < _ITER_CHUNK:
+                return
+            last = rows[-1][:2]
+
+    def build(self, media_path: str) -> int:
+        """扫描媒体库中nfo的<id>标签重建索引
+
+        :param media_path: 媒体库路径
+        :return: 索引到的视频数量
+        """
+        _LOGGER.info(f"开始扫描媒体库 {media_path} 建立索引")
+        rows = []
+        show_ids = {}
+        for dirpath, dirnames, filenames in os.walk(media_path):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            for filename in filenames:
+                if not filename.endswith(".nfo"):
+                    continue
+                record = _read_nfo_record(dirpath, filename, filenames, show_ids)
+                if record is not None:
+                    rows.append((record.pop("bvid"), record.pop("page"), record))
+        with self._lock:
+            conn = self._connect()
+            with self._transaction(conn):
+                conn.execute("DELETE FROM record")
+                self._insert(conn, rows)
+                self._mark_built(conn)
+        _LOGGER.info(f"媒体库索引建立完成，共 {len(rows)} 条记录")
+        return len({bvid for bvid, _, _ in rows})
+
+    def ensure_built(self, media_path: str) -> None:
+        """索引还没建立时扫描一次媒体库"""
+        if not self.is_built() and media_path and os.path.exists(media_path):
+            self.build(media_path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _read_show_id(show_path: str, show_ids: dict) -> str | None:
+    """剧集目录下tvshow.nfo的<id>，同一个目录只读取一次"""
+    if show_path not in show_ids:
+        try:
+            show_ids[show_path] = (etree.parse(os.path.join(show_path, "tvshow.nfo")).getroot().findtext("id") or "").strip()
+        except (etree.XMLSyntaxError, OSError):
+            show_ids[show_path] = None
+    return show_ids[show_path]
+
+
+def _read_nfo_record(dirpath: str, filename: str, siblings: list[str], show_ids: dict = None) -> dict | None:
+    """从一个nfo文件生成索引记录，不是本插件生成的视频nfo返回None
+
+    分P视频的每一集和剧集的tvshow.nfo是同一个bvid，用集数还原分P序号；
+    UP主文件夹模式下每个视频是UP主剧集中的一集，集数和分P无关，分P序号为0
+    """
+    nfo_path = os.path.join(dirpath, filename)
+    try:
+        root = etree.parse(nfo_path).getroot()
+    except (etree.XMLSyntaxError, OSError):
+        return None
+    kind = NFO_KIND.get(root.tag)
+    bvid = (root.findtext("id") or "").strip()
+    if kind is None or not BV_PATTERN.match(bvid):
+        return None
+    stem = filename[: -len(".nfo")]
+    media = os.path.join(dirpath, f"{stem}.mp4")
+    episode = root.findtext("episode")
+    episode = int(episode) if episode and episode.isdigit() else None
+    page = 0
+    if kind == "episode" and episode and _read_show_id(os.path.dirname(dirpath), {} if show_ids is None else show_ids) == bvid:
+        page = episode - 1
+    return {
+        "bvid": bvid,
+        "page": page,
+        "path": dirpath,
+        "media": media if os.path.exists(media) else None,
+        "nfo": nfo_path,
+        "kind": kind,
+        "quality": None,
+        "size": os.path.getsize(media) if os.path.exists(media) else None,
+        "cid": None,
+        "artifacts": [name for name in siblings if name.startswith(stem)],
+        "updated": int(time.time()),
+        "episode": episode,
+    }
+
+
+_library_index = LibraryIndex(INDEX_PATH, LEGACY_INDEX_PATH)
+
+
+def get_library_index() -> LibraryIndex:
+    """插件全局共用的媒体库索引"""
+    return _library_index
@@ -1,16 +1,27 @@
 """基于download_and_scraper，处理并移动下载刮削后的视频文件，使其符合用户所选择的文件夹风格"""
-import enum
 import os
-import shutil
+import threading
 
-from aiofiles import os as aios
-
-from plugins.BilibiliDownloader.core import nfo_generator, public_function, download_and_scraper
+from plugins.BilibiliDownloader.core import nfo_generator, public_function, download_and_scraper, library_index, \
+    playurl_cache, episode_index, uploader_cache, season_layout, publisher, metadata_archive, failure_taxonomy
 from plugins.BilibiliDownloader.mr import mr_notify
-from plugins.BilibiliDownloader.utils import LOGGER, files, others
+from plugins.BilibiliDownloader.utils import LOGGER, files, others, fs
 
 _LOGGER = LOGGER
 SaveVideoMode = others.MediaSaveMode
+_running_jobs = 0  # 正在执行的下载任务数，重试时根据它决定一次提交多少个视频
+_running_jobs_lock = threading.Lock()
+
+
+def running_jobs() -> int:
+    """正在执行的下载任务数"""
+    return _running_jobs
+
+
+def _add_running_jobs(delta: int) -> None:
+    global _running_jobs
+    with _running_jobs_lock:
+        _running_jobs += delta
 
 # class SaveVideoMode(enum.Enum):
 #     """保存视频的文件夹样式"""
@@ -22,7 +33,9 @@ class SaveOneVideo:
     bvid = ""
     page = 0
     def __init__(self, mode: SaveVideoMode, bvid: str, media_path: str, scraper_people: bool,
-                 emby_people_path: str = None):
+                 emby_people_path: str = None, video_info: dict = None, video_object: object = None,
+                 season_layout_mode: others.SeasonLayout = others.SeasonLayout.SINGLE,
+                 season_chunk_size: int = season_layout.DEFAULT_CHUNK_SIZE):
         """下载视频入口函数
 
         :param mode: 保存视频的文件夹样式
@@ -30,86 +43,194 @@ class SaveOneVideo:
         :param media_path: 媒体库路径（所有视频公用路径）
         :param scraper_people: 是否刮削up主
         :param emby_people_path: up主文件夹路径
+        :param video_info: 已经获取过的视频信息，传入后不再重复请求
+        :param video_object: 与video_info对应的视频对象
+        :param season_layout_mode: UP主文件夹模式下的分季方式
+        :param season_chunk_size: 按集数分季时每季的集数
         """
-        self.video_object = None
+        self.video_object = video_object
         self.title = None
-        self.video_info = None
+        self.video_info = video_info
         self.mode = mode
         self.bvid = bvid
         self.media_path = media_path
         self.scraper_people = scraper_people
         self.emby_people_path = emby_people_path
+        self.stream_info = {}
+        self.season_layout_mode = season_layout_mode or others.SeasonLayout.SINGLE
+        self.season_chunk_size = season_chunk_size or season_layout.DEFAULT_CHUNK_SIZE
+        self.video_path = None  # 视频在媒体库中的目录
+        self.created_video_path = False  # 媒体库目录是否是这次新建的，失败时只删除新建的目录
         SaveOneVideo.bvid = bvid
 
     async def get_video_info(self):
         """获取视频信息"""
-        res = await public_function.get_video_info(self.bvid)
-        if not res:
-            return False
-        self.video_info, self.video_object = res
+        if self.video_info is None or self.video_object is None:
+            res = await public_function.get_video_info(self.bvid)
+            if not res:
+                return False
+            self.video_info, self.video_object = res
         self.title = self.video_info["title"]
         self.folder_name = self.video_info['owner']['name'] + "-" + str(self.video_info["owner"]["mid"])
 
     async def get_uploader_info(self):
-        self.uploader_info = await public_function.get_uploader_info(self.video_info["owner"]["mid"])
+        self.uploader_info = await uploader_cache.get_uploader_info(self.video_info["owner"]["mid"])
+        if not self.uploader_info:
+            raise Exception(f"获取UP主信息失败：{self.video_info['owner']['mid']}")
 
     async def _save_uploader_folder_style_video(self):
-        path = f"{self.media_path}/{self.folder_name}/Season 1/{self.title}"
+        show_path = f"{self.media_path}/{self.folder_name}"
+        # 先分配集数再决定放在哪一季，下载失败重试时还会拿到同一个集数
+        episode = await self._allocate_episode(show_path)
+        season = season_layout.season_number(
+            self.season_layout_mode, self.video_info["pubdate"], episode, self.season_chunk_size
+        )
+        path = f"{season_layout.season_dir(show_path, season)}/{self.title}"
+        self.video_path = path
+        # 升级清晰度时媒体库里已经有这个视频，失败了也要保留原来的文件
+        self.created_video_path = not await fs.exists(path)
         tmp_path = f"{self.media_path}/tmp/{self.title}"
         _LOGGER.info(f"视频保存路径：{path}")
-        if not await aios.path.exists(path):
-            os.makedirs(path)
-        if not await aios.path.exists(tmp_path):
-            os.makedirs(tmp_path)
-        await download_and_scraper.ProcessNormalVideo(bvid=self.bvid, video_path=tmp_path, scraper_people=self.scraper_people,
-                                               emby_people_path=self.emby_people_path, video_info=self.video_info,
-                                               video_object=self.video_object).run()
+        await fs.batch((os.makedirs, path, 0o777, True), (os.makedirs, tmp_path, 0o777, True))
+        await self._download_and_scrape(tmp_path)
+        # 剧集模式下不需要电影nfo和fanart，在临时目录里处理好再移动，媒体库里已有的文件不会被无谓地改动
+        await fs.batch(
+            (os.remove, tmp_path + f"/{self.title}.nfo"),
+            (os.rename, tmp_path + "/poster.jpg", tmp_path + f"/{self.title}-thumb.jpg"),
+            (os.remove, tmp_path + "/fanart.jpg"),
+        )
         await self._move_video_to_folder(path)
-        await aios.remove(path + f"/{self.title}.nfo")
-        await aios.rename(path + "/poster.jpg", path + f"/{self.title}-thumb.jpg")
-        await aios.remove(path + "/fanart.jpg")
-        nfo = nfo_generator.NfoGenerator(self.uploader_info, uploader_folder_mode=True)
-        tvshow = await nfo.gen_tvshow_nfo_by_uploader()
-        if await aios.path.exists(path + "/../../tvshow.nfo"):
-            await aios.remove(path + "/../../tvshow.nfo")
-        await nfo.save_nfo(tvshow, path + "/../../tvshow.nfo")
-        video_num = await files.count_folder_num(path + "/../")
-        nfo = nfo_generator.NfoGenerator(self.video_info, page=video_num-1)
+        nfo = nfo_generator.NfoGenerator(
+            self.video_info, episode=episode, season=season, streams=self.stream_info.get("streams")
+        )
         episode_detail = await nfo.gen_episodedetails_nfo()
         await nfo.save_nfo(episode_detail, path + f"/{self.title}.nfo")
-        await public_function.download_uploader_face(self.uploader_info["face"], path + "/../../", "fanart")
-        shutil.copy(path + "/../../" + "fanart.jpg", path + "/../../" + "poster.jpg")
-        _LOGGER.info(f"视频保存成功：{path}")
+        await self._refresh_series_metadata(show_path)
+        await self._record_library_index(path, "episode")
+        _LOGGER.info(f"视频保存成功：{path}，{nfo_generator.NFO_WRITE_STATS.report()}")
+
+    async def _refresh_series_metadata(self, show_path):
+        """UP主名称、签名、头像有变化（或文件缺失）时才重写tvshow.nfo和封面，避免媒体服务器反复重新扫描整部剧集"""
+        index = episode_index.get_episode_index(self.video_info["owner"]["mid"])
+        content_hash = uploader_cache.series_hash(self.uploader_info)
+        series_files = ("tvshow.nfo", "fanart.jpg", "poster.jpg")
+        if index.get_series_hash() == content_hash and all(
+                await fs.batch(*[(os.path.exists, f"{show_path}/{name}") for name in series_files])):
+            _LOGGER.info(f"UP主信息没有变化，跳过更新tvshow.nfo和封面：{show_path}")
+            return
+        _LOGGER.info(f"UP主信息有变化，更新tvshow.nfo和封面：{show_path}")
+        nfo = nfo_generator.NfoGenerator(self.uploader_info, uploader_folder_mode=True)
+        tvshow = await nfo.gen_tvshow_nfo_by_uploader()
+        await nfo.save_nfo(tvshow, f"{show_path}/tvshow.nfo")
+        if not await public_function.download_uploader_face(self.uploader_info["face"], show_path, "fanart"):
+            return  # 头像没下载成功时不记录哈希，下次再试
+        await fs.copy(f"{show_path}/fanart.jpg", f"{show_path}/poster.jpg")
+        await fs.run(metadata_archive.save_uploader_info, self.uploader_info["mid"], self.uploader_info)
+        await fs.run(index.set_series_hash, content_hash)
+
+    async def _record_failure(self, kind: failure_taxonomy.FailureKind, page: int = 0):
+        """按失败分类记录错误视频，不会再成功的视频隔离并只通知一次
+
+        :param kind: 失败分类
+        :param page: 分P序号，从0开始，单P视频为0
+        """
+        try:
+            if await failure_taxonomy.record_failure(self.bvid, page, kind):
+                reason = failure_taxonomy.policy_for(kind).reason
+                await mr_notify.Notify(self.video_info).send_quarantine_notify(self.bvid, reason)
+        except Exception:
+            _LOGGER.exception(f"写入错误视频记录失败：{self.bvid}，该视频下载任务跳过并发送下载失败通知")
+            await mr_notify.Notify(self.video_info).send_error_video_notify()
+
+    async def _allocate_episode(self, show_path) -> int:
+        """从UP主的集数索引中取得集数，第一次使用时从UP主文件夹中已有的nfo建立索引"""
+        index = episode_index.get_episode_index(self.video_info["owner"]["mid"])
+        await fs.run(index.ensure_built, show_path)
+        episode = await fs.run(index.allocate, self.bvid, self.video_info["pubdate"])
+        _LOGGER.info(f"视频集数：第{episode}集")
+        return episode
 
     async def _save_normal_style_video(self):
         tmp_path = f"{self.media_path}/tmp/{self.title}"
         path = f"{self.media_path}/{self.title}"
+        self.video_path = path
+        # 升级清晰度时媒体库里已经有这个视频，失败了也要保留原来的文件
+        self.created_video_path = not await fs.exists(path)
         _LOGGER.info(f"视频保存路径：{path}")
-        if not await aios.path.exists(path):
-            os.makedirs(path)
-        if not await aios.path.exists(tmp_path):
-            os.makedirs(tmp_path)
+        await fs.batch((os.makedirs, path, 0o777, True), (os.makedirs, tmp_path, 0o777, True))
         # raise Exception("这是一个人为制造的异常，用于测试异常处理")
-        await download_and_scraper.ProcessNormalVideo(bvid=self.bvid, video_path=tmp_path, scraper_people=self.scraper_people,
-                                               emby_people_path=self.emby_people_path, video_info=self.video_info,
-                                               video_object=self.video_object).run()
+        await self._download_and_scrape(tmp_path)
         await self._move_video_to_folder(path)
-        _LOGGER.info(f"视频保存成功：{path}")
+        await self._record_library_index(path, "movie")
+        _LOGGER.info(f"视频保存成功：{path}，{nfo_generator.NFO_WRITE_STATS.report()}")
+
+    async def _download_and_scrape(self, tmp_path):
+        """下载刮削到临时目录"""
+        processor = download_and_scraper.ProcessNormalVideo(bvid=self.bvid, video_path=tmp_path,
+                                                            scraper_people=self.scraper_people,
+                                                            emby_people_path=self.emby_people_path,
+                                                            video_info=self.video_info,
+                                                            video_object=self.video_object)
+        await processor.run()
+        self.stream_info = processor.stream_info
+
+    async def _need_download(self) -> bool:
+        """查询媒体库索引，判断视频是否需要下载（不在媒体库中，或者可以升级清晰度）"""
+        index = library_index.get_library_index()
+        await fs.run(index.ensure_built, self.media_path)
+        if not await fs.run(index.has, self.bvid):
+            return True
+        if index.get(self.bvid).get("quality") is None:
+            return False
+        playurl = await playurl_cache.get_download_url(self.video_object)
+        best_quality = playurl_cache.select_stream(playurl, "video").get("id")
+        return await fs.run(index.needs_download, self.bvid, best_quality=best_quality)
+
+    async def _record_library_index(self, path, kind):
+        """视频保存到媒体库后更新索引，并归档原始元数据供之后离线重新生成nfo"""
+        await fs.run(metadata_archive.save_video_info, self.bvid, self.video_info)
+        await fs.run(
+            library_index.get_library_index().record,
+            self.bvid,
+            0,
+            path,
+            media=f"{path}/{self.title}.mp4",
+            nfo=f"{path}/{self.title}.nfo",
+            kind=kind,
+            quality=self.stream_info.get("quality"),
+            cid=self.stream_info.get("cid"),
+            artifacts=await fs.listdir(path),
+            streams=self.stream_info.get("streams"),
+        )
 
     async def _move_video_to_folder(self, path):
-        """移动全部文件到指定文件夹并删除tmp文件夹"""
-        for file in os.listdir(f"{self.media_path}/tmp/{self.title}"):
-            await aios.rename(f"{self.media_path}/tmp/{self.title}/{file}", f"{path}/{file}")
-        await aios.removedirs(f"{self.media_path}/tmp/{self.title}")
+        """移动全部文件到指定文件夹并删除tmp文件夹，内容没变的nfo保留媒体库中原来的文件"""
+        tmp_path = f"{self.media_path}/tmp/{self.title}"
+        await publisher.publish_files(tmp_path, path, await fs.listdir(tmp_path))
+        await fs.removedirs(tmp_path)
 
 
     # @decorators.handle_error(record_error_video=True, remove_error_video_folder=True, record_video_bvid=bvid, remove_error_video_path=f"{self.media_path}/tmp/{self.title}")
     async def run(self) -> bool:
+        _add_running_jobs(1)
+        failure_taxonomy.forget()
+        try:
+            return await self._run()
+        finally:
+            _add_running_jobs(-1)
+
+    async def _run(self) -> bool:
         try:
             _LOGGER.info(f"下载刮削程序启动：{self.bvid}")
-            if not await aios.path.exists(f"{self.media_path}/tmp"):
-                os.makedirs(f"{self.media_path}/tmp")
-            await self.get_video_info()
+            await fs.makedirs(f"{self.media_path}/tmp")
+            if await self.get_video_info() is False:
+                kind = failure_taxonomy.classify(None)
+                _LOGGER.error(f"获取视频信息失败：{self.bvid}，失败原因：{kind.value}")
+                await self._record_failure(kind, page=0)
+                return False
+            if not await self._need_download():
+                _LOGGER.info(f"视频已在媒体库中，跳过下载：{self.bvid}")
+                return True
             if self.mode == SaveVideoMode.UP_FOLDER_STYLE:
                 _LOGGER.info(f"视频保存模式：UP主文件夹模式 干活了干活了")
                 await self.get_uploader_info()
@@ -118,19 +239,14 @@ class SaveOneVideo:
                 _LOGGER.info(f"视频保存模式：普通模式 干活了干活了")
                 await self._save_normal_style_video()
             return True
-        except Exception:
-            _LOGGER.exception(f"下载刮削程序错误：{self.bvid}，删除文件目录，等待重试")
-            if await files.ErrorVideoController().write_error_video(self.bvid, self.page) is False:
-                _LOGGER.error(f"写入错误视频文件失败：{self.bvid}，请按照上方错误信息检查错误原因，该视频下载任务跳过并发送下载失败通知")
-                await mr_notify.Notify(self.video_info).send_error_video_notify()
-            if await aios.path.exists(f"{self.media_path}/tmp/{self.title}"):
+        except Exception as e:
+            kind = failure_taxonomy.classify(e)
+            _LOGGER.exception(f"下载刮削程序错误：{self.bvid}，失败原因：{kind.value}，删除文件目录")
+            await self._record_failure(kind, page=0)
+            if await fs.exists(f"{self.media_path}/tmp/{self.title}"):
                 _LOGGER.info(f"删除tmp文件夹中的当前视频目录")
                 await files.delete_video_folder(f"{self.media_path}/tmp/{self.title}")
-            _LOGGER.info(f"删除视频文件夹")
-            if self.mode == SaveVideoMode.UP_FOLDER_STYLE:
-                if await aios.path.exists(f"{self.media_path}/{self.folder_name}/Season 1/{self.title}"):
-                    await files.delete_video_folder(f"{self.media_path}/{self.folder_name}/Season 1/{self.title}")
-            if self.mode == SaveVideoMode.NORMAL_STYLE:
-                if await aios.path.exists(f"{self.media_path}/{self.title}"):
-                    await files.delete_video_folder(f"{self.media_path}/{self.title}")
+            if self.video_path and self.created_video_path and await fs.exists(self.video_path):
+                _LOGGER.info(f"删除视频文件夹")
+                await files.delete_video_folder(self.video_path)
             return False
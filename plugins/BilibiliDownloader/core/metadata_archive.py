@@ -0,0 +1,70 @@
+"""归档b站接口返回的原始元数据（gzip压缩的json），之后修改nfo格式时可以直接离线重新生成，不用重新下载
+
+视频信息按bvid保存在 data/metadata/video/<bvid末两位>/<bvid>.json.gz，
+UP主信息保存在 data/metadata/uploader/<uid>.json.gz。
+"""
+import gzip
+import json
+import os
+
+from plugins.BilibiliDownloader.utils import LOGGER, files, fs
+
+_LOGGER = LOGGER
+ARCHIVE_DIR = f"{files.local_path}/metadata"
+
+
+def video_archive_path(bvid: str, archive_dir: str = ARCHIVE_DIR) -> str:
+    """视频元数据归档路径，按bvid末两位分目录，避免单个目录下文件过多"""
+    return f"{archive_dir}/video/{bvid[-2:]}/{bvid}.json.gz"
+
+
+def uploader_archive_path(mid: int, archive_dir: str = ARCHIVE_DIR) -> str:
+    """UP主元数据归档路径"""
+    return f"{archive_dir}/uploader/{mid}.json.gz"
+
+
+def _dump(path: str, data: dict) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    content = gzip.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"), mtime=0)
+    fs.write_bytes_atomic(path, content)
+
+
+def _load(path: str) -> dict | None:
+    try:
+        with gzip.open(path, "rb") as f:
+            return json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        _LOGGER.warning(f"元数据归档文件损坏：{path}")
+        return None
+
+
+def save_video_info(bvid: str, video_info: dict, archive_dir: str = ARCHIVE_DIR) -> None:
+    """归档get_info返回的视频信息
+
+    :param bvid: 视频bvid
+    :param video_info: 视频信息
+    :param archive_dir: 归档目录
+    """
+    _dump(video_archive_path(bvid, archive_dir), video_info)
+
+
+def load_video_info(bvid: str, archive_dir: str = ARCHIVE_DIR) -> dict | None:
+    """读取归档的视频信息，没有归档返回None"""
+    return _load(video_archive_path(bvid, archive_dir))
+
+
+def save_uploader_info(mid: int, uploader_info: dict, archive_dir: str = ARCHIVE_DIR) -> None:
+    """归档get_user_info返回的UP主信息
+
+    :param mid: UP主uid
+    :param uploader_info: UP主信息
+    :param archive_dir: 归档目录
+    """
+    _dump(uploader_archive_path(mid, archive_dir), uploader_info)
+
+
+def load_uploader_info(mid: int, archive_dir: str = ARCHIVE_DIR) -> dict | None:
+    """读取归档的UP主信息，没有归档返回None"""
+    return _load(uploader_archive_path(mid, archive_dir))
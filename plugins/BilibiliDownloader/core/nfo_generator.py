@@ -1,28 +1,165 @@
-"""根据传来的数据生成nfo"""
+"""根据传来的数据生成nfo
 
+所有nfo都由同一套声明式的字段表生成：先从视频（或UP主）信息里取出各个字段的值，
+再按照NFO_SPECS中每种nfo的字段顺序生成xml，不再逐个类型手写SubElement。
+"""
+
+import os
+import threading
 import time
-from copy import deepcopy
 
-import pypinyin
-from aiofiles import os
 from lxml import etree
 
-from plugins.BilibiliDownloader.utils import LOGGER, exception
+from plugins.BilibiliDownloader.core import stream_details
+from plugins.BilibiliDownloader.utils import LOGGER, exception, sort_title, fs
 
 _LOGGER = LOGGER
 
+# nfo类型 -> (根节点, 字段顺序)，字段为 节点名 或 (节点名, 属性)
+NFO_SPECS = {
+    "movie": (
+        "video",
+        ("title", "plot", "year", "premiered", "studio", "id", "genre", "runtime", "actor", "fileinfo"),
+    ),
+    "tvshow": ("tvshow", ("title", "plot", "year", "premiered", "studio", "id", "genre", "actor")),
+    "episodedetails": (
+        "episodedetails",
+        ("title", "plot", "year", "premiered", "studio", "id", "genre", "runtime", "season", "episode", "actor",
+         "fileinfo"),
+    ),
+    "person": ("person", ("title", "sorttitle", "bilibili_id", ("uniqueid", {"type": "bilibili_id"}))),
+}
+
+
+def _append_field(root: etree.Element, tag: str, attrib: dict | None, value) -> None:
+    """按照值的类型生成节点：字符串为节点文本，字典为子节点，列表为多个同名节点，None跳过"""
+    if value is None:
+        return
+    if isinstance(value, list):
+        for item in value:
+            _append_field(root, tag, attrib, item)
+        return
+    node = etree.SubElement(root, tag, attrib or {})
+    if isinstance(value, dict):
+        for child_tag, child_value in value.items():
+            _append_field(node, child_tag, None, child_value)
+    else:
+        node.text = str(value)
+
+
+def build_nfo(kind: str, fields: dict) -> etree.ElementTree:
+    """根据字段表生成nfo
+
+    :param kind: nfo类型，见NFO_SPECS
+    :param fields: 节点名 -> 值
+    :return: xml元数据
+    """
+    root_tag, spec = NFO_SPECS[kind]
+    root = etree.Element(root_tag)
+    for field in spec:
+        tag, attrib = field if isinstance(field, tuple) else (field, None)
+        _append_field(root, tag, attrib, fields.get(tag))
+    return etree.ElementTree(root)
+
+
+class NfoWriteStats:
+    """统计nfo实际写入和因内容没变而跳过的次数"""
+
+    def __init__(self):
+        self.written = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def add(self, written: bool) -> None:
+        with self._lock:
+            if written:
+                self.written += 1
+            else:
+                self.skipped += 1
+
+    def snapshot(self) -> tuple[int, int]:
+        """返回 (写入数量, 跳过数量)"""
+        with self._lock:
+            return self.written, self.skipped
+
+    def report(self) -> str:
+        written, skipped = self.snapshot()
+        return f"nfo写入{written}个，内容未变化跳过{skipped}个"
+
+
+NFO_WRITE_STATS = NfoWriteStats()  # 插件全局的nfo写入统计
+
+
+def serialize_nfo(tree: etree.ElementTree) -> bytes:
+    """把nfo序列化为写入文件的字节"""
+    return etree.tostring(tree, encoding="utf-8", xml_declaration=True, pretty_print=True)
+
+
+def write_nfo(tree: etree.ElementTree, nfo_path: str) -> bool:
+    """内容和已有文件不同时才原子地写入nfo，内容相同时不动已有文件，媒体服务器不会因为修改时间变化而重新读取
+
+    :param tree: xml元数据
+    :param nfo_path: nfo文件路径（包含文件名及后缀）
+    :return: 是否实际写入了
+    """
+    if tree is None:
+        raise ValueError("传入的xml信息为空")
+    content = serialize_nfo(tree)
+    if os.path.exists(nfo_path):
+        with open(nfo_path, "rb") as f:
+            if f.read() == content:
+                NFO_WRITE_STATS.add(False)
+                return False
+    fs.write_bytes_atomic(nfo_path, content)
+    NFO_WRITE_STATS.add(True)
+    return True
+
+
+def video_actors(media_info: dict) -> list[dict]:
+    """联合投稿的视频使用staff列表，否则使用UP主"""
+    if "staff" in media_info:
+        return [
+            {"name": character["name"], "role": character.get("title"), "bilibili_id": character["mid"]}
+            for character in media_info["staff"]
+        ]
+    return [{"name": media_info["owner"]["name"], "type": "UP主", "bilibili_id": media_info["owner"]["mid"]}]
+
+
+def build_person_nfo(actor: dict, sorttitle: str) -> etree.ElementTree:
+    """构建人物的person nfo
+
+    :param actor: video_actors返回的人物
+    :param sorttitle: 名字的拼音首字母
+    """
+    return build_nfo(
+        "person",
+        {
+            "title": actor["name"],
+            "sorttitle": sorttitle,
+            "bilibili_id": actor["bilibili_id"],
+            "uniqueid": actor["bilibili_id"],
+        },
+    )
+
 
 class NfoGenerator:
 
-    def __init__(self, media_info: dict, page: int = 0, uploader_folder_mode: bool = False) -> None:
+    def __init__(self, media_info: dict, page: int = 0, uploader_folder_mode: bool = False,
+                 episode: int = None, season: int = 1, streams: dict = None) -> None:
         """构建nfo元数据，返回xml
         Args:
             media_info (dict): bilibili_api返回的视频info
             page (int, optional): 指定分p视频的p数，0为普通视频 Defaults to 0.
             uploader_folder_mode (int, optional): 是否为up主信息模式
+            episode (int, optional): 指定episodedetails的集数，为空时使用page + 1 Defaults to None.
+            season (int, optional): 指定episodedetails的季数 Defaults to 1.
+            streams (dict, optional): 下载时选中的流信息（stream_details.from_dash），用于生成fileinfo Defaults to None.
         """
         self.media_info = media_info
         self.page = page
+        self.episode = episode
+        self.season = season
+        self.streams = streams
         if uploader_folder_mode is False:
             if not self._validate_media_info():
                 raise exception.MediaInfoError(
@@ -33,7 +170,7 @@ class NfoGenerator:
             self.title = self.media_info["title"]
         else:
             self.title = self.media_info["name"]
-        _LOGGER.info(media_info)
+        _LOGGER.debug(media_info)
 
     def _validate_media_info(self) -> bool:
         """验证传入的media_info是否合法
@@ -46,72 +183,63 @@ class NfoGenerator:
                 return False
         return True
 
-    async def _process_media_info(self) -> dict:
-        """给传入的media_info加料
+    def video_fields(self) -> dict:
+        """从视频信息中取出生成nfo需要的字段，只读取需要的键，不复制整个media_info
         Returns:
-            dict: 加料后的media_info
+            dict: 节点名 -> 值
         """
-        _media_info = self.media_info
-        meta_data = deepcopy(_media_info)
-        meta_data.update(
-            release_year=time.strftime("%Y", time.localtime(_media_info["pubdate"]))
-        )
-        meta_data.update(
-            minute_duration=(
-                str(_media_info["duration"] // 60)
-                if _media_info["duration"] // 60 > 0
-                else "1"
-            )
-        )
-        meta_data.update(
-            pubdate=time.strftime("%Y-%m-%d", time.localtime(_media_info["pubdate"]))
-        )
-        if _media_info["desc"] == "":
-            meta_data.update(desc="暂无简介，认真看视频吧~")
-        return meta_data
+        info = self.media_info
+        pubdate = time.localtime(info["pubdate"])
+        pages = info.get("pages") or []
+        # 分P视频每一集的时长是该P的时长，不是整个视频的总时长
+        duration = (pages[self.page] if len(pages) > self.page else {}).get("duration") or info["duration"]
+        return {
+            "title": info["title"],
+            "plot": info["desc"] or "暂无简介，认真看视频吧~",
+            "year": time.strftime("%Y", pubdate),
+            "premiered": time.strftime("%Y-%m-%d", pubdate),
+            "studio": info["owner"]["name"],
+            "id": info["bvid"],
+            "genre": info["tname"],
+            "runtime": str(max(duration // 60, 1)),
+            "season": self.season,
+            # 程序内部页码从0开始，但对外展示从1开始
+            "episode": self.episode if self.episode is not None else self.page + 1,
+            "actor": video_actors(info),
+            "fileinfo": stream_details.fileinfo(self.streams, duration),
+        }
+
+    def uploader_fields(self) -> dict:
+        """从UP主信息中取出生成tvshow nfo需要的字段
+        Returns:
+            dict: 节点名 -> 值
+        """
+        info = self.media_info
+        now = time.localtime()
+        return {
+            "title": info["name"],
+            "plot": info["sign"],
+            "year": time.strftime("%Y", now),
+            "premiered": time.strftime("%Y-%m-%d", now),
+            "studio": info["name"],
+            "id": str(info["mid"]),
+            "genre": "UP主",
+            "actor": {"name": info["name"], "type": "UP主", "bilibili_id": info["mid"]},
+        }
+
+    def build(self, kind: str) -> etree.ElementTree:
+        """同步生成视频的nfo，批量重新刮削时可以直接在线程或进程里调用
+
+        :param kind: movie、tvshow或episodedetails
+        """
+        return build_nfo(kind, self.video_fields())
 
     async def gen_movie_nfo(self) -> etree.ElementTree:
         """返回由etree构建的xml元数据
         Returns:
             etree.ElementTree: xml元数据
         """
-        _LOGGER.info(f"开始生成 {self.title} 的movie nfo文件")
-        _video_info = await self._process_media_info()
-        root = etree.Element("video")
-        title = etree.SubElement(root, "title")
-        title.text = _video_info["title"]
-        plot = etree.SubElement(root, "plot")
-        plot.text = _video_info["desc"]
-        year = etree.SubElement(root, "year")
-        year.text = _video_info["release_year"]
-        premiered = etree.SubElement(root, "premiered")
-        premiered.text = _video_info["pubdate"]
-        studio = etree.SubElement(root, "studio")
-        studio.text = _video_info["owner"]["name"]
-        id = etree.SubElement(root, "id")
-        id.text = _video_info["bvid"]
-        genre = etree.SubElement(root, "genre")
-        genre.text = _video_info["tname"]
-        runtime = etree.SubElement(root, "runtime")
-        runtime.text = _video_info["minute_duration"]
-        try:
-            for character in _video_info["staff"]:
-                actor = etree.SubElement(root, "actor")
-                name = etree.SubElement(actor, "name")
-                name.text = character["name"]
-                role = etree.SubElement(actor, "role")
-                role.text = character["title"]
-                mid = etree.SubElement(actor, "bilibili_id")
-                mid.text = str(character["mid"])
-        except KeyError:
-            actor = etree.SubElement(root, "actor")
-            name = etree.SubElement(actor, "name")
-            name.text = _video_info["owner"]["name"]
-            type = etree.SubElement(actor, "type")
-            type.text = "UP主"
-            mid = etree.SubElement(actor, "bilibili_id")
-            mid.text = str(_video_info["owner"]["mid"])
-        tree = etree.ElementTree(root)
+        tree = self.build("movie")
         _LOGGER.info(f"生成 {self.title} 的movie nfo文件成功")
         return tree
 
@@ -120,41 +248,7 @@ class NfoGenerator:
         Returns:
             etree.ElementTree: xml元数据
         """
-        _LOGGER.info(f"开始生成 {self.title} 的tvshow nfo文件")
-        _video_info = await self._process_media_info()
-        root = etree.Element("tvshow")
-        title = etree.SubElement(root, "title")
-        title.text = _video_info["title"]
-        plot = etree.SubElement(root, "plot")
-        plot.text = _video_info["desc"]
-        year = etree.SubElement(root, "year")
-        year.text = _video_info["release_year"]
-        premiered = etree.SubElement(root, "premiered")
-        premiered.text = _video_info["pubdate"]
-        studio = etree.SubElement(root, "studio")
-        studio.text = _video_info["owner"]["name"]
-        id = etree.SubElement(root, "id")
-        id.text = _video_info["bvid"]
-        genre = etree.SubElement(root, "genre")
-        genre.text = _video_info["tname"]
-        try:
-            for character in _video_info["staff"]:
-                actor = etree.SubElement(root, "actor")
-                name = etree.SubElement(actor, "name")
-                name.text = character["name"]
-                role = etree.SubElement(actor, "role")
-                role.text = character["title"]
-                mid = etree.SubElement(actor, "bilibili_id")
-                mid.text = str(character["mid"])
-        except KeyError:
-            actor = etree.SubElement(root, "actor")
-            name = etree.SubElement(actor, "name")
-            name.text = _video_info["owner"]["name"]
-            type = etree.SubElement(actor, "type")
-            type.text = "UP主"
-            mid = etree.SubElement(actor, "bilibili_id")
-            mid.text = str(_video_info["owner"]["mid"])
-        tree = etree.ElementTree(root)
+        tree = self.build("tvshow")
         _LOGGER.info(f"生成 {self.title} 的tvshow nfo文件成功")
         return tree
 
@@ -163,47 +257,7 @@ class NfoGenerator:
         Returns:
             etree.ElementTree: xml元数据
         """
-        _LOGGER.info(f"开始生成 {self.title} 的episodedetails nfo文件")
-        _video_info = await self._process_media_info()
-        root = etree.Element("episodedetails")
-        title = etree.SubElement(root, "title")
-        title.text = _video_info["title"]
-        plot = etree.SubElement(root, "plot")
-        plot.text = _video_info["desc"]
-        year = etree.SubElement(root, "year")
-        year.text = _video_info["release_year"]
-        premiered = etree.SubElement(root, "premiered")
-        premiered.text = _video_info["pubdate"]
-        studio = etree.SubElement(root, "studio")
-        studio.text = _video_info["owner"]["name"]
-        id = etree.SubElement(root, "id")
-        id.text = _video_info["bvid"]
-        genre = etree.SubElement(root, "genre")
-        genre.text = _video_info["tname"]
-        runtime = etree.SubElement(root, "runtime")
-        runtime.text = _video_info["minute_duration"]
-        season = etree.SubElement(root, "season")
-        season.text = "1"
-        episode = etree.SubElement(root, "episode")
-        episode.text = str(self.page + 1)  # 程序内部页码从0开始，但对外展示从1开始
-        try:
-            for character in _video_info["staff"]:
-                actor = etree.SubElement(root, "actor")
-                name = etree.SubElement(actor, "name")
-                name.text = character["name"]
-                role = etree.SubElement(actor, "role")
-                role.text = character["title"]
-                mid = etree.SubElement(actor, "bilibili_id")
-                mid.text = str(character["mid"])
-        except KeyError:
-            actor = etree.SubElement(root, "actor")
-            name = etree.SubElement(actor, "name")
-            name.text = _video_info["owner"]["name"]
-            type = etree.SubElement(actor, "type")
-            type.text = "UP主"
-            mid = etree.SubElement(actor, "bilibili_id")
-            mid.text = str(_video_info["owner"]["mid"])
-        tree = etree.ElementTree(root)
+        tree = self.build("episodedetails")
         _LOGGER.info(f"生成 {self.title} 的episodedetails nfo文件成功")
         return tree
 
@@ -212,100 +266,30 @@ class NfoGenerator:
         Returns:
             dict[str, etree.ElementTree]: 所有人物的xml元数据
         """
-        _LOGGER.info(f"开始生成 {self.title} 的people nfo文件")
-        _video_info = await self._process_media_info()
         tree = {}
-        if "staff" in _video_info:
-            for character in _video_info["staff"]:
-                root = etree.Element("person")
-                title = etree.SubElement(root, "title")
-                title.text = character["name"]
-                sorttitle = etree.SubElement(root, "sorttitle")
-                sorttitle.text = "".join(
-                    pypinyin.lazy_pinyin(
-                        character["name"], style=pypinyin.Style.FIRST_LETTER
-                    )
-                )
-                mid = etree.SubElement(root, "bilibili_id")
-                mid.text = str(character["mid"])
-                type = etree.SubElement(root, "uniqueid", type="bilibili_id")
-                type.text = str(character["mid"])
-                tree[character["name"]] = etree.ElementTree(root)
-                _LOGGER.info(f"up主 「{character['name']}」 nfo信息生成完成")
-        else:
-            root = etree.Element("person")
-            title = etree.SubElement(root, "title")
-            title.text = _video_info["owner"]["name"]
-            sorttitle = etree.SubElement(root, "sorttitle")
-            sorttitle.text = "".join(
-                pypinyin.lazy_pinyin(
-                    _video_info["owner"]["name"], style=pypinyin.Style.FIRST_LETTER
-                )
-            )
-            mid = etree.SubElement(root, "bilibili_id")
-            mid.text = str(_video_info["owner"]["mid"])
-            type = etree.SubElement(root, "uniqueid", type="bilibili_id")
-            type.text = str(_video_info["owner"]["mid"])
-            tree[_video_info["owner"]["name"]] = etree.ElementTree(root)
-            _LOGGER.info(f"up主 「{_video_info['owner']['name']}」 nfo信息生成完成")
-            _LOGGER.info(f"{self.title} 的up主nfo信息生成完成")
+        for actor in video_actors(self.media_info):
+            tree[actor["name"]] = build_person_nfo(actor, await fs.run(sort_title.get_sort_title, actor["name"]))
+            _LOGGER.info(f"up主 「{actor['name']}」 nfo信息生成完成")
         return tree
 
-    async def _uploader_info_to_media_info(self):
-        """转换api获取到的up主信息为与media_info键相同的字典"""
-        _raw_info = deepcopy(self.media_info)
-        _uploader_info = {}
-        _uploader_info["title"] = _raw_info["name"]
-        _uploader_info["desc"] = _raw_info["sign"]
-        _uploader_info["bvid"] = str(_raw_info["mid"])
-        _uploader_info["release_year"] = time.strftime("%Y", time.localtime(time.time()))
-        _uploader_info["pubdate"] = time.strftime("%Y-%m-%d", time.localtime(time.time()))
-        _uploader_info["owner"] = {}
-        _uploader_info["owner"]["name"] = _raw_info["name"]
-        _uploader_info["tname"] = "UP主"
-        _uploader_info["owner"]["mid"] = _raw_info["mid"]
-        return _uploader_info
-
     async def gen_tvshow_nfo_by_uploader(self) -> etree.ElementTree:
         """注意，这里传入的media_info实为bilibili_api获取到的uploader_info!!!"""
-        _LOGGER.info(f"开始生成 {self.title} 的tvshow nfo文件")
-        _video_info = await self._uploader_info_to_media_info()
-        root = etree.Element("tvshow")
-        title = etree.SubElement(root, "title")
-        title.text = _video_info["title"]
-        plot = etree.SubElement(root, "plot")
-        plot.text = _video_info["desc"]
-        year = etree.SubElement(root, "year")
-        year.text = _video_info["release_year"]
-        premiered = etree.SubElement(root, "premiered")
-        premiered.text = _video_info["pubdate"]
-        studio = etree.SubElement(root, "studio")
-        studio.text = _video_info["owner"]["name"]
-        id = etree.SubElement(root, "id")
-        id.text = _video_info["bvid"]
-        genre = etree.SubElement(root, "genre")
-        genre.text = _video_info["tname"]
-        actor = etree.SubElement(root, "actor")
-        name = etree.SubElement(actor, "name")
-        name.text = _video_info["owner"]["name"]
-        type = etree.SubElement(actor, "type")
-        type.text = "UP主"
-        mid = etree.SubElement(actor, "bilibili_id")
-        mid.text = str(_video_info["owner"]["mid"])
-        tree = etree.ElementTree(root)
+        tree = build_nfo("tvshow", self.uploader_fields())
         _LOGGER.info(f"生成 {self.title} 的tvshow nfo文件成功")
         return tree
 
-    async def save_nfo(self, tree: etree.ElementTree, nfo_path: str):
+    async def save_nfo(self, tree: etree.ElementTree, nfo_path: str) -> bool:
         """
-        保存nfo文件
+        保存nfo文件，内容没有变化时跳过
         Args:
             tree (etree.ElementTree): 之前构建出来的xml元数据
             nfo_path (str): nfo文件路径（包含文件名及后缀）
+        Returns:
+            bool: 是否实际写入了
         """
-        _LOGGER.info(f"开始根据传入的xml信息保存nfo文件")
-        if await os.path.exists(nfo_path):
-            await os.remove(nfo_path)
-        if tree is None:
-            raise ValueError("传入的xml信息为空")
-        tree.write(nfo_path, encoding="utf-8", xml_declaration=True, pretty_print=True)
+        written = await fs.run(write_nfo, tree, nfo_path)
+        if written:
+            _LOGGER.info(f"nfo文件已保存：{nfo_path}")
+        else:
+            _LOGGER.info(f"nfo内容没有变化，跳过写入：{nfo_path}")
+        return written
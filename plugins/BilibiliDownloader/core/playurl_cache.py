@@ -0,0 +1,157 @@
+"""缓存视频取流地址（playurl），签名过期前直接复用，过期后重新签名"""
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+from bilibili_api import video
+
+from plugins.BilibiliDownloader.utils import LOGGER
+
+_LOGGER = LOGGER
+EXPIRE_MARGIN = 120  # 距离deadline不足这么多秒就视为已过期，留出发起请求的时间
+DEFAULT_TTL = 1800  # 取流地址里找不到deadline时的缓存时间
+
+
+def parse_deadline(url: str) -> int | None:
+    """从取流地址的query参数中解析出过期时间戳
+
+    :param url: 取流地址
+    :return: deadline时间戳，解析失败返回None
+    """
+    try:
+        deadline = parse_qs(urlparse(url).query).get("deadline")
+        return int(deadline[0]) if deadline else None
+    except (ValueError, TypeError):
+        return None
+
+
+def is_url_expired(url: str, margin: int = EXPIRE_MARGIN) -> bool:
+    """判断取流地址是否已过期（解析不到deadline的地址一律视为过期）
+
+    :param url: 取流地址
+    :param margin: 提前量，单位秒
+    """
+    deadline = parse_deadline(url)
+    if deadline is None:
+        return True
+    return deadline - margin <= time.time()
+
+
+def get_playurl_deadline(playurl: dict) -> int | None:
+    """获取get_download_url返回结果中最早过期的地址的deadline
+
+    :param playurl: get_download_url的返回值
+    :return: 最早的deadline，找不到返回None
+    """
+    deadlines = []
+    dash = playurl.get("dash") or {}
+    for stream in (dash.get("video") or []) + (dash.get("audio") or []):
+        for url in [stream.get("baseUrl")] + (stream.get("backupUrl") or []):
+            deadline = parse_deadline(url) if url else None
+            if deadline is not None:
+                deadlines.append(deadline)
+    for durl in playurl.get("durl") or []:
+        deadline = parse_deadline(durl.get("url", ""))
+        if deadline is not None:
+            deadlines.append(deadline)
+    return min(deadlines) if deadlines else None
+
+
+def select_stream(playurl: dict, kind: str, old_stream: dict = None) -> dict:
+    """从取流结果中选出与之前相同清晰度、编码的流，保证续传时字节范围一致
+
+    :param playurl: get_download_url的返回值
+    :param kind: video或audio
+    :param old_stream: 之前选中的流，为空时返回第一个（最高清晰度）
+    :return: 选中的流
+    """
+    streams = playurl["dash"][kind]
+    if old_stream is not None:
+        for stream in streams:
+            if stream.get("id") == old_stream.get("id") and stream.get("codecid") == old_stream.get("codecid"):
+                return stream
+        _LOGGER.warning(f"重新签名后没找到与之前相同的{kind}流，回退到第一个流")
+    return streams[0]
+
+
+class PlayurlCache:
+    """按 (bvid, 分P) 缓存取流结果，直到签名快要过期"""
+
+    def __init__(self, margin: int = EXPIRE_MARGIN):
+        """
+        :param margin: 距离deadline不足多少秒时丢弃缓存
+        """
+        self.margin = margin
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, bvid: str, page: int = 0) -> dict | None:
+        """读取缓存，过期则丢弃并返回None"""
+        with self._lock:
+            cached = self._cache.get((bvid, page))
+            if cached is None:
+                return None
+            expire_at, playurl = cached
+            if expire_at <= time.time():
+                del self._cache[(bvid, page)]
+                return None
+            return playurl
+
+    def put(self, bvid: str, page: int, playurl: dict) -> None:
+        """写入缓存，过期时间取所有地址中最早的deadline减去提前量"""
+        deadline = get_playurl_deadline(playurl)
+        expire_at = deadline - self.margin if deadline is not None else time.time() + DEFAULT_TTL
+        if expire_at <= time.time():
+            return
+        with self._lock:
+            self._cache[(bvid, page)] = (expire_at, playurl)
+
+    def invalidate(self, bvid: str, page: int = 0) -> None:
+        """删除缓存"""
+        with self._lock:
+            self._cache.pop((bvid, page), None)
+
+    async def get_download_url(
+            self, video_object: video.Video, page_index: int = 0, force_refresh: bool = False
+    ) -> dict:
+        """获取取流地址，优先使用缓存
+
+        :param video_object: 视频对象
+        :param page_index: 分P序号
+        :param force_refresh: 跳过缓存强制重新获取（重新签名）
+        :return: get_download_url的返回值
+        """
+        bvid = video_object.get_bvid()
+        if not force_refresh:
+            playurl = self.get(bvid, page_index)
+            if playurl is not None:
+                _LOGGER.info(f"使用缓存的取流地址：{bvid} P{page_index + 1}")
+                return playurl
+        playurl = await video_object.get_download_url(page_index=page_index)
+        self.put(bvid, page_index, playurl)
+        return playurl
+
+
+_playurl_cache = PlayurlCache()
+
+
+async def get_download_url(video_object: video.Video, page_index: int = 0, force_refresh: bool = False) -> dict:
+    """使用全局缓存获取取流地址，参数见PlayurlCache.get_download_url"""
+    return await _playurl_cache.get_download_url(video_object, page_index, force_refresh)
+
+
+def make_resigner(video_object: video.Video, page_index: int, kind: str, stream: dict):
+    """生成给DownloadFunc使用的重新签名回调
+
+    :param video_object: 视频对象
+    :param page_index: 分P序号
+    :param kind: video或audio
+    :param stream: 当前正在下载的流
+    :return: 异步函数，调用后返回同一条流的新地址
+    """
+
+    async def resign() -> str:
+        playurl = await get_download_url(video_object, page_index, force_refresh=True)
+        return select_stream(playurl, kind, stream)["baseUrl"]
+
+    return resign
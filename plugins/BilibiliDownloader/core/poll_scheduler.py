@@ -0,0 +1,127 @@
+"""追更查询的限流调度
+
+所有up主共用一个令牌桶作为接口预算，令牌按固定速度补充，定时任务每分钟运行一次，
+每次只查询令牌够用的up主，查询请求因此均匀分布在时间上，而不是每隔几分钟集中请求一批。
+每个up主按自己的查询间隔（见upload_cadence）轮到时才查询，超出间隔比例最大的优先。
+遇到风控时全局暂停一段时间，连续风控时暂停时间翻倍。
+"""
+import threading
+import time
+
+from plugins.BilibiliDownloader.utils import LOGGER
+from plugins.BilibiliDownloader.utils.rate_limiter import RateLimiter
+
+_LOGGER = LOGGER
+BUDGET_PER_MINUTE = 6  # 每分钟最多发起的查询请求数
+BURST = 10  # 令牌桶容量，限制长时间空闲后一次性发出的请求数
+BACKOFF_BASE = 5 * 60  # 第一次风控后暂停的秒数
+BACKOFF_MAX = 2 * 3600  # 最长暂停秒数
+
+
+class PollScheduler:
+    def __init__(self, budget_per_minute: float = BUDGET_PER_MINUTE, burst: float = BURST,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX, now: float = None):
+        """追更查询调度器，状态只保存在内存中，插件重启后重新开始计算
+
+        :param budget_per_minute: 每分钟最多发起的查询请求数
+        :param burst: 令牌桶容量
+        :param backoff_base: 第一次风控后暂停的秒数
+        :param backoff_max: 最长暂停秒数
+        """
+        self.bucket = RateLimiter(budget_per_minute / 60, burst, clock=time.time, now=now)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._backoff = 0
+        self._paused_until = 0
+        self._last_checked = {}  # uid -> 上次查询的时间戳
+        self._lock = threading.Lock()
+
+    def paused_for(self, now: float = None) -> float:
+        """还要暂停多少秒，没有暂停时为0"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return max(0.0, self._paused_until - now)
+
+    def acquire(self, now: float = None) -> bool:
+        """为一次请求取一个令牌（读取动态列表用），暂停中或令牌不够时返回False"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if now < self._paused_until:
+                return False
+            return self.bucket.take(1, now) == 1
+
+    def charge(self, tokens: int = 1, now: float = None) -> None:
+        """记下预算之外已经发出的请求（翻页、获取新视频信息、刷新关注列表），令牌不够时欠着，之后少查几个up主"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self.bucket.charge(tokens, now)
+
+    def select(self, uids: list[int], now: float = None, intervals: dict[int, float] = None) -> list[int]:
+        """从候选up主中选出这一轮要查询的，数量受令牌限制
+
+        传入intervals时只选已经到了查询间隔的up主，超出间隔比例最大的优先；
+        不传时所有up主间隔相同，最久没查过的优先。
+
+        :param uids: 候选up主
+        :param now: 当前时间戳
+        :param intervals: 每个up主的查询间隔（秒）
+        :return: 这一轮要查询的up主
+        """
+        now = time.time() if now is None else now
+        intervals = intervals or {}
+        with self._lock:
+            if now < self._paused_until or not uids:
+                return []
+            overdue = {}
+            for i, uid in enumerate(uids):
+                if uid not in self._last_checked:
+                    overdue[i] = float("inf")
+                    continue
+                elapsed = now - self._last_checked[uid]
+                interval = intervals.get(uid)
+                if interval is None:
+                    overdue[i] = elapsed
+                elif elapsed >= interval:
+                    overdue[i] = elapsed / interval
+            order = sorted(overdue, key=lambda i: (-overdue[i], i))
+            taken = self.bucket.take(len(order), now)
+            return [uids[i] for i in order[:taken]]
+
+    def mark_checked(self, uids, now: float = None) -> None:
+        """记录这些up主已经查询过"""
+        now = time.time() if now is None else now
+        with self._lock:
+            for uid in uids:
+                self._last_checked[uid] = now
+
+    def report_success(self) -> None:
+        """请求正常返回，清空连续风控的暂停时间"""
+        with self._lock:
+            self._backoff = 0
+
+    def report_risk_control(self, now: float = None) -> float:
+        """遇到风控，全局暂停，连续风控时暂停时间翻倍
+
+        :return: 暂停的秒数
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._backoff = min(self.backoff_max, self._backoff * 2 if self._backoff else self.backoff_base)
+            self._paused_until = now + self._backoff
+            self.bucket.drain(now, self._paused_until)
+            _LOGGER.warning(f"追更查询被b站风控，暂停{self._backoff:.0f}秒")
+            return self._backoff
+
+    def staleness(self, uids: list[int], now: float = None) -> dict[int, float | None]:
+        """每个up主距离上次查询过了多少秒，从来没查过的为None"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return {uid: (now - self._last_checked[uid]) if uid in self._last_checked else None for uid in uids}
+
+
+_poll_scheduler = PollScheduler()
+
+
+def get_poll_scheduler() -> PollScheduler:
+    """插件全局共用的追更查询调度器"""
+    return _poll_scheduler
@@ -1,19 +1,17 @@
 """我也不知道为什么要单独开一个文件来放这些东西，看起来好看就对了"""
 
+import asyncio
 import json
 import os as _os
-import shutil
 import sys
 import traceback
 
-import aiofiles
 import ffmpeg
 import httpx
-from aiofiles import os
 from bilibili_api import video, exceptions, ass, user
 
-from plugins.BilibiliDownloader.utils import global_value, LOGGER, SysOut, ccjson2srt
-from plugins.BilibiliDownloader.core import downloader
+from plugins.BilibiliDownloader.utils import global_value, LOGGER, SysOut, ccjson2srt, fs
+from plugins.BilibiliDownloader.core import downloader, playurl_cache, stream_details, failure_taxonomy
 
 # TODO 记住，正式版本这里要删掉
 global_value.init()
@@ -72,13 +70,15 @@ async def get_video_info(
             _LOGGER.error(f"视频信息校验失败，中断后续流程，获取到的视频信息为：\n{video_info}")
             return False
         return video_info, video_object
-    except exceptions.ResponseCodeException:
+    except exceptions.ResponseCodeException as e:
+        failure_taxonomy.remember(e)
         _LOGGER.error(f"视频 {bvid} 不存在，详细报错信息：\n{traceback.format_exc()}")
         return False
     except exceptions.ArgsException:
         _LOGGER.error(f"BV号输入错误，详细报错信息：\n{traceback.format_exc()}")
         return False
-    except Exception:
+    except Exception as e:
+        failure_taxonomy.remember(e)
         _LOGGER.error(f"获取视频 {bvid} 信息时发生未知错误，详细报错信息：\n{traceback.format_exc()}")
         return False
 
@@ -88,7 +88,8 @@ async def get_uploader_info(uid: int) -> dict or bool:
     try:
         user_info = await user.User(uid=uid, credential=credential).get_user_info()
         return user_info
-    except exceptions.ResponseCodeException:
+    except exceptions.ResponseCodeException as e:
+        failure_taxonomy.remember(e)
         _LOGGER.error("获取up主用户信息失败！等待重试")
         _LOGGER.error(traceback.format_exc())
         return False
@@ -99,46 +100,57 @@ async def get_uploader_info(uid: int) -> dict or bool:
 
 
 async def download_video(
-        video_object: video.Video, dst: str, filename: str, page: int = 0
-) -> str | bool:
+        video_object: video.Video, dst: str, filename: str, page: int = 0, video_info: dict = None
+) -> dict | bool:
     """下载视频
 
     :param video_object: 视频对象
     :param dst: 保存路径
     :param filename: 文件名， 不包含后缀
     :param page: 分P序号
+    :param video_info: 已经获取过的视频信息，传入后不再重复请求
 
-    :return: 是否下载成功
+    :return: 下载失败返回False，成功返回所选流的信息（清晰度、大小、cid、生成nfo用的流信息）
     """
-    if not await os.path.exists(dst):
-        await os.makedirs(dst, exist_ok=True)
-    res = await get_video_info(video_object=video_object)
-    if res is False:
-        _LOGGER.error(f"跳过此视频下载")
-        return False
-    video_info, video_object = res
+    if not await fs.exists(dst):
+        await fs.makedirs(dst, exist_ok=True)
+    if video_info is None:
+        res = await get_video_info(video_object=video_object)
+        if res is False:
+            _LOGGER.error(f"跳过此视频下载")
+            return False
+        video_info, video_object = res
     title = video_info["title"].replace("/", " ")
     pretty_title = " 「" + title + "」 "
-    if not await os.path.exists(f"{local_path}/tmp/{title}"):
-        await os.makedirs(f"{local_path}/tmp/{title}", exist_ok=True)
+    if not await fs.exists(f"{local_path}/tmp/{title}"):
+        await fs.makedirs(f"{local_path}/tmp/{title}", exist_ok=True)
     try:
-        url = await video_object.get_download_url(page_index=page)
-    except exceptions.ResponseCodeException:
+        url = await playurl_cache.get_download_url(video_object, page_index=page)
+    except exceptions.ResponseCodeException as e:
+        failure_taxonomy.remember(e)
         _LOGGER.error(f"视频{pretty_title}不存在，详细报错信息：\n{traceback.format_exc()}")
         return False
     _LOGGER.info(f"该视频存在 {url['accept_description']} 种清晰度，根据你的账号权限，开始选择最高清晰度下载")
-    video_url = url["dash"]["video"][0]["baseUrl"]
-    audio_url = url["dash"]["audio"][0]["baseUrl"]
+    video_stream = playurl_cache.select_stream(url, "video")
+    audio_stream = playurl_cache.select_stream(url, "audio")
     DownloadFunc = downloader.DownloadFunc
     v_path = f"{local_path}/tmp/{title}/video_temp.m4s"
-    res, v_size = await DownloadFunc(video_url, v_path).download_with_resume()
+    res, v_size = await DownloadFunc(
+        video_stream["baseUrl"],
+        v_path,
+        resign=playurl_cache.make_resigner(video_object, page, "video", video_stream),
+    ).download_with_resume()
     if res:
         _LOGGER.info(f"{pretty_title} m4s视频下载到完成")
     else:
         _LOGGER.error(f"{pretty_title} m4s视频下载失败")
         return False
     a_path = f"{local_path}/tmp/{title}/audio_temp.m4s"
-    res, a_size = await DownloadFunc(audio_url, a_path).download_with_resume()
+    res, a_size = await DownloadFunc(
+        audio_stream["baseUrl"],
+        a_path,
+        resign=playurl_cache.make_resigner(video_object, page, "audio", audio_stream),
+    ).download_with_resume()
     if res:
         _LOGGER.info(f"{pretty_title} m4s音频下载完成")
     else:
@@ -149,18 +161,22 @@ async def download_video(
         return False
     in_video = ffmpeg.input(v_path)
     in_audio = ffmpeg.input(a_path)
-    ffmpeg.output(
+    output = ffmpeg.output(
         in_video,
         in_audio,
         f"{dst}/{filename}.mp4",
         vcodec="copy",
         acodec="copy",
-    ).run(overwrite_output=True)
-    await os.remove(v_path)
-    await os.remove(a_path)
-    await os.removedirs(f"{local_path}/tmp/{title}")
+    )
+    await asyncio.to_thread(output.run, overwrite_output=True)  # 混流是子进程，不占用文件操作线程池
+    await fs.batch((_os.remove, v_path), (_os.remove, a_path), (_os.removedirs, f"{local_path}/tmp/{title}"))
     _LOGGER.info(f"视频音频下载完成，已混流为mp4文件，保存路径为：{dst}/{filename}.mp4")
-    return True
+    return {
+        "quality": video_stream.get("id"),
+        "size": v_size + a_size,
+        "cid": video_info["pages"][page]["cid"] if len(video_info.get("pages", [])) > page else video_info.get("cid"),
+        "streams": stream_details.from_dash(url, video_stream, audio_stream),
+    }
 
 
 async def download_video_cover(video_info: dict, dst: str, filename: str) -> bool:
@@ -172,8 +188,8 @@ async def download_video_cover(video_info: dict, dst: str, filename: str) -> boo
 
     :return: 是否下载成功
     """
-    if not await os.path.exists(dst):
-        await os.makedirs(dst, exist_ok=True)
+    if not await fs.exists(dst):
+        await fs.makedirs(dst, exist_ok=True)
     download_url = video_info["pic"]
     title = video_info["title"].replace("/", " ")
     pretty_title = " 「" + title + "」 "
@@ -199,8 +215,8 @@ async def download_people_image(
 
     :return: 是否下载成功
     """
-    if not await os.path.exists(dst):
-        await os.makedirs(dst, exist_ok=True)
+    if not await fs.exists(dst):
+        await fs.makedirs(dst, exist_ok=True)
     DownloadFunc = downloader.DownloadFunc
     if "staff" in video_info:
         for staff in video_info["staff"]:
@@ -229,31 +245,28 @@ async def remove_some_danmaku(path, number):
     """
     try:
         # 先备份弹幕文件
-        shutil.copy(path, f"{path}.bak")
-        async with aiofiles.open(path, "r", encoding="utf-8") as f:
-            lines = await f.readlines()
+        await fs.copy(path, f"{path}.bak")
+        lines = (await fs.read_text(path)).splitlines(keepends=True)
         danmaku_lines = lines[17:]
         header_lines = lines[:17]
         if len(danmaku_lines) < number:
             _LOGGER.info(f"弹幕条数不足 {number} 条，不做处理")
-            await os.remove(f"{path}.bak")
+            await fs.remove(f"{path}.bak")
             return True
         # _LOGGER.info(f"弹幕条数：{len(danmaku_lines)}，保留弹幕条数：{number}，删除间隔：{remove_interval}")
         lines_to_skip = (len(danmaku_lines) - number) // number
         kept_lines = [line for i, line in enumerate(lines) if i % lines_to_skip == 0]
-        async with aiofiles.open(path, "w", encoding="UTF-8") as f:
-            for line in header_lines + kept_lines:
-                await f.write(line)
+        await fs.write_text(path, "".join(header_lines + kept_lines))
         _LOGGER.info(f"弹幕条数已更改为：{number}")
-        await os.remove(f"{path}.bak")
+        await fs.remove(f"{path}.bak")
         return True
     except Exception:
         _LOGGER.error(f"更改弹幕条数失败，开始恢复原弹幕文件")
         tracebacklog = traceback.format_exc()
         _LOGGER.error(f"报错原因：{tracebacklog}")
-        shutil.copy(f"{path}.bak", path)
-        if await os.path.exists(path):
-            await os.remove(path + ".bak")
+        await fs.copy(f"{path}.bak", path)
+        if await fs.exists(path):
+            await fs.remove(path + ".bak")
             return True
         else:
             return False
@@ -337,8 +350,7 @@ async def download_uploader_face(avatar_url, dst: str, filename: str) -> bool:
     client = httpx.AsyncClient()
     avatar = await client.get(avatar_url)
     if avatar.status_code == 200:
-        async with aiofiles.open(f"{dst}/{filename}.jpg", "wb") as f:
-            await f.write(avatar.content)
+        await fs.write_bytes(f"{dst}/{filename}.jpg", avatar.content)
         _LOGGER.info(f"头像下载完成，保存路径为：{dst}/{filename}.jpg")
         return True
     else:
@@ -0,0 +1,58 @@
+"""把处理完成的文件发布到媒体库
+
+每个文件先移动到目标目录下的临时文件名，再rename成正式文件名，媒体服务器不会扫到写了一半的文件。
+nfo、封面、弹幕等附属文件先发布，视频文件最后发布，媒体服务器发现视频时元数据已经就位。
+"""
+import os
+import shutil
+
+from plugins.BilibiliDownloader.utils import LOGGER, fs
+
+_LOGGER = LOGGER
+PARTIAL_SUFFIX = ".partial"  # 发布中的临时后缀，媒体服务器不认识这个后缀，不会扫描
+MEDIA_EXTENSIONS = (".mp4", ".mkv", ".flv")
+UNCHANGED_CHECK_EXTENSIONS = (".nfo",)  # 发布前先比较内容的文件类型
+
+
+def _same_content(src: str, dst: str) -> bool:
+    """nfo等小文件内容没变时不覆盖，媒体服务器不会因为修改时间变化而重新读取元数据"""
+    if not src.endswith(UNCHANGED_CHECK_EXTENSIONS) or not os.path.exists(dst):
+        return False
+    if os.path.getsize(src) != os.path.getsize(dst):
+        return False
+    with open(src, "rb") as f_src, open(dst, "rb") as f_dst:
+        return f_src.read() == f_dst.read()
+
+
+def _publish_file(src: str, dst: str) -> None:
+    if _same_content(src, dst):
+        os.remove(src)
+        return
+    tmp = dst + PARTIAL_SUFFIX
+    shutil.move(src, tmp)  # 同一文件系统下是rename，跨文件系统时是复制到目标目录
+    os.replace(tmp, dst)  # 同目录下rename，原子替换
+
+
+def _publish_files(src_dir: str, dst_dir: str, filenames: list[str]) -> list[str]:
+    os.makedirs(dst_dir, exist_ok=True)
+    published = []
+    for filename in sorted(filenames, key=lambda name: name.endswith(MEDIA_EXTENSIONS)):
+        src = os.path.join(src_dir, filename)
+        if not os.path.exists(src):
+            continue
+        _publish_file(src, os.path.join(dst_dir, filename))
+        published.append(filename)
+    return published
+
+
+async def publish_files(src_dir: str, dst_dir: str, filenames: list[str]) -> list[str]:
+    """原子地把一组文件发布到媒体库目录
+
+    :param src_dir: 临时目录
+    :param dst_dir: 媒体库中的目标目录
+    :param filenames: 需要发布的文件名，不存在的文件会跳过
+    :return: 实际发布了的文件名
+    """
+    published = await fs.run(_publish_files, src_dir, dst_dir, filenames)
+    _LOGGER.info(f"已发布到媒体库 {dst_dir}：{published}")
+    return published
@@ -0,0 +1,189 @@
+"""根据归档的原始元数据，离线批量重新生成媒体库中所有的nfo，不请求b站接口
+
+逐条遍历媒体库索引，同时提交给进程池的任务数有上限，媒体库再大内存占用也保持平稳。
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, ALL_COMPLETED, wait
+
+from lxml import etree
+
+from plugins.BilibiliDownloader.core import library_index, metadata_archive, nfo_generator
+from plugins.BilibiliDownloader.utils import LOGGER, sort_title
+
+_LOGGER = LOGGER
+MAX_RESCRAPE_WORKERS = 4  # 在插件所在的服务进程里执行，进程数不宜太多
+RESCRAPE_WORKERS = min(os.cpu_count() or 2, MAX_RESCRAPE_WORKERS)
+MAX_PENDING_PER_WORKER = 4  # 每个进程最多排队的任务数
+
+
+class RescrapeResult:
+    def __init__(self):
+        """批量重新刮削的结果统计"""
+        self.written = 0  # 内容有变化，重新写入的nfo
+        self.skipped = 0  # 内容没变，跳过的nfo
+        self.missing = 0  # 没有归档元数据的视频
+        self.failed = 0  # 生成失败的视频
+
+    def add(self, status: str) -> None:
+        setattr(self, status, getattr(self, status) + 1)
+
+    def report(self) -> str:
+        return (
+            f"重新写入{self.written}个nfo，内容未变化跳过{self.skipped}个，"
+            f"没有归档元数据{self.missing}个，失败{self.failed}个"
+        )
+
+
+def _read_episode_numbers(nfo_path: str) -> tuple[int, int] | None:
+    """读取已有episodedetails nfo中的 (季数, 集数)"""
+    try:
+        root = etree.parse(nfo_path).getroot()
+        return int(root.findtext("season") or 1), int(root.findtext("episode"))
+    except (etree.XMLSyntaxError, OSError, TypeError, ValueError):
+        return None
+
+
+def _write(tree: etree.ElementTree, nfo_path: str) -> str:
+    return "written" if nfo_generator.write_nfo(tree, nfo_path) else "skipped"
+
+
+def rescrape_item(archive_dir: str, bvid: str, page: int, record: dict) -> tuple[str, tuple | None, list]:
+    """重新生成一条索引记录对应的nfo，在子进程中执行
+
+    :param archive_dir: 元数据归档目录
+    :param bvid: 视频bvid
+    :param page: 分P序号，从0开始
+    :param record: 媒体库索引记录
+    :return: (结果, 该视频所属剧集, 视频的人物列表)，剧集为 ("video", 剧集目录, bvid) 或 ("uploader", 剧集目录, uid)
+    """
+    try:
+        video_info = metadata_archive.load_video_info(bvid, archive_dir)
+        nfo_path = record.get("nfo")
+        if video_info is None or not nfo_path:
+            return "missing", None, []
+        actors = nfo_generator.video_actors(video_info)
+        generator = nfo_generator.NfoGenerator(video_info, page=page, streams=record.get("streams"))
+        if record.get("kind") == "movie":
+            return _write(generator.build("movie"), nfo_path), None, actors
+        if len(video_info.get("pages", [])) > 1 and record.get("episode"):
+            # 分P视频，每一P是一集，剧集信息来自视频本身
+            generator.season, generator.episode = record.get("season", 1), record["episode"]
+            fields = generator.video_fields()
+            fields["title"] = video_info["pages"][page]["part"]
+            show = ("video", os.path.dirname(record["path"]), bvid)
+            return _write(nfo_generator.build_nfo("episodedetails", fields), nfo_path), show, actors
+        # UP主文件夹模式，集数和季数沿用已有nfo中的编号
+        numbers = _read_episode_numbers(nfo_path)
+        if numbers is None:
+            return "failed", None, actors
+        generator.season, generator.episode = numbers
+        show = ("uploader", os.path.dirname(os.path.dirname(record["path"])), video_info["owner"]["mid"])
+        return _write(generator.build("episodedetails"), nfo_path), show, actors
+    except Exception:
+        _LOGGER.exception(f"重新生成nfo失败：{bvid} P{page + 1}")
+        return "failed", None, []
+
+
+def rescrape_show(archive_dir: str, show: tuple) -> str:
+    """重新生成剧集的tvshow.nfo，在子进程中执行
+
+    :param archive_dir: 元数据归档目录
+    :param show: rescrape_item返回的剧集
+    """
+    try:
+        kind, show_path, key = show
+        if kind == "video":
+            video_info = metadata_archive.load_video_info(key, archive_dir)
+            if video_info is None:
+                return "missing"
+            tree = nfo_generator.NfoGenerator(video_info).build("tvshow")
+        else:
+            uploader_info = metadata_archive.load_uploader_info(key, archive_dir)
+            if uploader_info is None:
+                return "missing"
+            generator = nfo_generator.NfoGenerator(uploader_info, uploader_folder_mode=True)
+            tree = nfo_generator.build_nfo("tvshow", generator.uploader_fields())
+        return _write(tree, f"{show_path}/tvshow.nfo")
+    except Exception:
+        _LOGGER.exception(f"重新生成tvshow.nfo失败：{show}")
+        return "failed"
+
+
+def rescrape_person(people_path: str, actor: dict, sorttitle: str) -> str:
+    """重新生成人物的person.nfo，在子进程中执行
+
+    只更新已经刮削过的人物文件夹，新的人物需要下载头像，留给下次下载视频时刮削
+
+    :param people_path: 人物信息保存目录
+    :param actor: rescrape_item返回的人物
+    :param sorttitle: 名字的拼音首字母
+    """
+    try:
+        people_folder = f"{people_path}/{actor['name'][0]}/{actor['name']}"
+        if not os.path.isdir(people_folder):
+            return "missing"
+        return _write(nfo_generator.build_person_nfo(actor, sorttitle), f"{people_folder}/person.nfo")
+    except Exception:
+        _LOGGER.exception(f"重新生成person.nfo失败：{actor.get('name')}")
+        return "failed"
+
+
+def _drain(pending: set, result: RescrapeResult, shows: set, people: dict, return_when) -> set:
+    done, pending = wait(pending, return_when=return_when)
+    for future in done:
+        outcome = future.result()
+        if isinstance(outcome, tuple):
+            status, show, actors = outcome
+            if show is not None:
+                shows.add(show)
+            for actor in actors:
+                people.setdefault(actor["name"], actor)
+        else:
+            status = outcome
+        result.add(status)
+    return pending
+
+
+def rescrape_library(
+        index: library_index.LibraryIndex = None,
+        archive_dir: str = metadata_archive.ARCHIVE_DIR,
+        workers: int = RESCRAPE_WORKERS,
+        people_path: str = None,
+) -> RescrapeResult:
+    """根据归档的元数据重新生成媒体库中所有的nfo
+
+    :param index: 媒体库索引，默认为插件全局的索引
+    :param archive_dir: 元数据归档目录
+    :param workers: 进程数
+    :param people_path: 人物信息保存目录，不传时不重新生成人物nfo
+    :return: 结果统计
+    """
+    index = index or library_index.get_library_index()
+    result = RescrapeResult()
+    shows = set()
+    people = {}
+    max_pending = workers * MAX_PENDING_PER_WORKER
+    _LOGGER.info(f"开始根据归档元数据重新生成nfo，进程数：{workers}")
+    # 用spawn启动子进程，不fork整个服务进程
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = set()
+        for bvid, page, record in index.iter_records():
+            if len(pending) >= max_pending:
+                pending = _drain(pending, result, shows, people, FIRST_COMPLETED)
+            pending.add(pool.submit(rescrape_item, archive_dir, bvid, page, record))
+        _drain(pending, result, shows, people, ALL_COMPLETED)
+        pending = set()
+        for show in shows:
+            if len(pending) >= max_pending:
+                pending = _drain(pending, result, set(), {}, FIRST_COMPLETED)
+            pending.add(pool.submit(rescrape_show, archive_dir, show))
+        if people_path:
+            for name, actor in people.items():
+                if len(pending) >= max_pending:
+                    pending = _drain(pending, result, set(), {}, FIRST_COMPLETED)
+                # sorttitle在主进程中通过缓存获取，子进程不各自写缓存文件
+                pending.add(pool.submit(rescrape_person, people_path, actor, sort_title.get_sort_title(name)))
+        _drain(pending, result, set(), {}, ALL_COMPLETED)
+    _LOGGER.info(f"nfo重新生成完成：{result.report()}")
+    return result
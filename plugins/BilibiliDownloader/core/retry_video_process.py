@@ -1,40 +1,71 @@
-from plugins.BilibiliDownloader.utils import global_value, files, LOGGER
-from plugins.BilibiliDownloader.core import main_video_process
+from plugins.BilibiliDownloader.utils import global_value, files, LOGGER, fs
+from plugins.BilibiliDownloader.core import main_video_process, failure_taxonomy
+from plugins.BilibiliDownloader.mr import mr_notify
 import asyncio
 _LOGGER = LOGGER
+MAX_CONCURRENT_JOBS = 3  # 重试和追更加起来同时执行的下载任务上限
+
+
+def retry_batch_size(max_batch: int, due: int, running: int, max_concurrent: int = MAX_CONCURRENT_JOBS) -> int:
+    """根据当前正在执行的下载任务数决定这一轮重试多少个视频
+
+    :param max_batch: 一轮最多重试的视频数
+    :param due: 已到期可以重试的视频数
+    :param running: 正在执行的下载任务数
+    :param max_concurrent: 同时执行的下载任务上限
+    :return: 这一轮重试的视频数，下载任务已满时为0
+    """
+    return max(0, min(max_batch, due, max_concurrent - running))
 
 
 async def retry_video_process(retry_video_number: int) -> bool:
-    """重试视频下载
+    """重试已经到了下次重试时间的视频，按到期先后顺序选取
 
-    :param retry_video_number: 重试视频数量
+    :param retry_video_number: 一轮最多重试的视频数
     :return: 是否重试成功
     """
     config = global_value.get_value("config")
-    error_video_list = await files.ErrorVideoController().get_error_video_list()
-    retry_video_number = min(retry_video_number, len(error_video_list))
-    tasks = []
-    if retry_video_number == 0:
+    store = files.get_error_video_store()
+    due, latency = await fs.run(store.due_stats)
+    if due == 0:
         return True
-    for i in range(retry_video_number):
-        error_video = error_video_list[i]
-        if error_video["retry"] >= 10:
-            await files.ErrorVideoController().remove_error_video(error_video["bvid"], error_video["page"])
-            _LOGGER.warning(f"视频{error_video['bvid']}重试次数已达上限，跳过")
+    running = main_video_process.running_jobs()
+    batch = retry_batch_size(retry_video_number, due, running)
+    _LOGGER.info(f"有{due}个视频等待重试，最早的已等待{latency:.0f}秒，正在下载{running}个，本轮重试{batch}个")
+    if batch == 0:
+        return True
+    error_video_list = await fs.run(store.list_due, limit=batch)
+    retry_list = []
+    tasks = []
+    for error_video in error_video_list:
+        policy = failure_taxonomy.policy_for(error_video["kind"])
+        if error_video["retry"] >= policy.max_retry:
+            # 升级前记录的视频没有在失败时隔离，在这里补上
+            _LOGGER.warning(f"视频{error_video['bvid']}重试次数已达上限，不再重试")
+            if await fs.run(store.quarantine, error_video["bvid"], error_video["page"], error_video["kind"]):
+                await mr_notify.Notify(None).send_quarantine_notify(error_video["bvid"], policy.reason)
             continue
-        task = main_video_process.SaveOneVideo(mode=config.get("video_save_mode"), bvid=error_video["bvid"], media_path=config.get("media_path"), scraper_people=config.get("person_dir") if config.get("person_dir") else False, emby_people_path=config.get("person_dir")).run()
-        task = asyncio.create_task(task)
-        tasks.append(task)
-        # await files.ErrorVideoController().remove_error_video(error_video["bvid"], error_video["page"])
+        task = main_video_process.SaveOneVideo(
+            mode=config.get("video_save_mode"),
+            bvid=error_video["bvid"],
+            media_path=config.get("media_path"),
+            scraper_people=bool(config.get("person_dir")),
+            emby_people_path=config.get("person_dir"),
+            season_layout_mode=config.get("season_layout"),
+            season_chunk_size=config.get("season_chunk_size"),
+        ).run()
+        tasks.append(asyncio.create_task(task))
+        retry_list.append(error_video)
     if len(tasks) == 0:
         return True
     res = await asyncio.gather(*tasks)
-    for i in range(retry_video_number):
-        if res[i]:
-            _LOGGER.info(f"视频{error_video_list[i]['bvid']}重试成功")
-            await files.ErrorVideoController().remove_error_video(error_video_list[i]["bvid"], error_video_list[i]["page"])
-        elif not res[i]:
-            _LOGGER.warning(f"视频{error_video_list[i]['bvid']}重试失败")
+    # 失败的视频在SaveOneVideo里已经重新记录，重试次数加1并推迟下次重试时间
+    for error_video, ok in zip(retry_list, res):
+        if ok:
+            _LOGGER.info(f"视频{error_video['bvid']}重试成功")
+            await files.ErrorVideoController().remove_error_video(error_video["bvid"], error_video["page"])
+        else:
+            _LOGGER.warning(f"视频{error_video['bvid']}重试失败")
     if False in res:
         return False
-    return True
\ No newline at end of file
+    return True
@@ -0,0 +1,135 @@
+"""UP主文件夹模式下的分季方式，以及把已有视频迁移到新分季方式的工具
+
+视频很多的UP主全部放在Season 1时，单个目录下会有上千个文件夹，媒体服务器扫描很慢。
+可以按发布年份（Season 2023）或每N集一季分开存放。
+"""
+import os
+import re
+import shutil
+import time
+
+from lxml import etree
+
+from plugins.BilibiliDownloader.core import episode_index, library_index, nfo_generator
+from plugins.BilibiliDownloader.utils import LOGGER
+from plugins.BilibiliDownloader.utils.others import SeasonLayout
+
+_LOGGER = LOGGER
+SEASON_DIR_PATTERN = re.compile(r"^Season (\d+)$")
+DEFAULT_CHUNK_SIZE = 100
+
+
+def season_number(layout: SeasonLayout, pubdate: int, episode: int, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """计算视频所在的季
+
+    :param layout: 分季方式
+    :param pubdate: 视频发布时间戳
+    :param episode: 视频集数，从1开始
+    :param chunk_size: 按集数分季时每季的集数
+    :return: 季数
+    """
+    if layout == SeasonLayout.YEAR:
+        return int(time.strftime("%Y", time.localtime(pubdate)))
+    if layout == SeasonLayout.CHUNK:
+        return (episode - 1) // chunk_size + 1
+    return 1
+
+
+def season_dir(show_path: str, season: int) -> str:
+    """季文件夹路径"""
+    return f"{show_path}/Season {season}"
+
+
+def _find_episode_nfo(episode_path: str) -> str | None:
+    for filename in os.listdir(episode_path):
+        if filename.endswith(".nfo"):
+            nfo_path = os.path.join(episode_path, filename)
+            try:
+                if etree.parse(nfo_path).getroot().tag == "episodedetails":
+                    return nfo_path
+            except (etree.XMLSyntaxError, OSError):
+                continue
+    return None
+
+
+def _rewrite_season(nfo_path: str, tree: etree.ElementTree, season: int) -> None:
+    """原地改写episodedetails nfo中的季数"""
+    root = tree.getroot()
+    node = root.find("season")
+    if node is None:
+        node = etree.SubElement(root, "season")
+    node.text = str(season)
+    nfo_generator.write_nfo(tree, nfo_path)
+
+
+def migrate_uploader_folder(
+        show_path: str, mid: int, layout: SeasonLayout, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> int:
+    """把一个UP主文件夹下的视频按照新的分季方式重新放置，并原地改写episodedetails nfo的季数
+
+    :param show_path: UP主文件夹
+    :param mid: UP主uid
+    :param layout: 新的分季方式
+    :param chunk_size: 按集数分季时每季的集数
+    :return: 移动了的视频数量
+    """
+    index = episode_index.get_episode_index(mid)
+    index.ensure_built(show_path)
+    library = library_index.get_library_index()
+    moved = 0
+    for season_name in sorted(os.listdir(show_path)):
+        match = SEASON_DIR_PATTERN.match(season_name)
+        if match is None:
+            continue
+        current_season = int(match.group(1))
+        current_dir = f"{show_path}/{season_name}"
+        for name in sorted(os.listdir(current_dir)):
+            episode_path = f"{current_dir}/{name}"
+            if not os.path.isdir(episode_path):
+                continue
+            nfo_path = _find_episode_nfo(episode_path)
+            if nfo_path is None:
+                continue
+            tree = etree.parse(nfo_path)
+            bvid = (tree.findtext("id") or "").strip()
+            episode = index.get(bvid) or int(tree.findtext("episode") or 1)
+            pubdate = index.get_pubdate(bvid)
+            if pubdate is None:
+                premiered = (tree.findtext("premiered") or "").strip()
+                pubdate = int(time.mktime(time.strptime(premiered, "%Y-%m-%d"))) if premiered else 0
+            target_season = season_number(layout, pubdate, episode, chunk_size)
+            if target_season != current_season:
+                target_path = f"{season_dir(show_path, target_season)}/{name}"
+                if os.path.exists(target_path):
+                    # 没有移动的视频保留原来的季数，nfo和所在的季文件夹保持一致
+                    _LOGGER.warning(f"目标文件夹已存在，跳过迁移：{episode_path} -> {target_path}")
+                    continue
+                os.makedirs(season_dir(show_path, target_season), exist_ok=True)
+                shutil.move(episode_path, target_path)
+                library.relocate(episode_path, target_path)
+                nfo_path = os.path.join(target_path, os.path.basename(nfo_path))
+                moved += 1
+            if (tree.findtext("season") or "").strip() != str(target_season):
+                _rewrite_season(nfo_path, tree, target_season)
+        if not os.listdir(current_dir):
+            os.rmdir(current_dir)
+    _LOGGER.info(f"UP主文件夹迁移完成：{show_path}，移动了 {moved} 个视频")
+    return moved
+
+
+def migrate_library(media_path: str, layout: SeasonLayout, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """迁移媒体库中所有UP主文件夹（文件夹名为 UP主名-uid 且包含tvshow.nfo）
+
+    :param media_path: 媒体库路径
+    :param layout: 新的分季方式
+    :param chunk_size: 按集数分季时每季的集数
+    :return: 移动了的视频数量
+    """
+    moved = 0
+    for name in sorted(os.listdir(media_path)):
+        show_path = f"{media_path}/{name}"
+        mid = name.rsplit("-", 1)[-1]
+        if not mid.isdigit() or not os.path.exists(f"{show_path}/tvshow.nfo"):
+            continue
+        moved += migrate_uploader_folder(show_path, int(mid), layout, chunk_size)
+    return moved
@@ -0,0 +1,92 @@
+"""根据下载时选中的dash流生成nfo中的 <fileinfo><streamdetails>
+
+nfo里有完整的流信息时，Emby/Jellyfin不需要再对每个新文件运行ffprobe。
+这些信息在取流时就已经拿到了（分辨率、编码、帧率、码率），不需要再探测混流后的文件。
+"""
+from fractions import Fraction
+
+# dash中codecs字段的前缀 -> nfo中的编码名
+VIDEO_CODECS = {"avc1": "h264", "avc3": "h264", "hev1": "hevc", "hvc1": "hevc", "av01": "av1"}
+AUDIO_CODECS = {"mp4a": "aac", "ec-3": "eac3", "ac-3": "ac3", "flac": "flac"}
+AUDIO_CHANNELS = {"aac": 2}  # b站的aac音轨都是双声道，其他编码的声道数取流结果里没有，留给媒体服务器
+
+
+def codec_name(codecs: str, mapping: dict) -> str | None:
+    """把dash的codecs（如 avc1.640032、mp4a.40.2）转换为nfo中的编码名，未知编码返回None"""
+    if not codecs:
+        return None
+    prefix = codecs.split(".", 1)[0].lower()
+    return mapping.get(prefix)
+
+
+def _frame_rate(frame_rate: str) -> str | None:
+    """帧率可能是 "29.970" 也可能是 "30000/1001"，统一为保留三位小数的字符串"""
+    if not frame_rate:
+        return None
+    try:
+        return f"{float(Fraction(frame_rate)):.3f}"
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _duration(playurl: dict) -> int | None:
+    """取流结果里的时长，timelength为毫秒，比dash.duration（整秒）更精确"""
+    if playurl.get("timelength"):
+        return round(playurl["timelength"] / 1000)
+    return playurl.get("dash", {}).get("duration")
+
+
+def from_dash(playurl: dict, video_stream: dict, audio_stream: dict) -> dict:
+    """从取流结果和选中的音视频流中取出流信息
+
+    :param playurl: get_download_url的返回值
+    :param video_stream: 选中的视频流
+    :param audio_stream: 选中的音频流
+    :return: {"duration": 秒, "video": {...}, "audio": {...}}，可以直接存进媒体库索引
+    """
+    video_info = {
+        "codec": codec_name(video_stream.get("codecs"), VIDEO_CODECS),
+        "width": video_stream.get("width"),
+        "height": video_stream.get("height"),
+        "framerate": _frame_rate(video_stream.get("frameRate") or video_stream.get("frame_rate")),
+        "bitrate": video_stream.get("bandwidth"),
+    }
+    audio_codec = codec_name(audio_stream.get("codecs"), AUDIO_CODECS)
+    audio_info = {
+        "codec": audio_codec,
+        "channels": AUDIO_CHANNELS.get(audio_codec),
+        "bitrate": audio_stream.get("bandwidth"),
+    }
+    return {"duration": _duration(playurl), "video": video_info, "audio": audio_info}
+
+
+def fileinfo(streams: dict, duration: int = None) -> dict | None:
+    """生成nfo的fileinfo节点
+
+    :param streams: from_dash的返回值
+    :param duration: 取流结果里没有时长时使用的时长（秒）
+    :return: 可以直接交给nfo_generator.build_nfo的字段值，没有流信息时返回None
+    """
+    if not streams:
+        return None
+    video = streams.get("video") or {}
+    audio = streams.get("audio") or {}
+    duration = streams.get("duration") or duration
+    width, height = video.get("width"), video.get("height")
+    streamdetails = {
+        "video": {
+            "codec": video.get("codec"),
+            "aspect": f"{width / height:.2f}" if width and height else None,
+            "width": width,
+            "height": height,
+            "framerate": video.get("framerate"),
+            "bitrate": video.get("bitrate"),
+            "durationinseconds": duration,
+        },
+        "audio": {
+            "codec": audio.get("codec"),
+            "channels": audio.get("channels"),
+            "bitrate": audio.get("bitrate"),
+        },
+    }
+    return {"streamdetails": streamdetails}
@@ -0,0 +1,63 @@
+"""根据up主的投稿历史估算多久查询一次
+
+日更的up主隔几十分钟查一次，一年一更的up主隔半天查一次，接口预算大部分花在最可能已经更新的up主上。
+"""
+import statistics
+import time
+
+MIN_INTERVAL = 10 * 60  # 最短查询间隔
+MAX_INTERVAL = 12 * 3600  # 最长查询间隔
+DEFAULT_INTERVAL = 2 * 3600  # 投稿记录不足时的查询间隔
+CHECKS_PER_UPLOAD = 6  # 两次投稿之间大约查询几次
+QUIET_FACTOR = 3  # 超过平常投稿间隔几倍还没更新时，认为up主停更了，逐渐放慢查询
+HISTORY_SIZE = 30  # 每个up主保留的投稿时间数
+HOUR_WINDOW = 1  # 判断常用投稿时段时，前后各看几个小时
+ACTIVE_HOUR_SHARE = 0.25  # 当前时段的投稿占比超过这个值时，认为是up主的常用投稿时段
+
+
+def typical_gap(timestamps: list[int]) -> float | None:
+    """两次投稿之间的典型间隔（中位数），投稿记录不足时为None"""
+    ordered = sorted(set(timestamps))
+    gaps = [b - a for a, b in zip(ordered, ordered[1:])]
+    if not gaps:
+        return None
+    return statistics.median(gaps)
+
+
+def is_active_hour(timestamps: list[int], now: float) -> bool:
+    """现在是否是up主常用的投稿时段（按本地时间的小时统计）"""
+    if len(timestamps) < 3:
+        return False
+    hour = time.localtime(now).tm_hour
+    distances = [(time.localtime(ts).tm_hour - hour) % 24 for ts in timestamps]
+    near = sum(1 for d in distances if min(d, 24 - d) <= HOUR_WINDOW)
+    return near / len(timestamps) >= ACTIVE_HOUR_SHARE
+
+
+def poll_interval(timestamps: list[int], now: float = None,
+                  min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL) -> float:
+    """根据投稿历史计算这个up主的查询间隔
+
+    离预计的下次投稿时间还远时，每次等剩余时间的一半；临近或超过预计时间后按平常间隔的1/CHECKS_PER_UPLOAD查询；
+    超过平常间隔QUIET_FACTOR倍还没更新时，按停更的时间放慢。在常用投稿时段内间隔减半。
+
+    :param timestamps: 投稿时间戳
+    :param now: 当前时间戳
+    :param min_interval: 最短间隔
+    :param max_interval: 最长间隔
+    :return: 查询间隔（秒）
+    """
+    now = time.time() if now is None else now
+    gap = typical_gap(timestamps)
+    if gap is None:
+        interval = DEFAULT_INTERVAL
+    else:
+        elapsed = now - max(timestamps)
+        interval = gap / CHECKS_PER_UPLOAD
+        if elapsed < gap:
+            interval = max(interval, (gap - elapsed) / 2)
+        elif elapsed > gap * QUIET_FACTOR:
+            interval = max(interval, elapsed / CHECKS_PER_UPLOAD)
+    if is_active_hour(timestamps, now):
+        interval /= 2
+    return min(max_interval, max(min_interval, interval))
@@ -0,0 +1,77 @@
+"""缓存UP主信息，并根据内容哈希判断剧集（UP主）的tvshow.nfo和封面是否需要重新生成"""
+import hashlib
+import threading
+import time
+
+from plugins.BilibiliDownloader.core import public_function
+from plugins.BilibiliDownloader.utils import LOGGER
+
+_LOGGER = LOGGER
+UPLOADER_INFO_TTL = 6 * 3600  # UP主信息缓存时间，单位秒
+SERIES_HASH_KEYS = ("name", "sign", "face")  # 这些字段变化时才需要重写tvshow.nfo和封面
+
+
+def series_hash(uploader_info: dict) -> str:
+    """计算UP主信息中会影响tvshow.nfo和封面的字段的哈希
+
+    :param uploader_info: get_user_info返回的UP主信息
+    """
+    content = "\n".join(str(uploader_info.get(key, "")) for key in SERIES_HASH_KEYS)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class UploaderInfoCache:
+    """按UP主uid缓存UP主信息，同一个UP主的多个视频在缓存时间内只请求一次"""
+
+    def __init__(self, ttl: int = UPLOADER_INFO_TTL):
+        """
+        :param ttl: 缓存时间，单位秒
+        """
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, mid: int) -> dict | None:
+        """读取缓存，过期则丢弃并返回None"""
+        with self._lock:
+            cached = self._cache.get(mid)
+            if cached is None:
+                return None
+            expire_at, uploader_info = cached
+            if expire_at <= time.monotonic():
+                del self._cache[mid]
+                return None
+            return uploader_info
+
+    def put(self, mid: int, uploader_info: dict) -> None:
+        """写入缓存"""
+        with self._lock:
+            self._cache[mid] = (time.monotonic() + self.ttl, uploader_info)
+
+    def invalidate(self, mid: int) -> None:
+        """删除缓存"""
+        with self._lock:
+            self._cache.pop(mid, None)
+
+    async def get_uploader_info(self, mid: int) -> dict | bool:
+        """获取UP主信息，优先使用缓存
+
+        :param mid: UP主uid
+        :return: UP主信息，获取失败返回False（失败结果不缓存）
+        """
+        uploader_info = self.get(mid)
+        if uploader_info is not None:
+            _LOGGER.info(f"使用缓存的UP主信息：{mid}")
+            return uploader_info
+        uploader_info = await public_function.get_uploader_info(mid)
+        if uploader_info:
+            self.put(mid, uploader_info)
+        return uploader_info
+
+
+_uploader_info_cache = UploaderInfoCache()
+
+
+async def get_uploader_info(mid: int) -> dict | bool:
+    """使用插件全局共用的缓存获取UP主信息"""
+    return await _uploader_info_cache.get_uploader_info(mid)
@@ -3,24 +3,59 @@ movie-robot快捷指令注册
 """
 import asyncio
 import logging
-import re
 import threading
 import traceback
 
-from bilibili_api import sync, video
 from mbot.core.params import ArgSchema, ArgType
 from mbot.core.plugins import plugin, PluginCommandContext, PluginCommandResponse
 
-from ..utils import global_value
+from plugins.BilibiliDownloader.core import batch_resolver, main_video_process, season_layout, rescrape
+from plugins.BilibiliDownloader import process_pages_video
+from ..utils import global_value, runtime
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def find_bv(url):
-    bv = re.search(r"(?<=BV)[\w\d]+", url)
-    if bv:
-        return "BV" + bv.group(0)
-    return None
+def build_download_tasks(result: batch_resolver.BatchResolveResult) -> list:
+    """把批量解析的结果直接交给下载任务，视频信息不再重复获取
+
+    :param result: 批量解析结果
+    :return: 下载任务协程列表
+    """
+    config = global_value.get_value("config")
+    people_path = config.get("person_dir")
+    tasks = []
+    for item in result.normal:
+        tasks.append(
+            main_video_process.SaveOneVideo(
+                mode=config.get("video_save_mode"),
+                bvid=item.bvid,
+                media_path=config.get("media_path"),
+                scraper_people=bool(people_path),
+                emby_people_path=people_path,
+                video_info=item.video_info,
+                video_object=item.video_object,
+                season_layout_mode=config.get("season_layout"),
+                season_chunk_size=config.get("season_chunk_size"),
+            ).run()
+        )
+    for item in result.pages:
+        tasks.append(
+            process_pages_video.ProcessPagesVideo(
+                item.bvid,
+                bool(people_path),
+                people_path,
+                config.get("media_path"),
+                video_info=item.video_info,
+                video_object=item.video_object,
+            ).process()
+        )
+    return tasks
+
+
+async def run_download_tasks(tasks: list) -> list:
+    """在后台事件循环中同时执行下载任务"""
+    return await asyncio.gather(*tasks)
 
 
 @plugin.command(
@@ -38,50 +73,19 @@ def download(
         if not global_value.get_value("cookie_is_valid"):
             _LOGGER.info("请登录b站后再尝试下载！")
             return PluginCommandResponse(False, "请先扫码登录b站再试！")
-        video_id = video_id.split(",") if "," in video_id else video_id
+        config = global_value.get_value("config")
+        if not config or not config.get("media_path"):
+            return PluginCommandResponse(False, "请先设置媒体库路径！")
         _LOGGER.info(f"提交内容: {video_id}")
-        if_people_path, people_path = bilibili_main.Utils.if_get_character()
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        tasks = []
-        if type(video_id) == list:
-            for i in video_id:
-                i = find_bv(i)
-                if i is None:
-                    return PluginCommandResponse(False, "你输入的BV号或网址中混入了怪东西，请仔细检查！")
-                page = sync(video.Video(bvid=i).get_pages())
-                if len(page) > 1:
-                    media_path = bilibili_main.Utils.get_media_path(True)
-                else:
-                    media_path = bilibili_main.Utils.get_media_path(False)
-                if media_path is False:
-                    return PluginCommandResponse(False, "请先设置媒体库路径！")
-                tasks.append(
-                    bilibili_main.BilibiliProcess(
-                        i,
-                        if_get_character=if_people_path,
-                        emby_persons_path=people_path,
-                        media_path=media_path,
-                    ).process()
-                )
-        else:
-            video_id = find_bv(video_id)
-            page = sync(video.Video(bvid=video_id).get_pages())
-            if len(page) > 1:
-                media_path = bilibili_main.Utils.get_media_path(True)
-            else:
-                media_path = bilibili_main.Utils.get_media_path(False)
-            if media_path is False:
-                return PluginCommandResponse(False, "请先设置媒体库路径！")
-            tasks.append(
-                bilibili_main.BilibiliProcess(
-                    video_id,
-                    if_get_character=if_people_path,
-                    emby_persons_path=people_path,
-                    media_path=media_path,
-                ).process()
-            )
-        loop.run_until_complete(asyncio.wait(tasks))
+        result = runtime.run(batch_resolver.resolve_videos(video_id))
+        if result.invalid:
+            return PluginCommandResponse(False, "你输入的BV号或网址中混入了怪东西，请仔细检查！")
+        if result.failed:
+            _LOGGER.warning(f"以下视频获取信息失败，跳过下载：{result.failed}")
+        tasks = build_download_tasks(result)
+        if not tasks:
+            return PluginCommandResponse(False, "没有可以下载的视频，请检查日志")
+        runtime.run(run_download_tasks(tasks))
         return PluginCommandResponse(True, "已下载完成，请刷新emby媒体库")
     except Exception as e:
         tracebacklog = traceback.format_exc()
@@ -89,6 +93,44 @@ def download(
         return PluginCommandResponse(False, "出了点小问题，请检查日志")
 
 
+@plugin.command(
+    name="migrate_season_layout",
+    title="迁移up主目录分季",
+    desc="按照当前设置的分季方式重新整理所有up主目录，并改写集nfo中的季数",
+    icon="DriveFileMove",
+    run_in_background=True,
+)
+def migrate_season_layout(ctx: PluginCommandContext):
+    try:
+        config = global_value.get_value("config")
+        if not config or not config.get("media_path"):
+            return PluginCommandResponse(False, "请先设置媒体库路径！")
+        moved = season_layout.migrate_library(
+            config.get("media_path"), config.get("season_layout"), config.get("season_chunk_size")
+        )
+        return PluginCommandResponse(True, f"迁移完成，共移动了{moved}个视频，请刷新emby媒体库")
+    except Exception:
+        _LOGGER.error(traceback.format_exc())
+        return PluginCommandResponse(False, "出了点小问题，请检查日志")
+
+
+@plugin.command(
+    name="rescrape_library",
+    title="离线重新生成nfo",
+    desc="根据归档的原始元数据重新生成媒体库中所有视频的nfo，不会请求b站，也不会重新下载视频",
+    icon="Refresh",
+    run_in_background=True,
+)
+def rescrape_library(ctx: PluginCommandContext):
+    try:
+        config = global_value.get_value("config") or {}
+        result = rescrape.rescrape_library(people_path=config.get("person_dir"))
+        return PluginCommandResponse(True, f"nfo重新生成完成：{result.report()}")
+    except Exception:
+        _LOGGER.error(traceback.format_exc())
+        return PluginCommandResponse(False, "出了点小问题，请检查日志")
+
+
 @plugin.command(
     name="login_bilibili_by_qrcode",
     title="扫码登录bilibili",
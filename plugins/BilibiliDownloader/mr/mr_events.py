@@ -3,7 +3,7 @@
 from typing import Dict
 from typing import Optional
 
-from bilibili_api import sync, Credential
+from bilibili_api import Credential
 from mbot.core.plugins import PluginMeta
 from mbot.core.plugins import plugin
 from mbot.openapi import mbot_api
@@ -11,7 +11,7 @@ from pydantic import BaseModel, validator
 
 from plugins.BilibiliDownloader.mr import mr_cron_tasks
 from plugins.BilibiliDownloader.mr import mr_notify
-from plugins.BilibiliDownloader.utils import global_value, LOGGER, files, others
+from plugins.BilibiliDownloader.utils import global_value, LOGGER, files, others, runtime
 
 _LOGGER = LOGGER
 server = mbot_api
@@ -54,6 +54,8 @@ class ConfigModel(BaseModel):
     get_user_follow_list: bool  # 是否获取用户关注列表
     ignore_uid_list: Optional[list[int]] = []  # 忽略up主的uid
     video_save_mode: others.MediaSaveMode  # 视频保存模式
+    season_layout: Optional[others.SeasonLayout] = others.SeasonLayout.SINGLE  # up主文件夹模式下的分季方式
+    season_chunk_size: Optional[int] = 100  # 按集数分季时每季的集数
     media_path: str  # 视频保存目录
     person_dir: Optional[str] = None  # 人物信息保存目录
     """弹幕配置 start"""
@@ -90,6 +92,17 @@ class ConfigModel(BaseModel):
             return []
 
 
+    @validator("season_chunk_size", pre=True)
+    def season_chunk_size_validator(cls, v):
+        try:
+            v = int(v)
+            if v <= 0:
+                raise ValueError
+            return v
+        except (TypeError, ValueError):
+            _LOGGER.warning("每季集数设置错误，已自动设置为100")
+            return 100
+
     @validator("alpha")
     def danmaku_alpha_validator(cls, v):
         if 1 < v <= 100:
@@ -109,7 +122,7 @@ def check_config(config: dict):
     #     return False
     if files.CookieController().get_cookie():
         cookies = files.CookieController().get_cookie()
-        if sync(
+        if runtime.run(
                 Credential(
                     sessdata=cookies["SESSDATA"],
                     bili_jct=cookies["bili_jct"],
@@ -162,6 +175,7 @@ def check_config(config: dict):
     try:
         config = dict(ConfigModel.parse_obj(config))
         global_value.set_value("config", config)
+        mr_cron_tasks.apply_config(config)
         _LOGGER.info("配置已初始化完成")
     except Exception:
         _LOGGER.exception("配置初始化失败，请检查填写是否正确，或者联系作者")
@@ -108,6 +108,17 @@ class Notify:
                 to_uid=uid,
             )
 
+    async def send_quarantine_notify(self, bvid: str, reason: str):
+        """发送视频不再重试的通知，每个视频只发一次，获取不到视频信息时用bvid代替标题"""
+        _LOGGER.info("开始发送视频停止重试通知")
+        title = self.video_info["title"] if self.video_info else bvid
+        for uid in self.uids:
+            _server.notify.send_system_message(
+                title="bilibili 视频已停止重试",
+                to_uid=uid,
+                message=f"「{title}」 {reason}，已停止重试\nhttps://www.bilibili.com/video/{bvid}",
+            )
+
     async def send_error_video_notify(self):
         """发送下载失败视频通知"""
         _LOGGER.info("开始发送下载失败视频通知")
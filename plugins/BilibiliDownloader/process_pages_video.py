@@ -4,16 +4,15 @@
 import asyncio
 import logging
 import os
-import shutil
 import time
 import traceback
 
 import ffmpeg
 from bilibili_api import video, ass, exceptions
-from lxml import etree
 
 from . import bilibili_main
-from .Utils import global_value
+from .core import downloader, playurl_cache, publisher, library_index, nfo_generator, metadata_archive, stream_details
+from .utils import global_value, fs
 
 local_path = os.path.split(os.path.realpath(__file__))[0]
 # if not os.path.exists(f"{local_path}/logs"):
@@ -24,6 +23,9 @@ path = ""
 root = ""
 credential = global_value.get_value("credential")
 danmaku_config = global_value.get_value("danmaku_config")
+PAGE_DOWNLOAD_CONCURRENCY = 3  # 同时下载的分P数
+PAGE_PROCESS_CONCURRENCY = 2  # 同时混流、刮削的分P数
+SHOW_PAGE = 0  # 剧集级别（tvshow.nfo、封面）的失败记录，分P从1开始记录
 
 
 def get_config():
@@ -33,25 +35,35 @@ def get_config():
 
 
 class ProcessPagesVideo:
-    def __init__(self, video_id, if_get_character, emby_persons_path, media_path):
+    def __init__(self, video_id, if_get_character, emby_persons_path, media_path, video_info=None, video_object=None):
+        """
+        :param video_info: 已经获取过的视频信息，传入后不再重复请求
+        :param video_object: 与video_info对应的视频对象
+        """
         self.credential = credential
         self.pages_num = None
-        self.video_info = None
+        self.video_info = video_info
+        self.v = video_object
         self.video_id = video_id
         self.if_get_character = if_get_character
         self.emby_persons_path = emby_persons_path
         self.media_path = media_path
+        self.publish_latency = {}  # 分P序号 -> 从开始处理到在媒体库中可见用了多少秒
+        self.stream_info = {}  # 分P序号 -> 下载时选中的流信息
+        self._started_at = time.monotonic()
 
     async def get_video_info(self):
         try:
-            self.v = video.Video(bvid=self.video_id, credential=self.credential)
-            self.video_info = await self.v.get_info()
+            if self.video_info is None or self.v is None:
+                self.v = video.Video(bvid=self.video_id, credential=self.credential)
+                self.video_info = await self.v.get_info()
             self.video_info["title"] = self.video_info["title"].replace("/", " ")
-            self.pages_num = len(await self.v.get_pages())
+            self.pages_num = len(self.video_info["pages"])
             self.raw_year = time.strftime(
                 "%Y", time.localtime(self.video_info["pubdate"])
             )
             self.video_path = f"{bilibili_main.local_path}/{self.video_info['title']} ({self.raw_year})"
+            self.library_path = f"{self.media_path}/bilibili/{self.video_info['title']} ({self.raw_year})"
             self.title = f"「{self.video_info['title']}」"
         except Exception as e:
             _LOGGER.error(f"获取视频信息失败，视频id：{self.video_id}")
@@ -59,86 +71,129 @@ class ProcessPagesVideo:
             _LOGGER.error(f"报错原因：{tracebacklog}")
             return None
 
-    async def download_video(self, page):
+    async def download_streams(self, page):
+        """下载某一P的音视频流到临时文件夹
+
+        :param page: 第几P，从0开始
+        :return: 是否下载成功
+        """
         try:
-            if not os.path.exists(f"{self.video_path}/Season 1"):
-                os.makedirs(f"{self.video_path}/Season 1", exist_ok=True)
+            await fs.makedirs(f"{self.video_path}/Season 1")
             _LOGGER.info(f"收到视频 P{page + 1} 下载请求，开始下载到临时文件夹")
             path = f"{self.video_path}/Season 1/video_temp_{page + 1}.m4s"
-            url = await self.v.get_download_url(page_index=page)
-            video_url = url["dash"]["video"][0]["baseUrl"]
-            audio_url = url["dash"]["audio"][0]["baseUrl"]
-            res, v_size = await bilibili_main.DownloadFunc(
-                video_url, path
+            url = await playurl_cache.get_download_url(self.v, page_index=page)
+            video_stream = playurl_cache.select_stream(url, "video")
+            audio_stream = playurl_cache.select_stream(url, "audio")
+            self.stream_info[page] = {
+                "quality": video_stream.get("id"),
+                "streams": stream_details.from_dash(url, video_stream, audio_stream),
+            }
+            res, v_size = await downloader.DownloadFunc(
+                video_stream["baseUrl"], path,
+                resign=playurl_cache.make_resigner(self.v, page, "video", video_stream),
             ).download_with_resume()
             if res:
                 _LOGGER.info(f"视频 P{page + 1} 下载完成")
             else:
-                bilibili_main.Utils.write_error_video(self.video_info)
+                await bilibili_main.Utils.write_error_video(self.video_info, page + 1)
                 await bilibili_main.Utils.delete_video_folder(
                     self.video_info, target_str=f"S01E{page + 1:02d}"
                 )
-                return None
+                return False
             path = f"{self.video_path}/Season 1/audio_temp_{page + 1}.m4s"
-            res, a_size = await bilibili_main.DownloadFunc(
-                audio_url, path
+            res, a_size = await downloader.DownloadFunc(
+                audio_stream["baseUrl"], path,
+                resign=playurl_cache.make_resigner(self.v, page, "audio", audio_stream),
             ).download_with_resume()
             if res:
                 _LOGGER.info(f"音频 P{page + 1} 下载完成")
             else:
-                bilibili_main.Utils.write_error_video(self.video_info)
+                await bilibili_main.Utils.write_error_video(self.video_info, page + 1)
                 await bilibili_main.Utils.delete_video_folder(
                     self.video_info, target_str=f"S01E{page + 1:02d}"
                 )
-                return None
+                return False
             if v_size == 0 or a_size == 0 or v_size == 202 or a_size == 202:
                 _LOGGER.warning(f"{self.title} 下载资源大小不正确，放弃本次下载，稍后重试")
-                bilibili_main.Utils.write_error_video(self.video_info)
+                await bilibili_main.Utils.write_error_video(self.video_info, page + 1)
                 await bilibili_main.Utils.delete_video_folder(self.video_info, target_str=f"S01E{page + 1:02d}")
-                return
+                return False
+            return True
+        except Exception:
+            _LOGGER.error(f"视频 {self.video_info['title']} P{page + 1} 下载失败，已记录视频id，稍后重试")
+            await bilibili_main.Utils.write_error_video(self.video_info, page + 1)
+            await bilibili_main.Utils.delete_video_folder(
+                self.video_info, target_str=f"S01E{page + 1:02d}"
+            )
+            tracebacklog = traceback.format_exc()
+            _LOGGER.error(f"报错原因：{tracebacklog}")
+            return False
+
+    async def mux_video(self, page):
+        """把某一P的音视频流混流为mp4，ffmpeg放到线程里跑，不阻塞其他分P的下载
+
+        :param page: 第几P，从0开始
+        :return: 是否混流成功
+        """
+        try:
             in_video = ffmpeg.input(
                 f"{self.video_path}/Season 1/video_temp_{page + 1}.m4s"
             )
             in_audio = ffmpeg.input(
                 f"{self.video_path}/Season 1/audio_temp_{page + 1}.m4s"
             )
-            ffmpeg.output(
-                in_video,
-                in_audio,
-                f'{self.video_path}/Season 1/{self.video_info["title"]} S01E{page + 1:02d}.mp4',
-                vcodec="copy",
-                acodec="copy",
-                loglevel="error",
-            ).run(overwrite_output=True)
-            os.remove(f"{self.video_path}/Season 1/video_temp_{page + 1}.m4s")
-            os.remove(f"{self.video_path}/Season 1/audio_temp_{page + 1}.m4s")
+            await asyncio.to_thread(
+                ffmpeg.output(
+                    in_video,
+                    in_audio,
+                    f'{self.video_path}/Season 1/{self.video_info["title"]} S01E{page + 1:02d}.mp4',
+                    vcodec="copy",
+                    acodec="copy",
+                    loglevel="error",
+                ).run,
+                overwrite_output=True,
+            )
+            await fs.batch(
+                (os.remove, f"{self.video_path}/Season 1/video_temp_{page + 1}.m4s"),
+                (os.remove, f"{self.video_path}/Season 1/audio_temp_{page + 1}.m4s"),
+            )
             _LOGGER.info(
                 f'视频音频下载完成，已混流为mp4文件，文件名：{self.video_info["title"]} S01E{page + 1:02d}.mp4'
             )
+            return True
         except Exception:
-            _LOGGER.error(f"视频 {self.video_info['title']} 下载失败，已记录视频id，稍后重试")
-            bilibili_main.Utils.write_error_video(self.video_info, page + 1)
+            _LOGGER.error(f"视频 {self.video_info['title']} P{page + 1} 混流失败，已记录视频id，稍后重试")
+            await bilibili_main.Utils.write_error_video(self.video_info, page + 1)
             await bilibili_main.Utils.delete_video_folder(
                 self.video_info, target_str=f"S01E{page + 1:02d}"
             )
             tracebacklog = traceback.format_exc()
             _LOGGER.error(f"报错原因：{tracebacklog}")
+            return False
 
-    async def download_video_cover(self, page):
-        """下载视频封面"""
-        if bilibili_main.Utils.read_error_video(self.video_info):
-            return
+    async def download_video(self, page):
+        """下载并混流某一P
+
+        :param page: 第几P，从0开始
+        :return: 是否成功
+        """
+        if not await self.download_streams(page):
+            return False
+        return await self.mux_video(page)
+
+    async def download_video_cover(self):
+        """下载视频封面，剧集封面所有分P共用，失败记录在剧集级别（P0），不影响正在处理的分P"""
         _LOGGER.info("开始下载视频封面")
         path = f"{self.video_path}/poster.jpg"
-        res = await bilibili_main.DownloadFunc(
+        res = await downloader.DownloadFunc(
             self.video_info["pic"], path
         ).download_cover()
         if res:
             _LOGGER.info("视频封面下载完成")
+            return True
         else:
-            bilibili_main.Utils.write_error_video(self.video_info, page=page + 1)
-            await bilibili_main.Utils.delete_video_folder(self.video_info)
-            return None
+            await bilibili_main.Utils.write_error_video(self.video_info, page=SHOW_PAGE)
+            return False
 
     async def gen_video_nfo(self, page, media_type):
         """生成视频nfo文件
@@ -146,78 +201,46 @@ class ProcessPagesVideo:
         :param page: 第几P
         :param media_type: nfo类型，有tvshow和episodedetails两种
         """
-        global root, path
         try:
-            if bilibili_main.Utils.read_error_video(self.video_info, page):
-                return
+            if media_type == 2 and await bilibili_main.Utils.read_error_video(self.video_info, page + 1):
+                # 这一P已经有失败记录，跳过的步骤按失败处理，不能让没处理完的分P被发布
+                return False
             _LOGGER.info("开始生成nfo文件")
-            video_info = self.video_info
-            if media_type == 1:
-                root = etree.Element("tvshow")
-                title = etree.SubElement(root, "title")
-                title.text = video_info["title"]
-            elif media_type == 2:
-                root = etree.Element("episodedetails")
-                title = etree.SubElement(root, "title")
-                title.text = video_info["pages"][page]["part"]
-            plot = etree.SubElement(root, "plot")
-            plot.text = video_info["desc"]
-            year = etree.SubElement(root, "year")
-            year.text = time.strftime("%Y", time.localtime(video_info["pubdate"]))
-            premiered = etree.SubElement(root, "premiered")
-            premiered.text = time.strftime(
-                "%Y-%m-%d", time.localtime(video_info["pubdate"])
-            )
-            studio = etree.SubElement(root, "studio")
-            studio.text = video_info["owner"]["name"]
-            id = etree.SubElement(root, "id")
-            id.text = video_info["bvid"]
-            genre = etree.SubElement(root, "genre")
-            genre.text = video_info["tname"]
-            runtime = etree.SubElement(root, "runtime")
-            runtime.text = (
-                str(self.video_info["duration"] // 60)
-                if self.video_info["duration"] // 60 > 0
-                else "1"
+            generator = nfo_generator.NfoGenerator(
+                self.video_info, page=page, streams=self.stream_info.get(page, {}).get("streams")
             )
-            try:
-                for character in video_info["staff"]:
-                    actor = etree.SubElement(root, "actor")
-                    name = etree.SubElement(actor, "name")
-                    name.text = character["name"]
-                    role = etree.SubElement(actor, "role")
-                    role.text = character["title"]
-                    mid = etree.SubElement(actor, "bilibili_id")
-                    mid.text = str(character["mid"])
-            except KeyError:
-                actor = etree.SubElement(root, "actor")
-                name = etree.SubElement(actor, "name")
-                name.text = video_info["owner"]["name"]
-                type = etree.SubElement(actor, "type")
-                type.text = "UP主"
-                mid = etree.SubElement(actor, "bilibili_id")
-                mid.text = str(video_info["owner"]["mid"])
-            tree = etree.ElementTree(root)
             if media_type == 1:
+                tree = generator.build("tvshow")
                 path = f"{self.video_path}/tvshow.nfo"
             elif media_type == 2:
+                # 每一P是一集，标题使用分P名
+                fields = generator.video_fields()
+                fields["title"] = self.video_info["pages"][page]["part"]
+                tree = nfo_generator.build_nfo("episodedetails", fields)
                 path = f"{self.video_path}/Season 1/{self.video_info['title']} S01E{page + 1:02d}.nfo"
-            tree.write(path, encoding="utf-8", pretty_print=True, xml_declaration=True)
+            await fs.run(nfo_generator.write_nfo, tree, path)
             _LOGGER.info("视频nfo文件生成完成")
+            return True
         except Exception as e:
             _LOGGER.error(f"nfo生成失败，已记录视频id，稍后重试")
-            bilibili_main.Utils.write_error_video(self.video_info, page + 1)
-            await bilibili_main.Utils.delete_video_folder(
-                self.video_info, target_str=f"S01E{page + 1:02d}"
-            )
+            if media_type == 1:
+                # tvshow.nfo是剧集级别的文件，失败记录在P0，分P可能还在处理，不删除任何文件
+                await bilibili_main.Utils.write_error_video(self.video_info, SHOW_PAGE)
+            else:
+                await bilibili_main.Utils.write_error_video(self.video_info, page + 1)
+                await bilibili_main.Utils.delete_video_folder(
+                    self.video_info, target_str=f"S01E{page + 1:02d}"
+                )
             tracebacklog = traceback.format_exc()
             _LOGGER.error(f"报错原因：{tracebacklog}")
+            return False
 
     async def get_screenshot(self, page):
         """获取视频截图"""
         try:
-            if bilibili_main.Utils.read_error_video(self.video_info, page):
-                return
+            if await bilibili_main.Utils.read_error_video(self.video_info, page + 1):
+                # 这一P已经有失败记录，跳过的步骤按失败处理，不能让没处理完的分P被发布
+                return False
             _LOGGER.info("开始给视频截图")
             path = f'{self.video_path}/Season 1/{self.video_info["title"]} S01E{page + 1:02d}.mp4'
             input_video = ffmpeg.input(path)
@@ -229,16 +252,18 @@ class ProcessPagesVideo:
                 loglevel="error",
                 vframes=1,
             )
-            ffmpeg.run(screenshot)
+            await asyncio.to_thread(ffmpeg.run, screenshot)
             _LOGGER.info("视频截图完成")
+            return True
         except Exception as e:
             _LOGGER.error(f"视频截图失败，已记录视频id，稍后重试")
-            bilibili_main.Utils.write_error_video(self.video_info, page + 1)
+            await bilibili_main.Utils.write_error_video(self.video_info, page + 1)
             await bilibili_main.Utils.delete_video_folder(
                 self.video_info, target_str=f"S01E{page + 1:02d}"
             )
             tracebacklog = traceback.format_exc()
             _LOGGER.error(f"报错原因：{tracebacklog}")
+            return False
 
     async def retry_one_page(self, page):
         """重试下载某一P"""
@@ -246,11 +271,18 @@ class ProcessPagesVideo:
             _LOGGER.info(f"开始重试第{page}P")
             media_path = bilibili_main.Utils.get_media_path(True)
             # media_path = "E:\PycharmProjects\MovieRobotPlugins\BilibiliDownloadToEmby"
-            if os.path.exists(
+            if await fs.exists(
                     f"{media_path}/bilibili/{self.video_info['title']} ({self.raw_year})/Season 1"
             ):
                 _LOGGER.info(f"开始重试第{page}P")
                 page = int(page)
+                if page == SHOW_PAGE:
+                    # 剧集级别的失败只需要重新生成tvshow.nfo和封面
+                    await fs.makedirs(self.video_path)
+                    if await self.publish_show():
+                        await fs.rmtree(self.video_path, ignore_errors=True)
+                        _LOGGER.info("tvshow.nfo和封面重试完成，已移动至媒体目录")
+                    return
                 # bProcess = bilibili_main.BilibiliProcess(
                 #     self.video_id,
                 #     self.media_path,
@@ -262,23 +294,21 @@ class ProcessPagesVideo:
                 # await bProcess.download_video_cover()
                 # await bProcess.gen_video_nfo()
                 # await bProcess.downlod_ass_danmakus()
+                # 先删掉这一P的失败记录，重试中任何一步再失败都会重新记录
+                await bilibili_main.Utils.remove_error_video(self.video_info, page)
                 await self.get_video_info()
                 await self.download_video(page=page - 1)
                 await self.gen_video_nfo(media_type=2, page=page - 1)
                 await self.get_screenshot(page=page - 1)
                 await self.downlod_ass_danmakus(page=page - 1)
-                if bilibili_main.Utils.read_error_video(self.video_info):
-                    bilibili_main.Utils.remove_error_video(self.video_info)
+                if await bilibili_main.Utils.read_error_video(self.video_info, page):
                     return
-                file_list = os.listdir(f"{self.video_path}/Season 1")
-                for file in file_list:
-                    src = os.path.join(f"{self.video_path}/Season 1", file)
-                    dst = os.path.join(
-                        f"{media_path}/bilibili/{self.video_info['title']} ({self.raw_year})/Season 1",
-                        file,
-                    )
-                    shutil.move(src, dst)
-                shutil.rmtree(
+                await publisher.publish_files(
+                    f"{self.video_path}/Season 1",
+                    f"{media_path}/bilibili/{self.video_info['title']} ({self.raw_year})/Season 1",
+                    self._episode_files(page - 1),
+                )
+                await fs.rmtree(
                     f"{bilibili_main.local_path}/{self.video_info['title']} ({self.raw_year})"
                 )
                 _LOGGER.info(f"第{str(page)}P重试完成，已移动至媒体目录")
@@ -286,9 +316,10 @@ class ProcessPagesVideo:
                 _LOGGER.error(f"视频文件夹不存在，稍后重试")
         except Exception as e:
             _LOGGER.error(f"第{str(page)}P重试失败，已记录视频id，稍后重试")
-            bilibili_main.Utils.write_error_video(self.video_info, page + 1)
+            # 这里的page已经是从1开始的分P号
+            await bilibili_main.Utils.write_error_video(self.video_info, int(page))
             await bilibili_main.Utils.delete_video_folder(
-                self.video_info, target_str=f"S01E{page + 1:02d}"
+                self.video_info, target_str=f"S01E{int(page):02d}"
             )
             tracebacklog = traceback.format_exc()
             _LOGGER.error(f"报错原因：{tracebacklog}")
@@ -296,8 +327,9 @@ class ProcessPagesVideo:
     async def downlod_ass_danmakus(self, page):
         """下载弹幕"""
         try:
-            if bilibili_main.Utils.read_error_video(self.video_info, page):
-                return
+            if await bilibili_main.Utils.read_error_video(self.video_info, page + 1):
+                # 这一P已经有失败记录，跳过的步骤按失败处理，不能让没处理完的分P被发布
+                return False
             _LOGGER.info(f"开始下载视频 {self.title} 弹幕")
             path = f'{self.video_path}/Season 1/{self.video_info["title"]} S01E{page + 1:02d}.danmakus.ass'
             # 这是我个人比较舒服的弹幕样式，可以自行修改
@@ -313,29 +345,109 @@ class ProcessPagesVideo:
                 static_time=danmaku_config["static_time"],
             )
             _LOGGER.info(f"视频 {self.title} 弹幕下载完成")
-            if danmaku_config["number"] is None:
-                return
-            else:
+            if danmaku_config["number"] is not None:
                 _LOGGER.info(f"开始随机删除弹幕到 {danmaku_config['number']} 条")
                 await bilibili_main.Utils.remove_some_danmaku(
                     path, danmaku_config["number"]
                 )
+            return True
         except exceptions.DanmakuClosedException:
             _LOGGER.warning(f"视频 {self.title} 弹幕下载失败，弹幕已关闭")
+            return True
         except Exception:
             _LOGGER.error(f"视频 {self.title} 弹幕下载失败，已记录视频id，稍后重试")
-            bilibili_main.Utils.write_error_video(self.video_info, page + 1)
+            await bilibili_main.Utils.write_error_video(self.video_info, page + 1)
             await bilibili_main.Utils.delete_video_folder(
                 self.video_info, target_str=f"S01E{page + 1:02d}"
             )
             tracebacklog = traceback.format_exc()
             _LOGGER.error(f"报错原因：{tracebacklog}")
+            return False
+
+    def _episode_files(self, page):
+        """某一P发布到媒体库的所有文件"""
+        name = f'{self.video_info["title"]} S01E{page + 1:02d}'
+        return [f"{name}.mp4", f"{name}.nfo", f"{name}-thumb.jpg", f"{name}.danmakus.ass"]
+
+    async def publish_show(self):
+        """先把剧集的tvshow.nfo和封面发布（或覆盖更新）到媒体库，第一集发布时剧集就能被识别
+
+        剧集级别的失败单独记录在P0，不会被某一P开始处理时清掉，下次重试时会重新生成
+
+        :return: tvshow.nfo和封面是否都已生成并发布
+        """
+        await bilibili_main.Utils.remove_error_video(self.video_info, SHOW_PAGE)
+        cover_ok = await self.download_video_cover()
+        nfo_ok = await self.gen_video_nfo(0, 1)
+        show_files = [name for name, ok in (("tvshow.nfo", nfo_ok), ("poster.jpg", cover_ok)) if ok]
+        await publisher.publish_files(self.video_path, self.library_path, show_files)
+        await fs.run(metadata_archive.save_video_info, self.video_info["bvid"], self.video_info)
+        return cover_ok and nfo_ok
+
+    async def publish_page(self, page):
+        """某一P处理完成后立刻发布到媒体库
+
+        :param page: 第几P，从0开始
+        """
+        season_path = f"{self.library_path}/Season 1"
+        published = await publisher.publish_files(
+            f"{self.video_path}/Season 1", season_path, self._episode_files(page)
+        )
+        name = f'{self.video_info["title"]} S01E{page + 1:02d}'
+        await fs.run(
+            library_index.get_library_index().record,
+            self.video_info["bvid"],
+            page,
+            season_path,
+            media=f"{season_path}/{name}.mp4",
+            nfo=f"{season_path}/{name}.nfo",
+            kind="episode",
+            quality=self.stream_info.get(page, {}).get("quality"),
+            cid=self.video_info["pages"][page]["cid"],
+            artifacts=published,
+            streams=self.stream_info.get(page, {}).get("streams"),
+            season=1,
+            episode=page + 1,
+        )
+        self.publish_latency[page] = time.monotonic() - self._started_at
+        _LOGGER.info(f"{self.title} P{page + 1} 已在媒体库中可见，距开始处理 {self.publish_latency[page]:.1f} 秒")
+
+    async def _process_page(self, page):
+        """单个分P的流水线：下载占用下载槽位，下载完立刻让给下一个分P，混流刮削在另一组槽位里进行
+
+        :param page: 第几P，从0开始
+        :return: 是否处理成功
+        """
+        try:
+            if await fs.run(library_index.get_library_index().has, self.video_info["bvid"], page):
+                _LOGGER.info(f"{self.title} P{page + 1} 已在媒体库中，跳过")
+                return True
+            # 这次要重新处理这一P，清掉之前的失败记录，否则后面每一步都会被跳过
+            await bilibili_main.Utils.remove_error_video(self.video_info, page + 1)
+            async with self._download_slots:
+                if not await self.download_streams(page):
+                    return False
+            async with self._process_slots:
+                ok = (
+                    await self.mux_video(page)
+                    and await self.gen_video_nfo(page, 2)
+                    and await self.get_screenshot(page)
+                    and await self.downlod_ass_danmakus(page)
+                )
+            name = f'{self.video_path}/Season 1/{self.video_info["title"]} S01E{page + 1:02d}'
+            if ok and not all(await fs.batch((os.path.exists, f"{name}.mp4"), (os.path.exists, f"{name}.nfo"))):
+                _LOGGER.error(f"{self.title} P{page + 1} 缺少视频或nfo文件，不发布，等待重试")
+                await bilibili_main.Utils.write_error_video(self.video_info, page + 1)
+                ok = False
+            if ok:
+                await self.publish_page(page)
+            return ok
+        except Exception:
+            _LOGGER.error(f"分P P{page + 1} 处理出现未知错误：\n{traceback.format_exc()}")
+            return False
 
     async def process(self):
         """视频处理"""
-        if not os.path.exists(f"{bilibili_main.local_path}/error_video.txt"):
-            with open(f"{bilibili_main.local_path}/error_video.txt", "w") as f:
-                pass
         try:
             bProcess = bilibili_main.BilibiliProcess(
                 self.video_id,
@@ -344,28 +456,41 @@ class ProcessPagesVideo:
                 self.if_get_character,
             )
             await self.get_video_info()
-            await bProcess.get_video_info()
+            await bProcess.get_video_info(self.video_info)
         except Exception:
             tracebacklog = traceback.format_exc()
             _LOGGER.error(f"获取视频信息失败，请检查提交的bv号是否正确")
             _LOGGER.error(tracebacklog)
             return
-        if bilibili_main.Utils.read_error_video(self.video_info):
-            return
-        for page in range(self.pages_num):
-            await self.download_video(page)
-            await self.gen_video_nfo(page, 2)
-            await self.get_screenshot(page)
-            await self.downlod_ass_danmakus(page)
-            await self.download_video_cover(page)
-        await self.gen_video_nfo(0, 1)
+        # 失败记录按分P（从1开始）保存，是否跳过由每一P的流水线自己判断
+        self._started_at = time.monotonic()
+        await fs.run(library_index.get_library_index().ensure_built, self.media_path)
+        show_ok = await self.publish_show()
+        self._download_slots = asyncio.Semaphore(PAGE_DOWNLOAD_CONCURRENCY)
+        self._process_slots = asyncio.Semaphore(PAGE_PROCESS_CONCURRENCY)
+        # gather按分P顺序返回结果，单个分P失败只影响它自己
+        page_results = await asyncio.gather(
+            *[self._process_page(page) for page in range(self.pages_num)]
+        )
+        failed_pages = [page + 1 for page, ok in enumerate(page_results) if ok is not True]
+        if failed_pages:
+            _LOGGER.warning(f"多P视频 {self.title} 中以下分P处理失败，等待重试：{failed_pages}")
+        if not show_ok:
+            _LOGGER.warning(f"多P视频 {self.title} 的tvshow.nfo或封面生成失败，等待重试")
+        if self.publish_latency:
+            _LOGGER.info(
+                f"多P视频 {self.title} 共发布 {len(self.publish_latency)} 集，"
+                f"首集可见耗时 {min(self.publish_latency.values()):.1f} 秒，"
+                f"末集可见耗时 {max(self.publish_latency.values()):.1f} 秒"
+            )
         if self.if_get_character:
             await bProcess.gen_character_nfo()
             await bProcess.download_character_folder()
             await bProcess.move_character_folder()
-        await bProcess.move_video_folder()
-        if bilibili_main.Utils.read_error_video(self.video_info):
+        if failed_pages or not show_ok:
             return
+        # 所有分P都已逐集发布，临时目录里只剩空壳，不再整体移动到媒体库
+        await fs.rmtree(self.video_path, ignore_errors=True)
         _LOGGER.info(f"多P视频 {self.video_info['title']} 处理完成")
         bilibili_main.Notify(self.video_info).send_all_way()
 
@@ -0,0 +1,47 @@
+"""nfo生成吞吐量基准测试，模拟批量重新刮削整个媒体库
+
+运行：python -m plugins.BilibiliDownloader.tests.bench_nfo_generator [数量]
+"""
+import sys
+import time
+
+from lxml import etree
+
+from plugins.BilibiliDownloader.core import nfo_generator
+from plugins.BilibiliDownloader.utils import LOGGER
+
+
+def build_media_info(index: int) -> dict:
+    return {
+        "title": f"【Bilibili】测试视频{index}",
+        "desc": "测试视频" * 50,
+        "bvid": f"BV1J54y1d{index:03d}"[:12],
+        "pubdate": 1672531200 + index * 3600,
+        "duration": 600 + index,
+        "tname": "测试",
+        "owner": {"mid": 1, "name": "测试UP主", "face": "https://i0.hdslb.com/bfs/face/1.jpg"},
+        "staff": [{"name": f"成员{i}", "title": "UP主", "mid": i} for i in range(3)],
+        # 真实的视频信息里分P列表和字幕列表通常很大，生成nfo时不应该被复制
+        "pages": [{"cid": i, "part": f"P{i}", "duration": 60} for i in range(200)],
+        "subtitle": {"list": [{"lan": "zh-CN", "subtitle_url": "https://example.com"} for _ in range(10)]},
+    }
+
+
+def bench(kind: str, count: int) -> float:
+    infos = [build_media_info(i) for i in range(count)]
+    start = time.perf_counter()
+    for info in infos:
+        tree = nfo_generator.NfoGenerator(info).build(kind)
+        etree.tostring(tree, encoding="utf-8", xml_declaration=True, pretty_print=True)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    LOGGER.remove()  # 基准测试不输出日志
+    for kind in ("movie", "tvshow", "episodedetails"):
+        print(f"{kind:<16}{bench(kind, count):>10.0f} nfo/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,82 @@
+import asyncio
+import functools
+import os
+import tempfile
+import time
 import unittest
+from unittest import mock
+
+import httpx
 
 from plugins.BilibiliDownloader.core import downloader
 
+CONTENT = bytes(range(256)) * 4
+
+
+def url(name: str, deadline: float) -> str:
+    return f"https://upos.example.com/{name}.m4s?deadline={int(deadline)}"
+
+
+class TestDownloadResume(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "video.m4s")
+        self.requests = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((request.method, request.url.path, request.headers.get("range")))
+        if request.url.path == "/expired.m4s":
+            return httpx.Response(403)
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={"content-length": str(len(CONTENT))})
+        start = int(request.headers["range"][len("bytes="):-1]) if "range" in request.headers else 0
+        if start == 0 and "range" not in request.headers:
+            return httpx.Response(200, content=CONTENT)
+        return httpx.Response(206, content=CONTENT[start:])
+
+    def download(self, func: downloader.DownloadFunc):
+        client = functools.partial(httpx.AsyncClient, transport=httpx.MockTransport(self.handler))
+        with mock.patch.object(downloader.httpx, "AsyncClient", client):
+            return asyncio.run(func.download_with_resume())
+
+    def write_partial(self, data: bytes):
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def test_resume_with_range(self):
+        self.write_partial(CONTENT[:100])
+        res = self.download(downloader.DownloadFunc(url("ok", time.time() + 3600), self.path))
+        self.assertEqual(res, (True, len(CONTENT)))
+        self.assertEqual(self.read(), CONTENT)
+        self.assertEqual(self.requests[-1], ("GET", "/ok.m4s", "bytes=100-"))
+
+    def test_resign_expired_url_and_resume(self):
+        self.write_partial(CONTENT[:300])
+
+        async def resign():
+            return url("fresh", time.time() + 3600)
+
+        func = downloader.DownloadFunc(url("expired", time.time() - 10), self.path, resign=resign)
+        res = self.download(func)
+        self.assertEqual(res, (True, len(CONTENT)))
+        self.assertEqual(self.read(), CONTENT)
+        self.assertEqual(self.requests[0][:2], ("HEAD", "/expired.m4s"))
+        self.assertEqual(self.requests[-1], ("GET", "/fresh.m4s", "bytes=300-"))
+
+    def test_partial_larger_than_stream_restarts(self):
+        self.write_partial(b"x" * (len(CONTENT) + 50))
+        res = self.download(downloader.DownloadFunc(url("ok", time.time() + 3600), self.path))
+        self.assertEqual(res, (True, len(CONTENT)))
+        self.assertEqual(self.read(), CONTENT)
+        self.assertEqual(self.requests[-1], ("GET", "/ok.m4s", "bytes=0-"))
+
 
 class TestDownloader(unittest.TestCase):
     def test_download(self):
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from plugins.BilibiliDownloader.core import episode_index
+
+
+class TestEpisodeIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.index = episode_index.EpisodeIndex(12345, index_dir=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_allocate_in_pubdate_order(self):
+        res = self.index.allocate_many([("BV1", 300), ("BV2", 100), ("BV3", 200)])
+        self.assertEqual(res, {"BV2": 1, "BV3": 2, "BV1": 3})
+        self.assertEqual(self.index.allocate("BV3", 200), 2)
+        self.assertEqual(self.index.allocate("BV4", 50), 4)  # 补下载的旧视频追加到末尾，已有集数不变
+        reloaded = episode_index.EpisodeIndex(12345, index_dir=self.tmp.name)
+        self.assertEqual(reloaded.get("BV4"), 4)
+        self.assertEqual(reloaded.allocate("BV5", 400), 5)
+
+    def test_concurrent_allocate(self):
+        threads = [threading.Thread(target=self.index.allocate, args=(f"BV{i}", i)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(self.index.get(f"BV{i}") for i in range(20)), list(range(1, 21)))
+
+    def test_build_from_season_folder(self):
+        season = os.path.join(self.tmp.name, "UP主-12345", "Season 1")
+        for episode, bvid in ((1, "BV1J54y1d7ZL"), (3, "BV1ZD4y1h78p")):
+            os.makedirs(f"{season}/视频{episode}")
+            with open(f"{season}/视频{episode}/视频{episode}.nfo", "w", encoding="utf-8") as f:
+                f.write(
+                    f"<episodedetails><id>{bvid}</id><premiered>2023-01-0{episode}</premiered>"
+                    f"<episode>{episode}</episode></episodedetails>"
+                )
+        self.index.ensure_built(season)
+        self.assertEqual(self.index.get("BV1ZD4y1h78p"), 3)
+        self.assertEqual(self.index.allocate("BV1uG4y1C7Q1", 0), 4)
+
+    def test_corrupt_index_rebuilds(self):
+        season = os.path.join(self.tmp.name, "UP主-12345", "Season 1")
+        os.makedirs(f"{season}/视频3")
+        with open(f"{season}/视频3/视频3.nfo", "w", encoding="utf-8") as f:
+            f.write("<episodedetails><id>BV1ZD4y1h78p</id><episode>3</episode></episodedetails>")
+        with open(self.index.index_path, "w", encoding="utf-8") as f:
+            f.write("{\"episodes\": {")
+        self.index.ensure_built(season)
+        # 损坏的索引改名保留，从Season文件夹重新建立后接着已有的集数分配，不会覆盖S01E01
+        self.assertTrue(os.path.exists(f"{self.index.index_path}.corrupt"))
+        self.assertEqual(self.index.allocate("BV1uG4y1C7Q1", 0), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
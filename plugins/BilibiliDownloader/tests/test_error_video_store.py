@@ -0,0 +1,83 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from plugins.BilibiliDownloader.utils.error_video_store import ErrorVideoStore
+
+
+class TestErrorVideoStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "error_video.db")
+        self.json_path = os.path.join(self.tmp.name, "error_video.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_record_read_remove(self):
+        store = ErrorVideoStore(self.db_path)
+        self.assertIsNone(store.read("BV1x7411L7Zv"))
+        self.assertEqual(store.record_failure("BV1x7411L7Zv", 1), 0)
+        self.assertEqual(store.record_failure("BV1x7411L7Zv", 1), 1)
+        self.assertEqual(store.record_failure("BV1J54y1d7ZL"), 0)
+        self.assertEqual(store.read("BV1x7411L7Zv", 1), 1)
+        self.assertEqual(
+            store.list_all(),
+            [{"bvid": "BV1x7411L7Zv", "page": 1, "retry": 1}, {"bvid": "BV1J54y1d7ZL", "page": 0, "retry": 0}],
+        )
+        self.assertTrue(store.remove("BV1x7411L7Zv", 1))
+        self.assertFalse(store.remove("BV1x7411L7Zv", 1))
+        store.close()
+        # 重新打开后记录还在
+        self.assertEqual(ErrorVideoStore(self.db_path).list_all(), [{"bvid": "BV1J54y1d7ZL", "page": 0, "retry": 0}])
+
+    def test_concurrent_increments_are_not_lost(self):
+        store = ErrorVideoStore(self.db_path)
+        store.record_failure("BV1x7411L7Zv")
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: store.record_failure("BV1x7411L7Zv"), range(50)))
+        self.assertEqual(store.read("BV1x7411L7Zv"), 50)
+
+    def test_backoff_and_due_order(self):
+        store = ErrorVideoStore(self.db_path)
+        store.record_failure("BV1x7411L7Zv", now=1000, base_delay=60, max_delay=600)
+        store.record_failure("BV1J54y1d7ZL", now=1010, base_delay=60, max_delay=600)
+        self.assertEqual(store.list_due(now=1059), [])
+        self.assertEqual([item["bvid"] for item in store.list_due(now=1070)], ["BV1x7411L7Zv", "BV1J54y1d7ZL"])
+        # 再失败一次推迟到 now + 60 * 2，一直失败的视频排到后面
+        store.record_failure("BV1x7411L7Zv", now=1070, base_delay=60, max_delay=600)
+        self.assertEqual([item["bvid"] for item in store.list_due(now=1190)], ["BV1J54y1d7ZL", "BV1x7411L7Zv"])
+        self.assertEqual(store.list_due(now=1190, limit=1)[0]["bvid"], "BV1J54y1d7ZL")
+        self.assertEqual(store.due_stats(now=1190), (2, 120))
+        self.assertEqual(store.due_stats(now=0), (0, None))
+        for _ in range(10):
+            store.record_failure("BV1x7411L7Zv", now=2000, base_delay=60, max_delay=600)
+        self.assertEqual(store.list_due(now=2600)[-1], {"bvid": "BV1x7411L7Zv", "page": 0, "retry": 11,
+                                                        "next_attempt": 2600, "kind": None})
+
+    def test_upgrade_keeps_old_records_due(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE error_video (bvid TEXT NOT NULL, page INTEGER NOT NULL, "
+                     "retry INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (bvid, page))")
+        conn.execute("INSERT INTO error_video VALUES ('BV1x7411L7Zv', 0, 2)")
+        conn.execute("PRAGMA user_version=1")
+        conn.commit()
+        conn.close()
+        store = ErrorVideoStore(self.db_path)
+        self.assertEqual(store.list_due(now=0), [{"bvid": "BV1x7411L7Zv", "page": 0, "retry": 2, "next_attempt": 0, "kind": None}])
+
+    def test_import_legacy_json(self):
+        with open(self.json_path, "w") as f:
+            json.dump({"BV1x7411L7Zv": {"0": 3, "2": 0}}, f, indent=4)
+        store = ErrorVideoStore(self.db_path, self.json_path)
+        self.assertEqual(store.read("BV1x7411L7Zv"), 3)
+        self.assertEqual(store.read("BV1x7411L7Zv", 2), 0)
+        self.assertFalse(os.path.exists(self.json_path))
+        self.assertTrue(os.path.exists(f"{self.json_path}.migrated"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import errno
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import ffmpeg
+from bilibili_api import exceptions
+
+from plugins.BilibiliDownloader.core import failure_taxonomy
+from plugins.BilibiliDownloader.core.failure_taxonomy import FailureKind
+from plugins.BilibiliDownloader.utils import exception, files
+from plugins.BilibiliDownloader.utils.error_video_store import ErrorVideoStore
+
+
+class TestFailureTaxonomy(unittest.TestCase):
+    def setUp(self):
+        failure_taxonomy.forget()
+
+    def test_classify(self):
+        self.assertEqual(failure_taxonomy.classify(exceptions.ResponseCodeException(-404, "啥都木有")),
+                         FailureKind.REMOVED)
+        self.assertEqual(failure_taxonomy.classify(exceptions.ResponseCodeException(87008, "充电专属")),
+                         FailureKind.PERMISSION)
+        self.assertEqual(failure_taxonomy.classify(exceptions.ResponseCodeException(-412, "请求被拦截")),
+                         FailureKind.RISK_CONTROL)
+        self.assertEqual(failure_taxonomy.classify(OSError(errno.ENOSPC, "No space left on device")),
+                         FailureKind.DISK)
+        self.assertEqual(failure_taxonomy.classify(ffmpeg.Error("ffmpeg", b"", b"")), FailureKind.MUX)
+        self.assertEqual(failure_taxonomy.classify(ConnectionResetError()), FailureKind.TRANSIENT)
+        self.assertEqual(failure_taxonomy.classify(ValueError()), FailureKind.UNKNOWN)
+
+    def test_classify_follows_chain_and_remembered_cause(self):
+        try:
+            try:
+                raise exceptions.ResponseCodeException(62002, "稿件不可见")
+            except exceptions.ResponseCodeException as e:
+                raise exception.MediaInfoError("获取视频信息失败") from e
+        except exception.MediaInfoError as e:
+            self.assertEqual(failure_taxonomy.classify(e), FailureKind.REMOVED)
+        # 下载函数吞掉异常只返回False时，用记下的异常分类
+        failure_taxonomy.remember(exceptions.NetworkException(502, "Bad Gateway"))
+        self.assertEqual(failure_taxonomy.classify(exception.DownloadAndScrapeError("下载失败")),
+                         FailureKind.TRANSIENT)
+        self.assertEqual(failure_taxonomy.policy_for(None).max_retry, 10)
+
+    def test_record_failure_quarantines_permanent_errors_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ErrorVideoStore(os.path.join(tmp, "error_video.db"))
+            with mock.patch.object(files, "get_error_video_store", return_value=store):
+                self.assertTrue(asyncio.run(failure_taxonomy.record_failure("BV1x7411L7Zv", 0, FailureKind.REMOVED)))
+                self.assertFalse(asyncio.run(failure_taxonomy.record_failure("BV1x7411L7Zv", 0, FailureKind.REMOVED)))
+                for _ in range(3):
+                    asyncio.run(failure_taxonomy.record_failure("BV1J54y1d7ZL", 0, FailureKind.MUX))
+            self.assertTrue(store.is_quarantined("BV1x7411L7Zv"))
+            self.assertEqual(store.list_due(now=float("inf")),
+                             [{"bvid": "BV1J54y1d7ZL", "page": 0, "retry": 2, "next_attempt": mock.ANY, "kind": "mux"}])
+            self.assertEqual(store.list_quarantined(),
+                             [{"bvid": "BV1x7411L7Zv", "page": 0, "retry": 0, "kind": "removed"}])
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+import unittest
+
+from plugins.BilibiliDownloader.utils.follow_state_store import FollowStateStore
+
+
+class TestFollowStateStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "follow_state.db")
+        self.json_path = os.path.join(self.tmp.name, "listen_up.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_watermarks_only_move_forward(self):
+        store = FollowStateStore(self.db_path)
+        self.assertIsNone(store.get_last_created(1))
+        self.assertTrue(store.update_last_created(1, 200))
+        self.assertFalse(store.update_last_created(1, 100))
+        self.assertFalse(store.update_last_created(1, 200))
+        self.assertTrue(store.update_last_created(1, 200, 7))
+        self.assertFalse(store.update_last_created(1, 200, 6))
+        self.assertEqual(store.get_watermark(1), (200, 7))
+        self.assertTrue(store.set_dynamic_offset(40))
+        self.assertFalse(store.set_dynamic_offset(40))
+        store.close()
+        store = FollowStateStore(self.db_path)
+        self.assertEqual((store.get_last_created(1), store.get_dynamic_offset()), (200, 40))
+        store.close()
+
+    def test_upload_history_is_bounded(self):
+        store = FollowStateStore(self.db_path)
+        self.assertTrue(store.record_uploads(1, range(100), keep=30))
+        self.assertFalse(store.record_uploads(1, [80, 90], keep=30))
+        self.assertTrue(store.record_uploads(1, [200], keep=30))
+        history = store.get_upload_history(1)
+        self.assertEqual((len(history), history[0], history[-1]), (30, 71, 200))
+        store.record_uploads(2, [5])
+        self.assertEqual(store.get_upload_histories(list(range(1000)))[2], [5])
+        store.close()
+
+    def test_import_legacy_json(self):
+        with open(self.json_path, "w") as f:
+            json.dump({"123": 1700000000, "456": 1600000000}, f)
+        store = FollowStateStore(self.db_path, self.json_path)
+        self.assertEqual(store.get_last_created(123), 1700000000)
+        self.assertIsNone(store.get_dynamic_offset())
+        self.assertFalse(os.path.exists(self.json_path))
+        self.assertTrue(os.path.exists(f"{self.json_path}.migrated"))
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
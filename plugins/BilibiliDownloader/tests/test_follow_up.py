@@ -0,0 +1,192 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from plugins.BilibiliDownloader.core import follow_up
+from plugins.BilibiliDownloader.core.poll_scheduler import PollScheduler
+from plugins.BilibiliDownloader.utils.follow_state_store import FollowStateStore
+
+
+def feed_item(dynamic_id, uid, bvid, pub_ts):
+    return {
+        "id_str": str(dynamic_id),
+        "type": "DYNAMIC_TYPE_AV",
+        "modules": {
+            "module_author": {"mid": uid, "pub_ts": pub_ts},
+            "module_dynamic": {"major": {"type": "MAJOR_TYPE_ARCHIVE", "archive": {"bvid": bvid, "title": bvid}}},
+        },
+    }
+
+
+class TestFollowUp(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state = FollowStateStore(os.path.join(self.tmp.name, "follow_state.db"))
+
+    def tearDown(self):
+        self.state.close()
+        self.tmp.cleanup()
+
+    def poll(self, pages, max_pages=follow_up.FEED_MAX_PAGES, scheduler=None):
+        scheduler = scheduler or PollScheduler(budget_per_minute=600, burst=10)
+        with mock.patch.object(follow_up.dynamic, "get_dynamic_page_info", side_effect=pages) as api:
+            res, reached = asyncio.run(follow_up.poll_dynamic_feed(None, self.state, max_pages, scheduler))
+        return res, reached, api.call_count
+
+    def test_first_poll_only_sets_cursor(self):
+        res, reached, calls = self.poll([{"items": [feed_item(20, 1, "BV20", 200), feed_item(10, 2, "BV10", 100)],
+                                          "has_more": True, "offset": "10"}])
+        self.assertEqual((res, reached, calls), ([], True, 1))
+        self.assertEqual(self.state.get_dynamic_offset(), 20)
+
+    def test_new_videos_until_cursor(self):
+        self.state.set_dynamic_offset(10)
+        pages = [
+            {"items": [feed_item(40, 1, "BV40", 400), feed_item(30, 2, "BV30", 300)], "has_more": True, "offset": "30"},
+            {"items": [feed_item(20, 1, "BV20", 200), feed_item(10, 2, "BV10", 100)], "has_more": True, "offset": "10"},
+        ]
+        res, reached, calls = self.poll(pages)
+        self.assertEqual((reached, calls), (True, 2))
+        self.assertEqual([v["bvid"] for v in res], ["BV20", "BV30", "BV40"])
+        self.assertEqual(self.state.get_dynamic_offset(), 40)
+
+    def test_feed_ends_before_cursor_keeps_cursor(self):
+        self.state.set_dynamic_offset(10)
+        pages = [
+            {"items": [feed_item(60, 1, "BV60", 600), feed_item(50, 2, "BV50", 500)], "has_more": True, "offset": "50"},
+            {"items": [feed_item(40, 1, "BV40", 400), feed_item(30, 2, "BV30", 300)], "has_more": True, "offset": "30"},
+        ]
+        res, reached, calls = self.poll(pages, max_pages=2)
+        self.assertEqual(([v["bvid"] for v in res], reached, calls), (["BV30", "BV40", "BV50", "BV60"], False, 2))
+        # 20之类更早的新视频没读到，游标不能跳过它们
+        self.assertEqual(self.state.get_dynamic_offset(), 10)
+
+    def test_feed_pages_are_budgeted(self):
+        self.state.set_dynamic_offset(10)
+        pages = [
+            {"items": [feed_item(40, 1, "BV40", 400), feed_item(30, 2, "BV30", 300)], "has_more": True, "offset": "30"},
+            {"items": [feed_item(20, 1, "BV20", 200), feed_item(10, 2, "BV10", 100)], "has_more": True, "offset": "10"},
+        ]
+        # 第一页的令牌由调用方取过，没有令牌翻第二页时按没碰到游标处理
+        scheduler = PollScheduler(budget_per_minute=0.001, burst=0)
+        res, reached, calls = self.poll(pages, scheduler=scheduler)
+        self.assertEqual((reached, calls), (False, 1))
+        self.assertEqual(self.state.get_dynamic_offset(), 10)
+
+    def test_feed_failure_keeps_cursor(self):
+        self.state.set_dynamic_offset(10)
+        with self.assertRaises(Exception):
+            self.poll(Exception("-352"))
+        self.assertEqual(self.state.get_dynamic_offset(), 10)
+
+    def poll_uploader(self, videos, page_size=2, scheduler=None):
+        async def get_videos(pn=1, ps=30, **kwargs):
+            return {"list": {"vlist": videos[(pn - 1) * page_size:pn * page_size]}}
+
+        up = mock.Mock(get_videos=mock.Mock(side_effect=get_videos))
+        scheduler = scheduler or PollScheduler(budget_per_minute=600, burst=10)
+        with mock.patch.object(follow_up.user, "User", return_value=up), \
+                mock.patch.object(follow_up, "UPLOADER_VIDEOS_PAGE_SIZE", page_size):
+            res = asyncio.run(follow_up.poll_uploader(1, None, self.state, scheduler=scheduler))
+        return res, up.get_videos.call_count
+
+    def test_poll_uploader_pages_back_to_watermark(self):
+        videos = [{"aid": aid, "bvid": f"BV{aid}", "title": "", "created": aid * 10} for aid in range(9, 0, -1)]
+        self.assertEqual(self.poll_uploader(videos[4:]), ([], 1))
+        self.assertEqual(self.state.get_watermark(1), (50, 5))
+        # 一次发布了4个视频，翻两页才碰到上次看到的视频
+        scheduler = PollScheduler(budget_per_minute=0.001, burst=10, now=time.time())
+        res, calls = self.poll_uploader(videos, scheduler=scheduler)
+        self.assertEqual(([v["aid"] for v in res], calls), ([6, 7, 8, 9], 3))
+        # 第一页由调度器选中时计过，之后翻的两页也计入预算
+        self.assertEqual(scheduler.bucket.available(), 8)
+
+    def test_same_second_uploads_use_aid(self):
+        self.state.update_last_created(1, 100, 5)
+        videos = [{"aid": 6, "bvid": "BV6", "title": "", "created": 100}, {"aid": 5, "bvid": "BV5", "title": "", "created": 100}]
+        res, _ = self.poll_uploader(videos, page_size=30)
+        self.assertEqual([v["bvid"] for v in res], ["BV6"])
+
+    def test_info_failure_is_recorded_before_advancing(self):
+        video = {"uid": 1, "aid": 6, "bvid": "BV6", "title": "", "created": 100}
+        with mock.patch.object(follow_up.global_value, "get_value", return_value={}), \
+                mock.patch.object(follow_up.public_function, "get_video_info", mock.AsyncMock(return_value=False)), \
+                mock.patch.object(follow_up.failure_taxonomy, "record_failure", mock.AsyncMock(return_value=False)) as record:
+            scheduler = PollScheduler(budget_per_minute=0.001, burst=1, now=time.time())
+            self.assertFalse(asyncio.run(follow_up.save_new_video(video, self.state, scheduler)))
+            # 获取视频信息的请求计入预算
+            self.assertEqual(scheduler.bucket.available(), 0)
+        record.assert_awaited_once_with("BV6", 0, follow_up.failure_taxonomy.FailureKind.UNKNOWN)
+        self.assertEqual(self.state.get_watermark(1), (100, 6))
+
+    def check_updates(self, feed_result, scheduler, poll_uploader=None):
+        polled = []
+
+        async def record_poll(uid, credential, **kwargs):
+            polled.append(uid)
+            return await poll_uploader(uid, credential, **kwargs) if poll_uploader else []
+
+        with mock.patch.object(follow_up.files, "get_follow_state_store", return_value=self.state), \
+                mock.patch.object(follow_up.global_value, "get_value", return_value=None), \
+                mock.patch.object(follow_up, "poll_dynamic_feed", mock.AsyncMock(return_value=feed_result)), \
+                mock.patch.object(follow_up, "poll_uploader", side_effect=record_poll), \
+                mock.patch.object(follow_up, "save_new_video", mock.AsyncMock(return_value=True)) as save:
+            asyncio.run(follow_up.check_follow_updates([1, 2, 3], {1, 2}, scheduler))
+        return sorted(polled), [call.args[0]["bvid"] for call in save.await_args_list]
+
+    def test_feed_behind_cursor_polls_feed_uploaders(self):
+        now = time.time()
+        feed = [{"dynamic_id": 50, "uid": 1, "aid": 5, "bvid": "BV5", "title": "", "created": int(now) - 60}]
+        scheduler = PollScheduler(budget_per_minute=600, burst=10)
+        self.state.set_dynamic_offset(10)
+        polled, saved = self.check_updates((feed, True), scheduler)
+        # 碰到游标时动态里的up主不再逐个查询
+        self.assertEqual((polled, saved), ([3], ["BV5"]))
+        scheduler = PollScheduler(budget_per_minute=600, burst=10)
+        polled, saved = self.check_updates((feed, False), scheduler)
+        # 没碰到游标时中间可能漏了视频，动态里的up主也要逐个查询，全部查过之后才推进游标
+        self.assertEqual(polled, [1, 2, 3])
+        self.assertEqual(self.state.get_dynamic_offset(), 50)
+
+    def test_feed_behind_waits_for_uploader_scan(self):
+        now = int(time.time())
+        self.state.set_dynamic_offset(10)
+        self.state.update_last_created(1, now - 300, 5)
+        # BV6在动态没读到的缺口里，只在up主的投稿列表中
+        videos = [{"aid": 7, "bvid": "BV7", "title": "", "created": now - 60},
+                  {"aid": 6, "bvid": "BV6", "title": "", "created": now - 200},
+                  {"aid": 5, "bvid": "BV5", "title": "", "created": now - 300}]
+        feed = ([{"dynamic_id": 70, "uid": 1, "aid": 7, "bvid": "BV7", "title": "", "created": now - 60}], False)
+        up = mock.Mock(get_videos=mock.AsyncMock(return_value={"list": {"vlist": videos}}))
+        real_poll_uploader = follow_up.poll_uploader
+
+        async def poll_uploader(uid, credential, **kwargs):
+            return await real_poll_uploader(uid, credential, self.state, **kwargs)
+
+        # 令牌只够读动态，这一轮没有逐个查询，动态里的视频也要等查询后再处理
+        scheduler = PollScheduler(budget_per_minute=0.001, burst=1)
+        with mock.patch.object(follow_up.user, "User", return_value=up):
+            polled, saved = self.check_updates(feed, scheduler, poll_uploader)
+        self.assertEqual((polled, saved), ([], []))
+        self.assertEqual(self.state.get_watermark(1), (now - 300, 5))
+        self.assertEqual(self.state.get_dynamic_offset(), 10)
+        # 查询失败的up主不算查过
+        up.get_videos.side_effect = Exception("timeout")
+        scheduler = PollScheduler(budget_per_minute=600, burst=10)
+        with mock.patch.object(follow_up.user, "User", return_value=up):
+            polled, saved = self.check_updates(feed, scheduler, poll_uploader)
+        self.assertEqual(saved, [])
+        self.assertIsNone(scheduler.staleness([1])[1])
+        self.assertEqual(self.state.get_dynamic_offset(), 10)
+        # 逐个查询过之后，缺口里的BV6和动态里的BV7一起下载
+        up.get_videos.side_effect = None
+        with mock.patch.object(follow_up.user, "User", return_value=up):
+            polled, saved = self.check_updates(feed, scheduler, poll_uploader)
+        self.assertEqual(sorted(saved), ["BV6", "BV7"])
+
+
+if __name__ == "__main__":
+    unittest.main()
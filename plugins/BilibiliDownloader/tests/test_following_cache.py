@@ -0,0 +1,67 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from plugins.BilibiliDownloader.core import following_cache
+from plugins.BilibiliDownloader.core.following_cache import FollowingCache
+
+
+class FakeUser:
+    def __init__(self, followings):
+        self.followings = followings
+        self.calls = []
+
+    async def get_followings(self, pn=1, ps=100, **kwargs):
+        self.calls.append(pn)
+        return {"total": len(self.followings), "list": [{"mid": m} for m in self.followings[(pn - 1) * ps:pn * ps]]}
+
+
+class TestFollowingCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "followings.json")
+        self.credential = mock.Mock(dedeuserid="1")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def get(self, followings, now, cache=None, force=False):
+        up = FakeUser(followings)
+        cache = cache or FollowingCache(self.path, ttl=100)
+        limiter = mock.Mock(acquire=mock.AsyncMock())
+        with mock.patch.object(following_cache.user, "User", return_value=up), \
+                mock.patch.object(following_cache, "PAGE_SIZE", 2), \
+                mock.patch.object(following_cache, "API_LIMITER", limiter):
+            res = asyncio.run(cache.get(self.credential, now=now, force=force))
+        # 每一页请求前都要先从全局限流器取令牌
+        self.assertEqual(limiter.acquire.await_count, len(up.calls))
+        return res, sorted(up.calls)
+
+    def test_fetch_all_pages_and_diff(self):
+        (followings, added, removed), calls = self.get([5, 4, 3, 2, 1], now=0)
+        self.assertEqual((followings, added, removed, calls), ([5, 4, 3, 2, 1], {1, 2, 3, 4, 5}, set(), [1, 2, 3]))
+        # 有效期内不请求
+        (followings, added, removed), calls = self.get([6, 5, 4, 3, 2, 1], now=50)
+        self.assertEqual((followings, calls), ([5, 4, 3, 2, 1], []))
+        # 过期后新关注了6、取消了3
+        (followings, added, removed), calls = self.get([6, 5, 4, 2, 1], now=150)
+        self.assertEqual((followings, added, removed), ([6, 5, 4, 2, 1], {6}, {3}))
+        self.assertEqual(FollowingCache(self.path).cached(1), [6, 5, 4, 2, 1])
+
+    def test_unchanged_first_page_skips_other_pages(self):
+        self.get([5, 4, 3, 2, 1], now=0)
+        (followings, added, removed), calls = self.get([5, 4, 3, 2, 1], now=150)
+        self.assertEqual((followings, added, removed, calls), ([5, 4, 3, 2, 1], set(), set(), [1]))
+
+    def test_failure_returns_cache(self):
+        self.get([2, 1], now=0)
+        cache = FollowingCache(self.path, ttl=100)
+        with mock.patch.object(following_cache.user, "User", side_effect=Exception("boom")):
+            res = asyncio.run(cache.get(self.credential, now=150))
+        self.assertEqual(res, ([2, 1], set(), set()))
+
+
+if __name__ == "__main__":
+    unittest.main()
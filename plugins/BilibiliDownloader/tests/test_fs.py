@@ -0,0 +1,33 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from plugins.BilibiliDownloader.utils import fs
+
+
+class TestFs(unittest.TestCase):
+    def test_operations_run_off_loop(self):
+        loop_thread = threading.get_ident()
+
+        async def main(tmp):
+            path = os.path.join(tmp, "a", "b")
+            await fs.makedirs(path)
+            await fs.write_text(f"{path}/test.txt", "测试")
+            self.assertEqual(await fs.read_text(f"{path}/test.txt"), "测试")
+            await fs.copy(f"{path}/test.txt", f"{path}/copy.txt")
+            self.assertEqual(sorted(await fs.listdir(path)), ["copy.txt", "test.txt"])
+            self.assertNotEqual(await fs.run(threading.get_ident), loop_thread)
+            # batch中的操作在同一个线程里按顺序执行
+            res = await fs.batch((os.remove, f"{path}/copy.txt"), (os.path.exists, f"{path}/copy.txt"))
+            self.assertEqual(res, [None, False])
+            await fs.rmtree(os.path.join(tmp, "a"))
+            self.assertFalse(await fs.exists(os.path.join(tmp, "a")))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            asyncio.run(main(tmp))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,23 @@
 import asyncio
+import os
+import tempfile
 import unittest
+from unittest import mock
 
-from plugins.BilibiliDownloader.core import nfo_generator
+from plugins.BilibiliDownloader.core import nfo_generator, stream_details
+from plugins.BilibiliDownloader.utils import sort_title
 
 
 class TestNfoGenerator(unittest.TestCase):
+    def setUp(self):
+        # sorttitle缓存写到临时目录，不污染插件的data目录
+        self.tmp = tempfile.TemporaryDirectory()
+        memo = sort_title.SortTitleMemo(os.path.join(self.tmp.name, "sort_title.json"))
+        patcher = mock.patch.object(sort_title, "_memo", memo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
     def build_media_info(self):
         media_info = {
             "title": "【Bilibili】测试视频",
@@ -67,6 +80,17 @@ class TestNfoGenerator(unittest.TestCase):
         asyncio.run(nfo.save_nfo(nn, "./people.nfo"))
 
 
+    def test_save_nfo_skip_unchanged(self):
+        nfo = nfo_generator.NfoGenerator(media_info=self.build_media_info())
+        tree = nfo.build("movie")
+        written, skipped = nfo_generator.NFO_WRITE_STATS.snapshot()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "movie.nfo")
+            self.assertTrue(asyncio.run(nfo.save_nfo(tree, path)))
+            self.assertFalse(asyncio.run(nfo.save_nfo(tree, path)))
+            self.assertEqual(os.listdir(tmp), ["movie.nfo"])
+        self.assertEqual(nfo_generator.NFO_WRITE_STATS.snapshot(), (written + 1, skipped + 1))
+
     def build_uploader_info(self):
         return {'mid': 1060544882, 'name': 'AI罕见', 'sex': '保密', 'face': 'https://i2.hdslb.com/bfs/face/a715d8c1bde8b110765e2077453309782b481c33.jpg', 'face_nft': 0, 'face_nft_type': 0, 'sign': '莲宝可爱捏，支持点歌', 'rank': 10000, 'level': 4, 'jointime': 0, 'moral': 0, 'silence': 0, 'coins': 0, 'fans_badge': False, 'fans_medal': {'show': False, 'wear': False, 'medal': None}, 'official': {'role': 0, 'title': '', 'desc': '', 'type': -1}, 'vip': {'type': 0, 'status': 0, 'due_date': 0, 'vip_pay_type': 0, 'theme_type': 0, 'label': {'path': '', 'text': '', 'label_theme': '', 'text_color': '', 'bg_style': 0, 'bg_color': '', 'border_color': '', 'use_img_label': True, 'img_label_uri_hans': '', 'img_label_uri_hant': '', 'img_label_uri_hans_static': 'https://i0.hdslb.com/bfs/vip/d7b702ef65a976b20ed854cbd04cb9e27341bb79.png', 'img_label_uri_hant_static': 'https://i0.hdslb.com/bfs/activity-plat/static/20220614/e369244d0b14644f5e1a06431e22a4d5/KJunwh19T5.png'}, 'avatar_subscript': 0, 'nickname_color': '', 'role': 0, 'avatar_subscript_url': '', 'tv_vip_status': 0, 'tv_vip_pay_type': 0}, 'pendant': {'pid': 0, 'name': '', 'image': '', 'expire': 0, 'image_enhance': '', 'image_enhance_frame': ''}, 'nameplate': {'nid': 0, 'name': '', 'image': '', 'image_small': '', 'level': '', 'condition': ''}, 'user_honour_info': {'mid': 0, 'colour': None, 'tags': []}, 'is_followed': False, 'top_photo': 'http://i0.hdslb.com/bfs/space/cb1c3ef50e22b6096fde67febe863494caefebad.png', 'theme': {}, 'sys_notice': {}, 'live_room': None, 'birthday': '01-01', 'school': {'name': ''}, 'profession': {'name': '', 'department': '', 'title': '', 'is_show': 0}, 'tags': None, 'series': {'user_upgrade_status': 3, 'show_upgrade_window': False}, 'is_senior_member': 0, 'mcn_info': None, 'gaia_res_type': 0, 'gaia_data': None, 'is_risk': False, 'elec': {'show_info': {'show': False, 'state': -1, 'title': '', 'icon': '', 'jump_url': ''}}, 'contract': None}
 
@@ -77,8 +101,36 @@ class TestNfoGenerator(unittest.TestCase):
         nn = asyncio.run(nfo.gen_tvshow_nfo_by_uploader())
         asyncio.run(nfo.save_nfo(nn, "./tvshow.nfo"))
 
-
-
+    def build_playurl(self):
+        video_stream = {"id": 80, "codecs": "avc1.640032", "width": 1920, "height": 1080,
+                        "frameRate": "30000/1001", "bandwidth": 2000000}
+        audio_stream = {"id": 30280, "codecs": "mp4a.40.2", "bandwidth": 192000}
+        playurl = {"timelength": 125600, "dash": {"duration": 126, "video": [video_stream], "audio": [audio_stream]}}
+        return playurl, video_stream, audio_stream
+
+    def test_stream_details_from_dash(self):
+        streams = stream_details.from_dash(*self.build_playurl())
+        self.assertEqual(streams["duration"], 126)
+        self.assertEqual(streams["video"]["codec"], "h264")
+        self.assertEqual(streams["video"]["framerate"], "29.970")
+        self.assertEqual(streams["audio"], {"codec": "aac", "channels": 2, "bitrate": 192000})
+        self.assertEqual(stream_details.codec_name("hev1.1.6.L150.90", stream_details.VIDEO_CODECS), "hevc")
+        self.assertEqual(stream_details.codec_name("av01.0.08M.08", stream_details.VIDEO_CODECS), "av1")
+        self.assertIsNone(stream_details.codec_name("dvh1.08.06", stream_details.VIDEO_CODECS))
+
+    def test_movie_and_episode_nfo_with_stream_details(self):
+        streams = stream_details.from_dash(*self.build_playurl())
+        nfo = nfo_generator.NfoGenerator(media_info=self.build_media_info(), streams=streams)
+        for kind in ("movie", "episodedetails"):
+            root = nfo.build(kind).getroot()
+            self.assertEqual(root[-1].tag, "fileinfo")
+            self.assertEqual(root.findtext("fileinfo/streamdetails/video/codec"), "h264")
+            self.assertEqual(root.findtext("fileinfo/streamdetails/video/aspect"), "1.78")
+            self.assertEqual(root.findtext("fileinfo/streamdetails/video/durationinseconds"), "126")
+            self.assertEqual(root.findtext("fileinfo/streamdetails/audio/channels"), "2")
+        # 没有流信息时不生成fileinfo，与之前的nfo保持一致
+        root = nfo_generator.NfoGenerator(media_info=self.build_media_info()).build("movie").getroot()
+        self.assertIsNone(root.find("fileinfo"))
 
 
 if __name__ == "__main__":
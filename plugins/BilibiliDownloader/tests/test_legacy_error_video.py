@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from plugins.BilibiliDownloader.core.legacy_error_video import LegacyErrorVideoSet
+
+
+class TestLegacyErrorVideoSet(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "error_video.txt")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_reads_every_line(self):
+        # 旧实现只检查第一行，第二行之后的记录永远查不到
+        with open(self.path, "w") as f:
+            f.write("BV1x7411L7Zv P0\nBV1J54y1d7ZL P3\n")
+        error_videos = LegacyErrorVideoSet(self.path)
+        self.assertTrue(error_videos.contains("BV1J54y1d7ZL", 3))
+        self.assertFalse(error_videos.contains("BV1J54y1d7ZL", 1))
+        self.assertEqual(error_videos.entries(), [("BV1x7411L7Zv", 0), ("BV1J54y1d7ZL", 3)])
+
+    def test_write_through_and_remove(self):
+        error_videos = LegacyErrorVideoSet(self.path)
+        self.assertTrue(error_videos.add("BV1x7411L7Zv", 1))
+        self.assertFalse(error_videos.add("BV1x7411L7Zv", 1))
+        error_videos.add("BV1x7411L7Zv", 2)
+        error_videos.add("BV1J54y1d7ZL")
+        self.assertEqual(error_videos.remove("BV1x7411L7Zv", 2), 1)
+        self.assertEqual(LegacyErrorVideoSet(self.path).entries(), [("BV1x7411L7Zv", 1), ("BV1J54y1d7ZL", 0)])
+        self.assertEqual(error_videos.remove("BV1x7411L7Zv"), 1)
+        with open(self.path) as f:
+            self.assertEqual(f.read(), "BV1J54y1d7ZL P0\n")
+
+    def test_concurrent_adds(self):
+        error_videos = LegacyErrorVideoSet(self.path)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda page: error_videos.add("BV1x7411L7Zv", page % 20), range(100)))
+        self.assertEqual(len(LegacyErrorVideoSet(self.path).entries()), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import unittest
+
+from plugins.BilibiliDownloader.core import library_index
+
+
+def write_file(path, content=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+class TestLibraryIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.media_path = os.path.join(self.tmp.name, "media")
+        self.index = library_index.LibraryIndex(os.path.join(self.tmp.name, "library_index.db"))
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def test_build_from_nfo(self):
+        movie = os.path.join(self.media_path, "测试视频")
+        write_file(f"{movie}/测试视频.nfo", "<video><title>测试视频</title><id>BV1J54y1d7ZL</id></video>")
+        write_file(f"{movie}/测试视频.mp4", "1234")
+        show = os.path.join(self.media_path, "bilibili", "分P视频 (2023)")
+        write_file(f"{show}/tvshow.nfo", "<tvshow><id>BV1ZD4y1h78p</id></tvshow>")
+        for episode in (1, 2):
+            write_file(
+                f"{show}/Season 1/分P视频 S01E0{episode}.nfo",
+                f"<episodedetails><id>BV1ZD4y1h78p</id><episode>{episode}</episode></episodedetails>",
+            )
+            write_file(f"{show}/Season 1/分P视频 S01E0{episode}.mp4")
+        write_file(f"{self.media_path}/tmp/下载中/下载中.nfo", "<video><id>BV1uG4y1C7Q1</id></video>")
+        self.assertEqual(self.index.build(self.media_path), 2)
+        self.assertTrue(self.index.has("BV1J54y1d7ZL"))
+        self.assertEqual(self.index.get("BV1J54y1d7ZL")["size"], 4)
+        self.assertTrue(self.index.has("BV1ZD4y1h78p", 1))
+        self.assertEqual(self.index.get("BV1ZD4y1h78p", 1)["kind"], "episode")
+        self.assertFalse(self.index.has("BV1uG4y1C7Q1"))
+        # 重新加载索引文件
+        self.assertTrue(library_index.LibraryIndex(self.index.index_path).has("BV1J54y1d7ZL"))
+
+    def test_build_episode_pages(self):
+        # 分P视频只发布了第3P时也要还原成分P序号2
+        show = os.path.join(self.media_path, "bilibili", "分P视频 (2023)")
+        write_file(f"{show}/tvshow.nfo", "<tvshow><id>BV1ZD4y1h78p</id></tvshow>")
+        write_file(f"{show}/Season 1/分P视频 S01E03.nfo",
+                   "<episodedetails><id>BV1ZD4y1h78p</id><episode>3</episode></episodedetails>")
+        # UP主文件夹模式的集数是UP主剧集中的集数，不是分P
+        uploader = os.path.join(self.media_path, "测试UP主-1")
+        write_file(f"{uploader}/tvshow.nfo", "<tvshow><id>1</id></tvshow>")
+        write_file(f"{uploader}/Season 1/测试视频/测试视频.nfo",
+                   "<episodedetails><id>BV1J54y1d7ZL</id><episode>37</episode></episodedetails>")
+        self.index.build(self.media_path)
+        self.assertIsNotNone(self.index.get("BV1ZD4y1h78p", 2))
+        self.assertIsNone(self.index.get("BV1ZD4y1h78p", 0))
+        self.assertIsNotNone(self.index.get("BV1J54y1d7ZL", 0))
+
+    def test_skip_or_upgrade(self):
+        path = os.path.join(self.media_path, "测试视频")
+        write_file(f"{path}/测试视频.mp4", "1234")
+        self.assertTrue(self.index.needs_download("BV1J54y1d7ZL"))
+        self.index.record("BV1J54y1d7ZL", 0, path, media=f"{path}/测试视频.mp4", quality=80)
+        self.assertFalse(self.index.needs_download("BV1J54y1d7ZL"))
+        self.assertFalse(self.index.needs_download("BV1J54y1d7ZL", best_quality=80))
+        self.assertTrue(self.index.needs_download("BV1J54y1d7ZL", best_quality=116))
+        os.remove(f"{path}/测试视频.mp4")
+        self.assertTrue(self.index.needs_download("BV1J54y1d7ZL"))
+        self.assertIsNone(self.index.get("BV1J54y1d7ZL"))
+
+    def test_import_legacy_json(self):
+        legacy = os.path.join(self.tmp.name, "library_index.json")
+        path = os.path.join(self.media_path, "测试视频")
+        with open(legacy, "w", encoding="utf-8") as f:
+            json.dump({"BV1J54y1d7ZL": {"0": {"path": path, "quality": 80}}}, f)
+        index = library_index.LibraryIndex(os.path.join(self.tmp.name, "imported.db"), legacy)
+        self.assertTrue(index.is_built())
+        self.assertEqual(index.get("BV1J54y1d7ZL")["quality"], 80)
+        self.assertTrue(os.path.exists(f"{legacy}.migrated"))
+        # 移动目录后记录跟着更新
+        self.assertEqual(index.relocate(path, f"{path}2"), 1)
+        self.assertEqual(index.get("BV1J54y1d7ZL")["path"], f"{path}2")
+        self.assertEqual([bvid for bvid, _, _ in index.iter_records()], ["BV1J54y1d7ZL"])
+        index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
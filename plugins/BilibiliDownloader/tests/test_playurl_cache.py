@@ -0,0 +1,63 @@
+import asyncio
+import time
+import unittest
+
+from plugins.BilibiliDownloader.core import playurl_cache
+
+
+def build_url(deadline):
+    return f"https://upos-sz-mirrorcos.bilivideo.com/upgcxcode/1.m4s?e=abc&deadline={deadline}&gen=playurlv2"
+
+
+class FakeVideo:
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.calls = 0
+
+    def get_bvid(self):
+        return "BV1J54y1d7ZL"
+
+    async def get_download_url(self, page_index=0):
+        self.calls += 1
+        return {
+            "dash": {
+                "video": [{"id": 80, "codecid": 7, "baseUrl": build_url(self.deadline) + f"&n={self.calls}"}],
+                "audio": [{"id": 30280, "codecid": 0, "baseUrl": build_url(self.deadline)}],
+            }
+        }
+
+
+class TestPlayurlCache(unittest.TestCase):
+    def test_parse_deadline(self):
+        self.assertEqual(playurl_cache.parse_deadline(build_url(1673790232)), 1673790232)
+        self.assertIsNone(playurl_cache.parse_deadline("https://i0.hdslb.com/bfs/archive/1.jpg"))
+
+    def test_is_url_expired(self):
+        self.assertTrue(playurl_cache.is_url_expired(build_url(int(time.time()) - 10)))
+        self.assertTrue(playurl_cache.is_url_expired(build_url(int(time.time()) + 60)))
+        self.assertFalse(playurl_cache.is_url_expired(build_url(int(time.time()) + 3600)))
+
+    def test_cache_until_deadline(self):
+        cache = playurl_cache.PlayurlCache()
+        v = FakeVideo(int(time.time()) + 3600)
+        asyncio.run(cache.get_download_url(v, 0))
+        asyncio.run(cache.get_download_url(v, 0))
+        self.assertEqual(v.calls, 1)
+        asyncio.run(cache.get_download_url(v, 0, force_refresh=True))
+        self.assertEqual(v.calls, 2)
+
+    def test_not_cache_expired(self):
+        cache = playurl_cache.PlayurlCache()
+        v = FakeVideo(int(time.time()) + 30)
+        asyncio.run(cache.get_download_url(v, 0))
+        asyncio.run(cache.get_download_url(v, 0))
+        self.assertEqual(v.calls, 2)
+
+    def test_select_same_stream(self):
+        playurl = {"dash": {"video": [{"id": 120, "codecid": 7}, {"id": 80, "codecid": 12}, {"id": 80, "codecid": 7}]}}
+        self.assertEqual(playurl_cache.select_stream(playurl, "video"), {"id": 120, "codecid": 7})
+        self.assertIs(playurl_cache.select_stream(playurl, "video", {"id": 80, "codecid": 7}), playurl["dash"]["video"][2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from plugins.BilibiliDownloader.core.poll_scheduler import PollScheduler
+from plugins.BilibiliDownloader.utils.rate_limiter import RateLimiter
+
+
+class TestPollScheduler(unittest.TestCase):
+    def test_token_bucket_refills_at_rate(self):
+        bucket = RateLimiter(rate=1, capacity=3, now=0)
+        self.assertEqual(bucket.take(5, now=0), 3)
+        self.assertEqual(bucket.take(5, now=1.5), 1)
+        self.assertEqual(bucket.take(5, now=100), 3)
+
+    def test_charge_goes_into_debt(self):
+        scheduler = PollScheduler(budget_per_minute=60, burst=2, now=0)
+        scheduler.charge(3, now=0)
+        # 欠的1个令牌先还上，1秒后才又能查询
+        self.assertEqual(scheduler.select([1, 2], now=1), [])
+        self.assertEqual(scheduler.select([1, 2], now=2), [1])
+
+    def test_select_is_fair_and_budgeted(self):
+        scheduler = PollScheduler(budget_per_minute=60, burst=2, now=0)
+        uids = [1, 2, 3, 4, 5]
+        rounds = []
+        for now in range(0, 10, 2):
+            picked = scheduler.select(uids, now=now)
+            scheduler.mark_checked(picked, now=now)
+            rounds.append(picked)
+        # 每轮最多2个，最久没查过的优先，同样久的按列表顺序
+        self.assertEqual(rounds, [[1, 2], [3, 4], [5, 1], [2, 3], [4, 1]])
+        self.assertEqual(scheduler.staleness([1, 5, 6], now=10), {1: 2, 5: 6, 6: None})
+
+    def test_risk_control_backs_off_globally(self):
+        scheduler = PollScheduler(budget_per_minute=60, burst=5, backoff_base=100, backoff_max=300, now=0)
+        self.assertEqual(scheduler.report_risk_control(now=0), 100)
+        self.assertEqual(scheduler.select([1, 2], now=50), [])
+        self.assertFalse(scheduler.acquire(now=50))
+        self.assertEqual(scheduler.paused_for(now=50), 50)
+        # 暂停结束后令牌从零开始补充
+        self.assertEqual(scheduler.select([1, 2], now=101), [1])
+        self.assertEqual(scheduler.report_risk_control(now=101), 200)
+        self.assertEqual(scheduler.report_risk_control(now=101), 300)
+        scheduler.report_success()
+        self.assertEqual(scheduler.report_risk_control(now=500), 100)
+
+    def test_select_respects_intervals(self):
+        scheduler = PollScheduler(budget_per_minute=600, burst=10, now=0)
+        scheduler.mark_checked([1, 2, 3], now=0)
+        intervals = {1: 100, 2: 1000, 3: 50}
+        self.assertEqual(scheduler.select([1, 2, 3, 4], now=60, intervals=intervals), [4, 3])
+        # 3超出间隔的比例（150/50）比1（150/100）大，优先查询；2还没到间隔
+        self.assertEqual(scheduler.select([1, 2, 3], now=150, intervals=intervals), [3, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
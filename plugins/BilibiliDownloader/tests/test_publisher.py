@@ -0,0 +1,40 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from plugins.BilibiliDownloader.core import publisher
+
+
+class TestPublisher(unittest.TestCase):
+    def test_publish_files(self):
+        with tempfile.TemporaryDirectory() as src, tempfile.TemporaryDirectory() as dst:
+            for name in ["test S01E01.mp4", "test S01E01.nfo", "test S01E01-thumb.jpg"]:
+                with open(os.path.join(src, name), "w") as f:
+                    f.write(name)
+            published = asyncio.run(
+                publisher.publish_files(
+                    src,
+                    os.path.join(dst, "Season 1"),
+                    ["test S01E01.mp4", "test S01E01.nfo", "test S01E01-thumb.jpg", "test S01E01.danmakus.ass"],
+                )
+            )
+            # 视频文件最后发布，不存在的文件跳过
+            self.assertEqual(published[-1], "test S01E01.mp4")
+            self.assertEqual(len(published), 3)
+            self.assertEqual(sorted(os.listdir(os.path.join(dst, "Season 1"))), sorted(published))
+            self.assertEqual(os.listdir(src), [])
+
+    def test_skip_unchanged_nfo(self):
+        with tempfile.TemporaryDirectory() as src, tempfile.TemporaryDirectory() as dst:
+            for folder in (src, dst):
+                with open(os.path.join(folder, "test.nfo"), "w") as f:
+                    f.write("<video></video>")
+            os.utime(os.path.join(dst, "test.nfo"), (0, 0))
+            asyncio.run(publisher.publish_files(src, dst, ["test.nfo"]))
+            self.assertEqual(os.path.getmtime(os.path.join(dst, "test.nfo")), 0)
+            self.assertEqual(os.listdir(src), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
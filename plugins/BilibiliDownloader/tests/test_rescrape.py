@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from lxml import etree
+
+from plugins.BilibiliDownloader.core import library_index, metadata_archive, rescrape
+from plugins.BilibiliDownloader.utils import sort_title
+
+VIDEO_INFO = {
+    "title": "测试视频",
+    "desc": "",
+    "bvid": "BV1J54y1d7ZL",
+    "pubdate": 1672531200,
+    "duration": 600,
+    "tname": "测试",
+    "owner": {"mid": 1, "name": "测试UP主"},
+    "pages": [{"cid": 1, "part": "P1"}],
+}
+PAGES_INFO = dict(VIDEO_INFO, bvid="BV1ZD4y1h78p", title="分P视频",
+                  pages=[{"cid": 1, "part": "第一集"}, {"cid": 2, "part": "第二集"}])
+
+
+class TestRescrape(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive_dir = f"{self.tmp.name}/metadata"
+        self.index = library_index.LibraryIndex(f"{self.tmp.name}/library_index.db")
+        self.media_path = f"{self.tmp.name}/media"
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def test_archive_round_trip(self):
+        metadata_archive.save_video_info("BV1J54y1d7ZL", VIDEO_INFO, self.archive_dir)
+        self.assertEqual(metadata_archive.load_video_info("BV1J54y1d7ZL", self.archive_dir), VIDEO_INFO)
+        self.assertIsNone(metadata_archive.load_video_info("BV1uG4y1C7Q1", self.archive_dir))
+
+    def test_rescrape_library(self):
+        movie = f"{self.media_path}/测试视频"
+        os.makedirs(movie)
+        self.index.record("BV1J54y1d7ZL", 0, movie, nfo=f"{movie}/测试视频.nfo")
+        season = f"{self.media_path}/bilibili/分P视频 (2023)/Season 1"
+        os.makedirs(season)
+        for page in range(2):
+            self.index.record("BV1ZD4y1h78p", page, season, nfo=f"{season}/分P视频 S01E0{page + 1}.nfo",
+                              kind="episode", season=1, episode=page + 1)
+        self.index.record("BV1uG4y1C7Q1", 0, movie, nfo=f"{movie}/没有归档.nfo")
+        metadata_archive.save_video_info("BV1J54y1d7ZL", VIDEO_INFO, self.archive_dir)
+        metadata_archive.save_video_info("BV1ZD4y1h78p", PAGES_INFO, self.archive_dir)
+
+        result = rescrape.rescrape_library(self.index, self.archive_dir, workers=2)
+        self.assertEqual((result.written, result.skipped, result.missing, result.failed), (4, 0, 1, 0))
+        episode = etree.parse(f"{season}/分P视频 S01E02.nfo")
+        self.assertEqual(episode.findtext("title"), "第二集")
+        self.assertEqual(episode.findtext("episode"), "2")
+        self.assertTrue(os.path.exists(f"{self.media_path}/bilibili/分P视频 (2023)/tvshow.nfo"))
+        # 再次执行时内容没有变化，全部跳过
+        result = rescrape.rescrape_library(self.index, self.archive_dir, workers=2)
+        self.assertEqual((result.written, result.skipped), (0, 4))
+
+    def test_rescrape_people(self):
+        movie = f"{self.media_path}/测试视频"
+        os.makedirs(movie)
+        self.index.record("BV1J54y1d7ZL", 0, movie, nfo=f"{movie}/测试视频.nfo")
+        metadata_archive.save_video_info("BV1J54y1d7ZL", VIDEO_INFO, self.archive_dir)
+        people_path = f"{self.tmp.name}/people"
+        os.makedirs(f"{people_path}/测/测试UP主")
+        memo = sort_title.SortTitleMemo(f"{self.tmp.name}/sort_title.json")
+
+        with mock.patch.object(sort_title, "_memo", memo):
+            result = rescrape.rescrape_library(self.index, self.archive_dir, workers=2, people_path=people_path)
+        self.assertEqual((result.written, result.missing), (2, 0))
+        person = etree.parse(f"{people_path}/测/测试UP主/person.nfo")
+        self.assertEqual(person.findtext("title"), "测试UP主")
+        self.assertEqual(person.findtext("bilibili_id"), "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
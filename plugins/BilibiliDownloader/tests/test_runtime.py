@@ -0,0 +1,43 @@
+import asyncio
+import threading
+import unittest
+
+from plugins.BilibiliDownloader.utils import runtime
+
+
+class TestRuntime(unittest.TestCase):
+    def tearDown(self):
+        runtime.stop()
+
+    def test_runs_on_one_long_lived_loop(self):
+        async def current():
+            return asyncio.get_running_loop(), threading.current_thread().name
+
+        first = runtime.run(current())
+        second = runtime.run(current())
+        self.assertIs(first[0], second[0])
+        self.assertEqual(first[1], "bilibili_loop")
+
+    def test_exceptions_propagate(self):
+        async def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            runtime.run(fail())
+
+    def test_blocking_inside_loop_is_rejected(self):
+        async def nested():
+            return runtime.run(asyncio.sleep(0))
+
+        with self.assertRaises(RuntimeError):
+            runtime.run(nested())
+
+    def test_restart_after_stop(self):
+        loop = runtime.get_loop()
+        runtime.stop()
+        self.assertIsNot(runtime.get_loop(), loop)
+        self.assertEqual(runtime.run(asyncio.sleep(0, result=1)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from lxml import etree
+
+from plugins.BilibiliDownloader.core import season_layout, episode_index, library_index
+from plugins.BilibiliDownloader.utils.others import SeasonLayout
+
+
+def timestamp(date):
+    return int(time.mktime(time.strptime(date, "%Y-%m-%d")))
+
+
+class TestSeasonLayout(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.show_path = f"{self.tmp.name}/UP主-12345"
+        self.index = episode_index.EpisodeIndex(12345, index_dir=self.tmp.name)
+        self.library = library_index.LibraryIndex(f"{self.tmp.name}/library_index.db")
+        for episode, (bvid, date) in enumerate((("BV1J54y1d7ZL", "2022-05-01"), ("BV1ZD4y1h78p", "2023-03-01")), 1):
+            path = f"{self.show_path}/Season 1/视频{episode}"
+            os.makedirs(path)
+            with open(f"{path}/视频{episode}.nfo", "w", encoding="utf-8") as f:
+                f.write(
+                    f"<episodedetails><id>{bvid}</id><premiered>{date}</premiered>"
+                    f"<season>1</season><episode>{episode}</episode></episodedetails>"
+                )
+            self.library.record(bvid, 0, path, nfo=f"{path}/视频{episode}.nfo", kind="episode")
+
+    def tearDown(self):
+        self.library.close()
+        self.tmp.cleanup()
+
+    def test_season_number(self):
+        self.assertEqual(season_layout.season_number(SeasonLayout.SINGLE, timestamp("2023-03-01"), 250), 1)
+        self.assertEqual(season_layout.season_number(SeasonLayout.YEAR, timestamp("2023-03-01"), 250), 2023)
+        self.assertEqual(season_layout.season_number(SeasonLayout.CHUNK, 0, 100, 100), 1)
+        self.assertEqual(season_layout.season_number(SeasonLayout.CHUNK, 0, 101, 100), 2)
+
+    def test_migrate_by_year(self):
+        with mock.patch.object(episode_index, "get_episode_index", return_value=self.index), \
+                mock.patch.object(library_index, "get_library_index", return_value=self.library):
+            moved = season_layout.migrate_uploader_folder(self.show_path, 12345, SeasonLayout.YEAR)
+        self.assertEqual(moved, 2)
+        self.assertFalse(os.path.exists(f"{self.show_path}/Season 1"))
+        nfo = f"{self.show_path}/Season 2023/视频2/视频2.nfo"
+        self.assertEqual(etree.parse(nfo).findtext("season"), "2023")
+        self.assertEqual(etree.parse(nfo).findtext("episode"), "2")
+        self.assertEqual(self.library.get("BV1ZD4y1h78p")["nfo"], nfo)
+        self.assertEqual(self.library.get("BV1J54y1d7ZL")["path"], f"{self.show_path}/Season 2022/视频1")
+
+    def test_skipped_move_keeps_season(self):
+        os.makedirs(f"{self.show_path}/Season 2023/视频2")
+        with mock.patch.object(episode_index, "get_episode_index", return_value=self.index), \
+                mock.patch.object(library_index, "get_library_index", return_value=self.library):
+            moved = season_layout.migrate_uploader_folder(self.show_path, 12345, SeasonLayout.YEAR)
+        self.assertEqual(moved, 1)
+        # 目标文件夹已存在没有移动，nfo的季数仍然和所在的季文件夹一致
+        self.assertEqual(etree.parse(f"{self.show_path}/Season 1/视频2/视频2.nfo").findtext("season"), "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from plugins.BilibiliDownloader.utils import sort_title
+
+
+class TestSortTitle(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.memo_path = os.path.join(self.tmp.name, "sort_title.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_memo(self):
+        memo = sort_title.SortTitleMemo(self.memo_path)
+        self.assertEqual(memo.get("测试UP主"), "csUPz")
+        with mock.patch.object(sort_title, "_to_first_letters") as to_first_letters:
+            self.assertEqual(memo.get("测试UP主"), "csUPz")
+            # 重新加载缓存文件后也不再调用pypinyin
+            self.assertEqual(sort_title.SortTitleMemo(self.memo_path).get("测试UP主"), "csUPz")
+        to_first_letters.assert_not_called()
+
+    def test_debounced_writes(self):
+        memo = sort_title.SortTitleMemo(self.memo_path)
+        memo.get("测试UP主")
+        # 间隔内新增的名字先不写入缓存文件
+        memo.get("测试")
+        self.assertNotIn("测试", sort_title.SortTitleMemo(self.memo_path)._ensure_loaded())
+        memo.flush()
+        self.assertEqual(sort_title.SortTitleMemo(self.memo_path).get("测试"), "cs")
+
+
+if __name__ == "__main__":
+    unittest.main()
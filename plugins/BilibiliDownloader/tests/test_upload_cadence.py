@@ -0,0 +1,41 @@
+import time
+import unittest
+
+from plugins.BilibiliDownloader.core import upload_cadence
+
+DAY = 24 * 3600
+
+
+class TestUploadCadence(unittest.TestCase):
+    def test_typical_gap(self):
+        self.assertIsNone(upload_cadence.typical_gap([]))
+        self.assertIsNone(upload_cadence.typical_gap([100, 100]))
+        self.assertEqual(upload_cadence.typical_gap([0, DAY, 2 * DAY, 10 * DAY]), DAY)
+
+    def test_daily_uploader_is_polled_often(self):
+        history = [i * DAY for i in range(10)]
+        now = history[-1] + DAY + 3600
+        # 已经到了预计更新的时间，按间隔的1/6查询
+        interval = upload_cadence.poll_interval(history, now, min_interval=0)
+        self.assertIn(interval, (DAY / 6, DAY / 12))
+
+    def test_interval_halves_toward_expected_upload(self):
+        history = [i * 7 * DAY for i in range(5)]
+        interval = upload_cadence.poll_interval(history, history[-1] + DAY, max_interval=30 * DAY)
+        self.assertIn(interval, (3 * DAY, 1.5 * DAY))
+
+    def test_quiet_uploader_and_bounds(self):
+        history = [i * DAY for i in range(5)]
+        self.assertEqual(upload_cadence.poll_interval(history, history[-1] + 365 * DAY), upload_cadence.MAX_INTERVAL)
+        self.assertEqual(upload_cadence.poll_interval([0, 60, 120], 130), upload_cadence.MIN_INTERVAL)
+        self.assertEqual(upload_cadence.poll_interval([], time.time()), upload_cadence.DEFAULT_INTERVAL)
+
+    def test_active_hour(self):
+        base = time.mktime((2024, 1, 1, 20, 0, 0, 0, 0, -1))
+        history = [base + i * DAY for i in range(5)]
+        self.assertTrue(upload_cadence.is_active_hour(history, base + 10 * DAY + 1800))
+        self.assertFalse(upload_cadence.is_active_hour(history, base + 10 * DAY + 8 * 3600))
+
+
+if __name__ == "__main__":
+    unittest.main()
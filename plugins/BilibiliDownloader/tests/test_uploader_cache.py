@@ -0,0 +1,30 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from plugins.BilibiliDownloader.core import uploader_cache
+
+UPLOADER_INFO = {"mid": 12345, "name": "UP主", "sign": "签名", "face": "https://i0.hdslb.com/face.jpg", "level": 6}
+
+
+class TestUploaderCache(unittest.TestCase):
+    def test_series_hash(self):
+        changed = dict(UPLOADER_INFO, level=5, fans=100)
+        self.assertEqual(uploader_cache.series_hash(UPLOADER_INFO), uploader_cache.series_hash(changed))
+        changed = dict(UPLOADER_INFO, sign="新签名")
+        self.assertNotEqual(uploader_cache.series_hash(UPLOADER_INFO), uploader_cache.series_hash(changed))
+
+    def test_ttl(self):
+        cache = uploader_cache.UploaderInfoCache(ttl=60)
+        fetch = mock.AsyncMock(side_effect=[False, UPLOADER_INFO])
+        with mock.patch.object(uploader_cache.public_function, "get_uploader_info", fetch):
+            self.assertFalse(asyncio.run(cache.get_uploader_info(12345)))  # 失败结果不缓存
+            self.assertEqual(asyncio.run(cache.get_uploader_info(12345)), UPLOADER_INFO)
+            self.assertEqual(asyncio.run(cache.get_uploader_info(12345)), UPLOADER_INFO)
+        self.assertEqual(fetch.await_count, 2)
+        with mock.patch.object(uploader_cache.time, "monotonic", return_value=10 ** 9):
+            self.assertIsNone(cache.get(12345))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,7 @@ import traceback
 from functools import wraps
 from typing import Any, Callable
 
-from plugins.BilibiliDownloader.utils import LOGGER, files
+from plugins.BilibiliDownloader.utils import LOGGER, files, runtime
 
 
 def handle_error(
@@ -53,11 +53,11 @@ def handle_error(
                     LOGGER.error(f"函数 {func.__name__} 报错")
                     LOGGER.error(f"报错日志：\n{tracelog}")
                     if record_error_video:
-                        asyncio.run(files.ErrorVideoController().write_error_video(
+                        runtime.run(files.ErrorVideoController().write_error_video(
                             record_video_bvid, record_video_page
                         ))
                     elif remove_error_video_folder:
-                        asyncio.run(files.delete_video_folder(remove_error_video_path))
+                        runtime.run(files.delete_video_folder(remove_error_video_path))
 
             return sync_func_handle
 
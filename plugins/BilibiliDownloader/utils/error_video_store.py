@@ -0,0 +1,212 @@
+"""下载失败视频的记录，保存在SQLite中
+
+每次写入只更新一行，重试次数的累加在一条SQL里完成，多个下载任务同时失败也不会互相覆盖。
+每条记录带有下次可以重试的时间，按指数退避推迟，一直失败的视频不会挡住后面的视频。
+不会再成功的视频（稿件删除、没有权限等）会被隔离，保留记录但不再重试。
+旧版本的error_video.json会在第一次打开时导入，导入后改名为error_video.json.migrated。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from plugins.BilibiliDownloader.utils import LOGGER
+
+_LOGGER = LOGGER
+SCHEMA_VERSION = 3
+RETRY_BASE_DELAY = 5 * 60  # 第一次失败后等待的秒数，之后每失败一次翻倍
+RETRY_MAX_DELAY = 12 * 3600  # 最长等待时间
+
+
+class ErrorVideoStore:
+    def __init__(self, db_path: str, legacy_json_path: str = None):
+        """下载失败视频记录
+
+        :param db_path: 数据库文件路径
+        :param legacy_json_path: 旧版本的error_video.json路径，存在时导入
+        """
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """第一次使用时打开数据库，建表并导入旧记录"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._migrate(conn)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn: sqlite3.Connection):
+        """写事务，出错时回滚"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            with self._transaction(conn):
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS error_video ("
+                    "bvid TEXT NOT NULL, page INTEGER NOT NULL, retry INTEGER NOT NULL DEFAULT 0, "
+                    "PRIMARY KEY (bvid, page))"
+                )
+                imported = self._import_legacy_json(conn)
+                conn.execute("PRAGMA user_version=1")
+            if imported:
+                # 提交成功后才改名，导入失败时下次启动还能重新导入
+                os.replace(self.legacy_json_path, f"{self.legacy_json_path}.migrated")
+        if version < 2:
+            with self._transaction(conn):
+                # 旧记录的下次重试时间为0，升级后马上可以重试
+                conn.execute("ALTER TABLE error_video ADD COLUMN next_attempt REAL NOT NULL DEFAULT 0")
+                conn.execute("CREATE INDEX IF NOT EXISTS error_video_next_attempt ON error_video (next_attempt)")
+                conn.execute("PRAGMA user_version=2")
+        if version < 3:
+            with self._transaction(conn):
+                conn.execute("ALTER TABLE error_video ADD COLUMN kind TEXT")
+                conn.execute("ALTER TABLE error_video ADD COLUMN quarantined INTEGER NOT NULL DEFAULT 0")
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _import_legacy_json(self, conn: sqlite3.Connection) -> bool:
+        """导入旧版本error_video.json中的记录：{bvid: {分P: 重试次数}}，返回是否导入了"""
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return False
+        try:
+            with open(self.legacy_json_path, "r", encoding="utf-8") as f:
+                data = json.loads(f.read() or "{}")
+        except (ValueError, OSError):
+            _LOGGER.exception(f"旧的错误视频记录无法解析，跳过导入：{self.legacy_json_path}")
+            return False
+        rows = [(bvid, int(page), int(retry)) for bvid, pages in data.items() for page, retry in pages.items()]
+        conn.executemany("INSERT OR REPLACE INTO error_video (bvid, page, retry) VALUES (?, ?, ?)", rows)
+        _LOGGER.info(f"已从error_video.json导入 {len(rows)} 条错误视频记录")
+        return True
+
+    def read(self, bvid: str, page: int = 0) -> int | None:
+        """查询重试次数，没有记录返回None"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT retry FROM error_video WHERE bvid = ? AND page = ?", (bvid, page)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def record_failure(self, bvid: str, page: int = 0, now: float = None, base_delay: float = RETRY_BASE_DELAY,
+                       max_delay: float = RETRY_MAX_DELAY, kind: str = None) -> int:
+        """记录一次失败：第一次失败重试次数为0，之后每次加1，下次重试时间为 base_delay * 2^重试次数，最长max_delay
+
+        :param bvid: 视频bvid
+        :param page: 分P序号，从0开始
+        :param now: 当前时间戳，默认为time.time()
+        :param base_delay: 第一次失败后等待的秒数
+        :param max_delay: 最长等待秒数
+        :param kind: 失败分类
+        :return: 记录后的重试次数
+        """
+        now = time.time() if now is None else now
+        params = {"bvid": bvid, "page": page, "now": now, "base": base_delay, "max": max_delay, "kind": kind}
+        with self._lock, self._transaction(self._connect()) as conn:
+            # DO UPDATE中的retry是更新前的值
+            conn.execute(
+                "INSERT INTO error_video (bvid, page, retry, next_attempt, kind) "
+                "VALUES (:bvid, :page, 0, :now + :base, :kind) "
+                "ON CONFLICT (bvid, page) DO UPDATE SET retry = retry + 1, kind = :kind, "
+                "next_attempt = :now + min(:base * (1 << min(retry + 1, 30)), :max)",
+                params,
+            )
+            return conn.execute(
+                "SELECT retry FROM error_video WHERE bvid = ? AND page = ?", (bvid, page)
+            ).fetchone()[0]
+
+    def quarantine(self, bvid: str, page: int = 0, kind: str = None) -> bool:
+        """隔离一条记录，之后不再重试
+
+        :param bvid: 视频bvid
+        :param page: 分P序号，从0开始
+        :param kind: 失败分类
+        :return: 是否是这一次刚被隔离的，已经隔离过的返回False，调用方据此只通知一次
+        """
+        with self._lock, self._transaction(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT quarantined FROM error_video WHERE bvid = ? AND page = ?", (bvid, page)
+            ).fetchone()
+            conn.execute(
+                "INSERT INTO error_video (bvid, page, retry, kind, quarantined) VALUES (?, ?, 0, ?, 1) "
+                "ON CONFLICT (bvid, page) DO UPDATE SET kind = coalesce(excluded.kind, kind), quarantined = 1",
+                (bvid, page, kind),
+            )
+        return row is None or row[0] == 0
+
+    def is_quarantined(self, bvid: str, page: int = 0) -> bool:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT quarantined FROM error_video WHERE bvid = ? AND page = ?", (bvid, page)
+            ).fetchone()
+        return row is not None and row[0] == 1
+
+    def list_quarantined(self) -> list[dict]:
+        """列出所有被隔离的记录"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT bvid, page, retry, kind FROM error_video WHERE quarantined = 1 ORDER BY rowid"
+            ).fetchall()
+        return [{"bvid": bvid, "page": page, "retry": retry, "kind": kind} for bvid, page, retry, kind in rows]
+
+    def remove(self, bvid: str, page: int = 0) -> bool:
+        """删除一条记录，返回记录是否存在"""
+        with self._lock:
+            cursor = self._connect().execute("DELETE FROM error_video WHERE bvid = ? AND page = ?", (bvid, page))
+        return cursor.rowcount > 0
+
+    def list_all(self) -> list[dict]:
+        """按第一次失败的先后顺序列出所有记录"""
+        with self._lock:
+            rows = self._connect().execute("SELECT bvid, page, retry FROM error_video ORDER BY rowid").fetchall()
+        return [{"bvid": bvid, "page": page, "retry": retry} for bvid, page, retry in rows]
+
+    def list_due(self, now: float = None, limit: int = -1) -> list[dict]:
+        """按到期先后列出已经可以重试的记录，不包括被隔离的
+
+        :param now: 当前时间戳，默认为time.time()
+        :param limit: 最多返回的条数，-1为不限制
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT bvid, page, retry, next_attempt, kind FROM error_video "
+                "WHERE next_attempt <= ? AND quarantined = 0 ORDER BY next_attempt, rowid LIMIT ?",
+                (now, limit),
+            ).fetchall()
+        return [
+            {"bvid": bvid, "page": page, "retry": retry, "next_attempt": next_attempt, "kind": kind}
+            for bvid, page, retry, next_attempt, kind in rows
+        ]
+
+    def due_stats(self, now: float = None) -> tuple[int, float | None]:
+        """已到期的记录数，以及最早到期的记录已经等了多少秒（没有到期记录时为None）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            count, oldest = self._connect().execute(
+                "SELECT count(*), min(next_attempt) FROM error_video WHERE next_attempt <= ? AND quarantined = 0",
+                (now,),
+            ).fetchone()
+        return count, None if oldest is None else now - oldest
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
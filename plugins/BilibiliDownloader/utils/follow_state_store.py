@@ -0,0 +1,206 @@
+"""追更进度，保存在SQLite中
+
+每个up主一行（最新投稿的时间和aid），只在看到更新的投稿时才写入，而且只写这一个up主，上万个up主也不用每次重写整个文件。
+旧版本的listen_up.json会在第一次打开时导入，导入后改名为listen_up.json.migrated。
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from plugins.BilibiliDownloader.utils import LOGGER
+
+_LOGGER = LOGGER
+SCHEMA_VERSION = 2
+HISTORY_SIZE = 30  # 每个up主默认保留的投稿时间数
+_QUERY_CHUNK = 500  # 一条查询最多带多少个uid参数
+
+
+class FollowStateStore:
+    def __init__(self, db_path: str, legacy_json_path: str = None):
+        """追更进度
+
+        :param db_path: 数据库文件路径
+        :param legacy_json_path: 旧版本的listen_up.json路径，存在时导入
+        """
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """第一次使用时打开数据库，建表并导入旧记录"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._migrate(conn)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn: sqlite3.Connection):
+        """写事务，出错时回滚"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            with self._transaction(conn):
+                conn.execute("CREATE TABLE IF NOT EXISTS follow_meta (key TEXT PRIMARY KEY, value INTEGER) WITHOUT ROWID")
+                conn.execute("CREATE TABLE IF NOT EXISTS uploader (uid INTEGER PRIMARY KEY, last_created INTEGER NOT NULL)")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS upload (uid INTEGER NOT NULL, created INTEGER NOT NULL, "
+                    "PRIMARY KEY (uid, created)) WITHOUT ROWID"
+                )
+                imported = self._import_legacy_json(conn)
+                conn.execute("PRAGMA user_version=1")
+            if imported:
+                # 提交成功后才改名，导入失败时下次启动还能重新导入
+                os.replace(self.legacy_json_path, f"{self.legacy_json_path}.migrated")
+        if version < 2:
+            with self._transaction(conn):
+                # 同一秒发布的视频靠aid区分，旧记录没有aid
+                conn.execute("ALTER TABLE uploader ADD COLUMN last_aid INTEGER")
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def _import_legacy_json(self, conn: sqlite3.Connection) -> bool:
+        """导入旧版本listen_up.json，兼容 {uid: 时间} 和 {"dynamic_offset", "uploaders", "history"} 两种格式"""
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return False
+        try:
+            with open(self.legacy_json_path, "r", encoding="utf-8") as f:
+                data = json.loads(f.read() or "{}")
+        except (ValueError, OSError):
+            _LOGGER.exception(f"旧的追更进度无法解析，跳过导入：{self.legacy_json_path}")
+            return False
+        uploaders = data.get("uploaders") if "uploaders" in data else {
+            uid: created for uid, created in data.items() if str(uid).isdigit()
+        }
+        conn.executemany(
+            "INSERT OR REPLACE INTO uploader (uid, last_created) VALUES (?, ?)",
+            [(int(uid), int(created)) for uid, created in uploaders.items()],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO upload (uid, created) VALUES (?, ?)",
+            [(int(uid), int(ts)) for uid, history in data.get("history", {}).items() for ts in history],
+        )
+        if data.get("dynamic_offset") is not None:
+            conn.execute("INSERT OR REPLACE INTO follow_meta (key, value) VALUES ('dynamic_offset', ?)",
+                         (int(data["dynamic_offset"]),))
+        _LOGGER.info(f"已从listen_up.json导入 {len(uploaders)} 个up主的追更进度")
+        return True
+
+    def get_dynamic_offset(self) -> int | None:
+        """上次看到的最新动态id，没有记录返回None"""
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM follow_meta WHERE key = 'dynamic_offset'").fetchone()
+        return None if row is None else row[0]
+
+    def set_dynamic_offset(self, dynamic_id: int) -> bool:
+        """记录最新动态id，没有变化时不写入
+
+        :return: 是否有变化
+        """
+        with self._lock:
+            conn = self._connect()
+            with self._transaction(conn):
+                cur = conn.execute(
+                    "INSERT INTO follow_meta (key, value) VALUES ('dynamic_offset', ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value WHERE value IS NOT excluded.value",
+                    (dynamic_id,),
+                )
+        return cur.rowcount > 0
+
+    def get_last_created(self, uid: int) -> int | None:
+        """up主上次看到的最新投稿时间，没有记录返回None"""
+        watermark = self.get_watermark(uid)
+        return None if watermark is None else watermark[0]
+
+    def get_watermark(self, uid: int) -> tuple[int, int | None] | None:
+        """up主上次看到的最新投稿
+
+        :return: (投稿时间, aid)，旧记录没有aid时为None；没有记录返回None
+        """
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT last_created, last_aid FROM uploader WHERE uid = ?", (int(uid),)
+            ).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def update_last_created(self, uid: int, created: int, aid: int = None) -> bool:
+        """记录up主看到的最新投稿，按 (投稿时间, aid) 比较，只会往后推
+
+        :return: 是否有变化
+        """
+        with self._lock:
+            conn = self._connect()
+            with self._transaction(conn):
+                cur = conn.execute(
+                    "INSERT INTO uploader (uid, last_created, last_aid) VALUES (?, ?, ?) "
+                    "ON CONFLICT (uid) DO UPDATE SET last_created = excluded.last_created, last_aid = excluded.last_aid "
+                    "WHERE excluded.last_created > last_created OR (excluded.last_created = last_created "
+                    "AND COALESCE(excluded.last_aid, 0) > COALESCE(last_aid, 0))",
+                    (int(uid), int(created), aid),
+                )
+        return cur.rowcount > 0
+
+    def get_upload_history(self, uid: int) -> list[int]:
+        """up主最近的投稿时间，从旧到新"""
+        return self.get_upload_histories([uid]).get(int(uid), [])
+
+    def get_upload_histories(self, uids: list[int]) -> dict[int, list[int]]:
+        """一次查询多个up主的投稿时间
+
+        :return: {uid: [投稿时间，从旧到新]}，没有记录的up主不在结果中
+        """
+        uids = [int(uid) for uid in uids]
+        histories = {}
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(uids), _QUERY_CHUNK):
+                chunk = uids[i:i + _QUERY_CHUNK]
+                rows = conn.execute(
+                    f"SELECT uid, created FROM upload WHERE uid IN ({','.join('?' * len(chunk))}) ORDER BY uid, created",
+                    chunk,
+                )
+                for uid, created in rows:
+                    histories.setdefault(uid, []).append(created)
+        return histories
+
+    def record_uploads(self, uid: int, timestamps: list[int], keep: int = HISTORY_SIZE) -> bool:
+        """记录up主的投稿时间，只保留最近的keep个，没有新记录时不写入
+
+        :return: 是否有新记录
+        """
+        uid = int(uid)
+        with self._lock:
+            conn = self._connect()
+            with self._transaction(conn):
+                before = conn.total_changes
+                conn.executemany(
+                    "INSERT OR IGNORE INTO upload (uid, created) VALUES (?, ?)", [(uid, int(ts)) for ts in timestamps]
+                )
+                added = conn.total_changes > before
+                if added:
+                    conn.execute(
+                        "DELETE FROM upload WHERE uid = ? AND created < ("
+                        "SELECT created FROM upload WHERE uid = ? ORDER BY created DESC LIMIT 1 OFFSET ?)",
+                        (uid, uid, keep - 1),
+                    )
+        return added
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,104 @@
+"""非阻塞的文件系统操作
+
+所有阻塞的文件操作都放到同一个有上限的线程池里执行，不会卡住事件循环，也不会因为同时处理很多视频而开出大量线程。
+连续的几个小操作可以用batch合并成一次提交，减少线程切换。
+线程池不绑定事件循环，插件里各个定时任务、快捷指令可以共用。
+"""
+import asyncio
+import functools
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+FS_WORKERS = 4  # 文件操作线程数
+
+_executor = ThreadPoolExecutor(max_workers=FS_WORKERS, thread_name_prefix="bilibili_fs")
+
+
+async def run(func, *args, **kwargs):
+    """在文件操作线程池里执行一个阻塞函数
+
+    :param func: 阻塞函数
+    :return: 函数返回值
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _run_batch(calls: tuple) -> list:
+    return [call[0](*call[1:]) for call in calls]
+
+
+async def batch(*calls: tuple) -> list:
+    """把多个阻塞操作合并成一次提交，按顺序在同一个线程里执行
+
+    :param calls: (函数, 参数1, 参数2, ...) 元组
+    :return: 各个函数的返回值
+    """
+    return await run(_run_batch, calls)
+
+
+async def exists(path: str) -> bool:
+    return await run(os.path.exists, path)
+
+
+async def makedirs(path: str, exist_ok: bool = True) -> None:
+    await run(os.makedirs, path, exist_ok=exist_ok)
+
+
+async def listdir(path: str) -> list[str]:
+    return await run(os.listdir, path)
+
+
+async def getsize(path: str) -> int:
+    return await run(os.path.getsize, path)
+
+
+async def remove(path: str) -> None:
+    await run(os.remove, path)
+
+
+async def rename(src: str, dst: str) -> None:
+    await run(os.rename, src, dst)
+
+
+async def removedirs(path: str) -> None:
+    await run(os.removedirs, path)
+
+
+async def copy(src: str, dst: str) -> str:
+    return await run(shutil.copy, src, dst)
+
+
+async def move(src: str, dst: str) -> str:
+    return await run(shutil.move, src, dst)
+
+
+async def rmtree(path: str, ignore_errors: bool = False) -> None:
+    await run(shutil.rmtree, path, ignore_errors=ignore_errors)
+
+
+def _read_text(path: str, encoding: str) -> str:
+    with open(path, "r", encoding=encoding) as f:
+        return f.read()
+
+
+async def read_text(path: str, encoding: str = "utf-8") -> str:
+    return await run(_read_text, path, encoding)
+
+
+def write_bytes_atomic(path: str, data: bytes) -> None:
+    """先写临时文件再替换，写到一半崩溃也不会留下损坏的文件"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+async def write_bytes(path: str, data: bytes) -> None:
+    await run(write_bytes_atomic, path, data)
+
+
+async def write_text(path: str, text: str, encoding: str = "utf-8") -> None:
+    await run(write_bytes_atomic, path, text.encode(encoding))
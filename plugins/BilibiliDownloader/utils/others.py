@@ -13,6 +13,15 @@ class MediaSaveMode(enum.Enum):
     NORMAL_STYLE = 1  # 按照电影格式保存
 
 
+class SeasonLayout(enum.Enum):
+    """
+    UP主文件夹模式下的季划分方式
+    """
+    SINGLE = "single"  # 所有视频放在Season 1
+    YEAR = "year"  # 按发布年份分季，如Season 2023
+    CHUNK = "chunk"  # 按集数每N集分一季
+
+
 # def get_media_path(mode: MediaSaveMode) -> str or bool:
 #     """
 #     现在采用纯用户输入的方式
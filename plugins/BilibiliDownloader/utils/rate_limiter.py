@@ -0,0 +1,106 @@
+"""b站api限流"""
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """令牌桶限流器
+
+    内部只用线程锁和时间戳，不绑定事件循环，插件里各个定时任务、快捷指令可以共用同一个实例
+    """
+
+    def __init__(self, rate: float, capacity: int, clock=time.monotonic, now: float = None):
+        """
+        :param rate: 每秒补充的令牌数
+        :param capacity: 桶容量，即允许的瞬时并发请求数
+        :param clock: 时钟函数，需要和传入的now使用同一个时钟
+        :param now: 当前时间，默认为clock()
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated_at = clock() if now is None else now
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float = None) -> None:
+        now = self._clock() if now is None else now
+        # drain之后_updated_at可能在未来，到那时才开始补充
+        if now > self._updated_at:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+    def try_acquire(self, tokens: int = 1) -> float:
+        """尝试取令牌
+
+        :param tokens: 需要的令牌数
+        :return: 0表示取到了，否则为还需要等待的秒数
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def take(self, tokens: int, now: float = None) -> int:
+        """不等待，最多取出tokens个令牌
+
+        :param tokens: 最多取出的令牌数
+        :param now: 当前时间
+        :return: 实际取出的令牌数
+        """
+        with self._lock:
+            self._refill(now)
+            taken = max(0, min(tokens, int(self._tokens)))
+            self._tokens -= taken
+            return taken
+
+    def charge(self, tokens: int, now: float = None) -> None:
+        """记下已经发出、不能不发的请求，令牌不够时欠着，之后补充的令牌先还账
+
+        :param tokens: 请求数
+        :param now: 当前时间
+        """
+        with self._lock:
+            self._refill(now)
+            self._tokens -= tokens
+
+    def drain(self, now: float = None, until: float = None) -> None:
+        """清空令牌
+
+        :param now: 当前时间
+        :param until: 到这个时间之后才开始重新补充
+        """
+        with self._lock:
+            self._refill(now)
+            self._tokens = 0
+            self._updated_at = max(self._updated_at, until or self._updated_at)
+
+    def available(self) -> int:
+        """当前可用的令牌数"""
+        with self._lock:
+            self._refill()
+            return int(self._tokens)
+
+    async def acquire(self, tokens: int = 1) -> None:
+        """等待直到取到令牌
+
+        :param tokens: 需要的令牌数
+        """
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+API_LIMITER = RateLimiter(rate=2, capacity=5)  # 全局共用的b站api限流器，每秒2次，最多攒5次
@@ -0,0 +1,72 @@
+"""插件共用的后台事件循环
+
+MovieRobot的定时任务、快捷指令、事件回调都是同步函数，在各自的线程里执行。
+它们不再各自新建事件循环，而是把协程提交到这个一直运行的事件循环上，并等待结果。
+bilibili_api按事件循环缓存的请求会话、限流器和各种缓存因此能在整个插件生命周期内复用，
+同时运行的定时任务和快捷指令也在同一个事件循环里并发。
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from plugins.BilibiliDownloader.utils import LOGGER
+
+_LOGGER = LOGGER
+_loop = None
+_thread = None
+_lock = threading.Lock()
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_forever()
+    finally:
+        loop.close()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """后台事件循环，第一次使用时启动"""
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_run_loop, args=(_loop,), name="bilibili_loop", daemon=True)
+            _thread.start()
+            _LOGGER.info("插件后台事件循环已启动")
+        return _loop
+
+
+def submit(coro) -> Future:
+    """把协程提交到后台事件循环，不等待结果
+
+    :param coro: 协程
+    :return: concurrent.futures.Future
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout: float = None):
+    """在后台事件循环中执行协程，阻塞当前线程直到返回结果，供同步的入口函数使用
+
+    :param coro: 协程
+    :param timeout: 最长等待秒数，为空时一直等待
+    :return: 协程的返回值
+    """
+    if threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError("不能在后台事件循环线程中同步等待协程，请直接await")
+    return submit(coro).result(timeout)
+
+
+def stop(timeout: float = 10) -> None:
+    """停止后台事件循环，下次使用时会重新启动"""
+    global _loop, _thread
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop = _thread = None
+    if loop is None:
+        return
+    loop.call_soon_threadsafe(loop.stop)
+    if thread is not threading.current_thread():
+        thread.join(timeout)
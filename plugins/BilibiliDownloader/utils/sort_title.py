@@ -0,0 +1,91 @@
+"""生成人物nfo的sorttitle（名字拼音首字母），结果持久化缓存
+
+pypinyin的词典很大，只在第一次遇到没见过的名字时才导入，插件启动和已经见过的名字都不再加载词典。
+缓存文件最多每分钟重写一次，之间新增的名字在下次写入或插件退出时一起保存；异步代码中通过fs.run调用。
+"""
+import atexit
+import json
+import os
+import threading
+import time
+
+from plugins.BilibiliDownloader.utils import LOGGER, files
+
+_LOGGER = LOGGER
+MEMO_PATH = f"{files.local_path}/sort_title.json"
+FLUSH_INTERVAL = 60  # 缓存文件两次写入的最小间隔（秒）
+
+
+class SortTitleMemo:
+    def __init__(self, memo_path: str = MEMO_PATH, flush_interval: float = FLUSH_INTERVAL):
+        """名字 -> sorttitle 的持久化缓存
+
+        :param memo_path: 缓存文件路径
+        :param flush_interval: 缓存文件两次写入的最小间隔（秒）
+        """
+        self.memo_path = memo_path
+        self.flush_interval = flush_interval
+        self._memo = None
+        self._dirty = False
+        self._flushed_at = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self) -> dict:
+        if self._memo is None:
+            self._memo = {}
+            if os.path.exists(self.memo_path):
+                try:
+                    with open(self.memo_path, "r", encoding="utf-8") as f:
+                        self._memo = json.load(f)
+                except (ValueError, OSError):
+                    _LOGGER.warning("sorttitle缓存文件损坏，重新生成")
+        return self._memo
+
+    def get(self, name: str) -> str:
+        """获取名字的sorttitle，没见过的名字才调用pypinyin并写入缓存
+
+        :param name: 人物名字
+        :return: 拼音首字母
+        """
+        with self._lock:
+            memo = self._ensure_loaded()
+            if name in memo:
+                return memo[name]
+        sort_title = _to_first_letters(name)
+        with self._lock:
+            memo[name] = sort_title
+            self._dirty = True
+            if self._flushed_at is None or time.monotonic() - self._flushed_at >= self.flush_interval:
+                self._flush()
+        return sort_title
+
+    def _flush(self) -> None:
+        files.write_json_atomic(self.memo_path, self._memo)
+        self._dirty = False
+        self._flushed_at = time.monotonic()
+
+    def flush(self) -> None:
+        """把还没保存的名字写入缓存文件"""
+        with self._lock:
+            if self._dirty:
+                self._flush()
+
+
+def _to_first_letters(name: str) -> str:
+    import pypinyin  # 延迟导入，避免插件启动时加载词典
+
+    return "".join(pypinyin.lazy_pinyin(name, style=pypinyin.Style.FIRST_LETTER))
+
+
+_memo = SortTitleMemo()
+
+
+def get_sort_title(name: str) -> str:
+    """使用插件全局共用的缓存获取名字的sorttitle，没见过的名字会调用pypinyin，异步代码中请通过fs.run调用"""
+    return _memo.get(name)
+
+
+@atexit.register
+def flush() -> None:
+    """插件退出时保存还没写入的名字"""
+    _memo.flush()